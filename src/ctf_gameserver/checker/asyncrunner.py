@@ -0,0 +1,739 @@
+import asyncio
+from collections import deque
+import fcntl
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import time
+
+from . import metrics
+from .supervisor import ACTION_TASK, CTRLIN_FD, CTRLOUT_FD, ZYGOTE_FD, encode_response, get_kill_args, \
+    get_script_args, make_script_logger, preprocess_script_message
+
+
+def is_available():
+    """
+    Returns whether the asyncio Runner engine can be used on this system, it requires process file
+    descriptors (Linux 5.3 or newer).
+    """
+
+    if not hasattr(os, 'pidfd_open') or not hasattr(os, 'posix_spawnp'):
+        return False
+
+    # The functions exist with any Linux kernel, so actually try one
+    try:
+        pidfd = os.pidfd_open(os.getpid())
+    except OSError:
+        return False
+    os.close(pidfd)
+
+    return True
+
+
+class AsyncRunnerSupervisor:
+    """
+    Drop-in replacement for RunnerSupervisor, which does not use an intermediate Runner process per Checker
+    Script. Instead, the Scripts get launched directly from the Master and all their pipes are multiplexed by
+    an asyncio event loop. The loop only runs while the Master waits for requests in get_request().
+
+    With `worker_tasks` > 0, Scripts are kept running as workers which handle multiple tasks (i.e. checks)
+    one after another, see _ScriptProcess. With `zygote`, a Script gets started once per tick and forks a
+    child process per task, see _ZygoteProcess.
+    """
+
+    def __init__(self, metrics_queue, worker_tasks=0, zygote=False):
+        self.metrics_queue = metrics_queue
+        self.worker_tasks = worker_tasks
+        self.use_zygote = zygote
+
+        # Timeout if there are no requests when all Scripts are done or blocking
+        self.queue_timeout = 1
+        # Currently active tasks by custom identifier (getting reset periodically)
+        self.processes = {}
+        # Script processes from before any resets, which are waiting to be reaped
+        self.remaining_processes = set()
+        # Worker processes waiting for a new task
+        self.idle_workers = deque()
+        # Zygote for the current tick
+        self.zygote = None
+        # Pending kill(1) replacements for Scripts run as a different user
+        self.kill_processes = []
+
+        self.loop = asyncio.new_event_loop()
+        # (_Task, action, param, time) tuples waiting to be handled by the Master
+        self._requests = deque()
+        self._waiter = None
+        self.next_identifier = 0
+
+    def start_runner(self, args, sudo_user, info, logging_params):
+        logging.info('Starting Checker Script, args: %s, info: %s', args, info)
+        task = _Task(self.next_identifier, args, info, logging_params)
+        self.processes[self.next_identifier] = task
+        self.next_identifier += 1
+
+        if self.use_zygote:
+            if self.zygote is None:
+                self.zygote = _ZygoteProcess(self, args[:1], sudo_user)
+                # The zygote gets a logging setup of its own, based on the first task's info
+                self.zygote.start(_Task(None, args[:1], dict(info), logging_params))
+            self.zygote.submit(task)
+        elif self.worker_tasks > 0:
+            try:
+                self.idle_workers.popleft().assign(task)
+            except IndexError:
+                # The task arguments get sent to the worker over the control pipe
+                _ScriptProcess(self, args[:1], sudo_user, True).start(task)
+        else:
+            _ScriptProcess(self, args, sudo_user, False).start(task)
+
+        metrics.inc(self.metrics_queue, 'started_tasks')
+
+    def terminate_runner(self, runner_id):
+        task = self.processes[runner_id]
+        logging.info('Terminating Checker Script, info: %s', task.info)
+        task.process.kill()
+        # Afterwards, the event loop will reap the child and remove the task from `self.processes`
+
+    def terminate_runners(self):
+        terminated_infos = []
+
+        if len(self.processes) > 0:
+            logging.warning('Terminating all %d Checker Scripts', len(self.processes))
+            for runner_id, task in self.processes.items():
+                self.terminate_runner(runner_id)
+                terminated_infos.append(task.info)
+
+        self.remaining_processes.update(task.process for task in self.processes.values())
+        self.processes = {}
+        # Requests from the terminated Scripts will not be answered anymore
+        self._requests.clear()
+
+        # Use a fresh zygote for every tick
+        if self.zygote is not None:
+            self.zygote.retire()
+            self.remaining_processes.add(self.zygote)
+            self.zygote = None
+
+        return terminated_infos
+
+    def get_request(self, block=True, timeout=None):
+        self.kill_processes = [proc for proc in self.kill_processes if proc.poll() is None]
+
+        if timeout is None:
+            timeout = self.queue_timeout
+        self.loop.run_until_complete(self._wait_for_request(block, timeout))
+        if not self._requests:
+            return None
+
+        task, action, param, request_time = self._requests.popleft()
+        return {
+            'action': action,
+            'param': param,
+            'runner_id': task.runner_id,
+            'send': task,
+            'info': task.info,
+            'time': request_time
+        }
+
+    async def _wait_for_request(self, block, timeout):
+        if self._requests or not block:
+            # Still give the loop a chance to handle I/O
+            await asyncio.sleep(0)
+            return
+
+        self._waiter = self.loop.create_future()
+        try:
+            await asyncio.wait_for(self._waiter, timeout)
+        except TimeoutError:
+            pass
+        finally:
+            self._waiter = None
+
+    def _wake_up(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def put_request(self, task, action, param):
+        self._requests.append((task, action, param, time.monotonic()))
+        self._wake_up()
+
+    def task_finished(self, task):
+        if self.processes.get(task.runner_id) is task:
+            duration = time.monotonic() - task.start_time
+            metrics.observe(self.metrics_queue, 'script_duration_seconds', duration)
+            del self.processes[task.runner_id]
+
+        # Like RunnerSupervisor, return from get_request() when a Script is done
+        self._wake_up()
+
+    def process_exited(self, process):
+        self.remaining_processes.discard(process)
+        if process in self.idle_workers:
+            self.idle_workers.remove(process)
+        if process is self.zygote:
+            self.zygote = None
+
+
+class _Task:
+    """
+    A single check launched through AsyncRunnerSupervisor, with the logging setup for its Checker Script
+    messages.
+    """
+
+    def __init__(self, runner_id, args, info, logging_params):
+        self.runner_id = runner_id
+        self.args = args
+        self.info = info
+        self.start_time = time.monotonic()
+        # _ScriptProcess running this task
+        self.process = None
+
+        # Not using logging.getLogger(), which would keep a Logger for every single check in the
+        # long-running Master
+        self.runner_logger = logging.Logger('Checker Runner: {}'.format(args))
+        self.runner_logger.parent = logging.getLogger()
+        self.script_logger = make_script_logger(logging.Logger('Checker Script'), info, logging_params,
+                                                self.runner_logger)
+
+    def send(self, response):
+        """
+        Sends the Master's response to the Script's current request.
+        """
+
+        if self.process.task is self:
+            self.process.send(response)
+
+    def close(self):
+        for handler in self.script_logger.handlers:
+            handler.close()
+
+
+class _ScriptProcess:
+    """
+    A single Checker Script process launched by AsyncRunnerSupervisor. Fulfills the same tasks as the Runner
+    process from the RunnerSupervisor, but is driven by callbacks from the event loop.
+
+    Workers get launched without task arguments. They request their tasks using TASK messages, which also
+    mark the end of the previous task. Workers get recycled after `worker_tasks` tasks by responding with
+    None, and killed on any misbehavior like with single-task Scripts.
+    """
+
+    def __init__(self, supervisor, args, sudo_user, worker):
+        self.supervisor = supervisor
+        self.args = args
+        self.sudo_user = sudo_user
+        self.worker = worker
+
+        # Current _Task and the previous one, whose loggers are used while there is no current task
+        self.task = None
+        self.last_task = None
+        # Whether the current task has already been sent to the worker
+        self.task_sent = not worker
+        self.tasks_done = 0
+
+        self.pid = None
+        self._pidfd = None
+        self._output_fds = []
+        self._ctrlin_fd = None
+        self._ctrlout_fd = None
+        self._ctrl_buffer = b''
+        self._write_buffer = b''
+        # Whether a request from the Script is waiting for a response
+        self._waiting = False
+
+    @property
+    def runner_logger(self):
+        return (self.task or self.last_task).runner_logger
+
+    @property
+    def script_logger(self):
+        return (self.task or self.last_task).script_logger
+
+    def start(self, task):
+        """
+        Launches the Script for its first task. Returns whether that was successful.
+        """
+
+        task.process = self
+        self.task = task
+
+        child_fds = self._open_pipes()
+        try:
+            self._launch(child_fds)
+        except OSError:
+            self.runner_logger.exception('Executing Checker Script failed:')
+            self.script_logger.exception('[RUNNER] Executing Checker Script failed:')
+            self._close_ctrlin()
+            self._close_output()
+            self.last_task = task
+            self.task = None
+            task.close()
+            self.supervisor.loop.call_soon(self.supervisor.task_finished, task)
+            self.supervisor.process_exited(self)
+            return False
+        finally:
+            # Close the child's ends of the pipes on the parent's side
+            for fd in child_fds:
+                os.close(fd)
+
+        loop = self.supervisor.loop
+        for fd in self._output_fds:
+            loop.add_reader(fd, self._read_output, fd)
+        loop.add_reader(self._ctrlout_fd, self._read_ctrl)
+        if self._pidfd is not None:
+            loop.add_reader(self._pidfd, self._reap)
+
+        return True
+
+    def _open_pipes(self):
+        """
+        Creates the pipes for communication with the Script. Returns the child's ends of them, to become its
+        stdout, stderr and control file descriptors.
+        """
+
+        stdout_read, stdout_write = _pipe()
+        stderr_read, stderr_write = _pipe()
+        ctrlin_read, ctrlin_write = _pipe()
+        ctrlout_read, ctrlout_write = _pipe()
+
+        self._output_fds = [stdout_read, stderr_read]
+        self._ctrlin_fd = ctrlin_write
+        self._ctrlout_fd = ctrlout_read
+        for fd in (stdout_read, stderr_read, ctrlin_write, ctrlout_read):
+            os.set_blocking(fd, False)
+
+        return (stdout_write, stderr_write, ctrlin_read, ctrlout_write)
+
+    def _launch(self, child_fds, extra_env=None, extra_fds=None):
+        """
+        Executes the Script with the given file descriptors. `extra_fds` maps further file descriptor
+        numbers within the child to the ones from the parent.
+        """
+
+        fd_map = dict(zip((1, 2, CTRLIN_FD, CTRLOUT_FD), child_fds))
+        if extra_fds is not None:
+            fd_map.update(extra_fds)
+        file_actions = [(os.POSIX_SPAWN_DUP2, parent_fd, child_fd) for child_fd, parent_fd in fd_map.items()]
+        if hasattr(os, 'POSIX_SPAWN_CLOSEFROM'):
+            file_actions.append((os.POSIX_SPAWN_CLOSEFROM, max(fd_map) + 1))
+
+        args = get_script_args(self.args, self.sudo_user, max(fd_map))
+        env = {**os.environ, 'CTF_CHECKERSCRIPT': '1'}
+        if self.worker:
+            env['CTF_CHECKERSCRIPT_WORKER'] = '1'
+        if extra_env is not None:
+            env.update(extra_env)
+        self.script_logger.info('[RUNNER] Executing Checker Script')
+        # posix_spawn() instead of subprocess.Popen() with a preexec_fn, which is not safe in the
+        # (potentially multi-threaded) Master
+        self.pid = os.posix_spawnp(args[0], args, env, file_actions=file_actions, setsid=True)
+        self._pidfd = os.pidfd_open(self.pid)
+
+    def assign(self, task):
+        """
+        Assigns a new task to an idle worker.
+        """
+
+        task.process = self
+        self.task = task
+        self.task_sent = False
+        self.script_logger.info('[RUNNER] Reusing Checker Script worker after %d tasks', self.tasks_done)
+        self._send_task()
+
+    def kill(self):
+        """
+        Kills the Script and all its children, they will be reaped by the event loop.
+        """
+
+        if self._pidfd is None:
+            # Not started or already reaped, so the PID might have been reused
+            return
+
+        self.script_logger.warning('[RUNNER] Terminating Checker Script')
+        if self.sudo_user is None:
+            try:
+                os.killpg(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            # Do not block the Master by waiting for sudo
+            self.supervisor.kill_processes.append(subprocess.Popen(get_kill_args(self.pid, self.sudo_user)))
+
+    def send(self, response):
+        """
+        Sends a response to the Script's current request.
+        """
+
+        if self._ctrlin_fd is None:
+            # Script has already exited
+            return
+
+        self._waiting = False
+        self._write(encode_response(response))
+        # Handle requests which arrived in the meantime
+        if self._ctrl_buffer:
+            self.supervisor.loop.call_soon(self._handle_ctrl_buffer)
+
+    def _send_task(self):
+        self.task_sent = True
+        # Arguments like for a single-task Script, without the Script path
+        self.send(self.task.args[1:])
+
+    def _handle_request(self, action, param, message):
+        if action == ACTION_TASK:
+            self._request_task()
+        elif self.task is None or not self.task_sent:
+            self.runner_logger.error('Message from Script without a current task: %s', message)
+            self.kill()
+        else:
+            self.supervisor.put_request(self.task, action, param)
+
+    def _request_task(self):
+        if not self.worker:
+            self.runner_logger.error('TASK message from Script not running as worker')
+            self.kill()
+            return
+
+        if self.task is not None and self.task_sent:
+            self.tasks_done += 1
+            self._finish_task()
+
+        if self.task is not None:
+            # First task of a new worker
+            self._send_task()
+        elif self.tasks_done >= self.supervisor.worker_tasks:
+            # Tell the worker to exit
+            self.send(None)
+        else:
+            self.supervisor.idle_workers.append(self)
+
+    def _finish_task(self):
+        if self.last_task is not None:
+            self.last_task.close()
+        self.last_task = self.task
+        self.task = None
+        self.supervisor.task_finished(self.last_task)
+
+    def _read_output(self, fd):
+        data = self._read(fd)
+        if not data:
+            return
+
+        # Save everything the Checker Scripts writes to stdout or stderr as log message
+        script_output = data.decode('ascii', errors='backslashreplace').rstrip('\n')
+        self.script_logger.warning('[SCRIPT OUTPUT] %s', script_output)
+
+    def _read_ctrl(self):
+        data = self._read(self._ctrlout_fd)
+        if not data:
+            return
+
+        self._ctrl_buffer += data
+        self._handle_ctrl_buffer()
+
+    def _handle_ctrl_buffer(self):
+        # Communication with the Checker Script via single-line JSON objects, one request at a time
+        while not self._waiting:
+            line, sep, rest = self._ctrl_buffer.partition(b'\n')
+            if not sep:
+                break
+            self._ctrl_buffer = rest
+
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                self.runner_logger.error('Could not decode message from Script as JSON: %s', line)
+                continue
+
+            request = preprocess_script_message(message, self.runner_logger, self.script_logger)
+            if request is None or self._ctrlin_fd is None:
+                continue
+
+            self._waiting = True
+            self._handle_request(*request, message)
+
+    def _read(self, fd):
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return b''
+        except OSError:
+            self.runner_logger.exception('Read from child pipe failed:')
+            data = b''
+
+        if not data:
+            # EOF (on this file descriptor), ignore the rest as the child will be reaped anyway
+            self.supervisor.loop.remove_reader(fd)
+        return data
+
+    def _write(self, data):
+        if self._write_buffer:
+            self._write_buffer += data
+            return
+
+        try:
+            written = os.write(self._ctrlin_fd, data)
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            self.runner_logger.exception('Write to child pipe failed:')
+            return
+
+        if written < len(data):
+            # Do not block the Master by a Script which does not read its responses
+            self._write_buffer = data[written:]
+            self.supervisor.loop.add_writer(self._ctrlin_fd, self._flush)
+
+    def _flush(self):
+        try:
+            written = os.write(self._ctrlin_fd, self._write_buffer)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.runner_logger.exception('Write to child pipe failed:')
+            written = len(self._write_buffer)
+
+        self._write_buffer = self._write_buffer[written:]
+        if not self._write_buffer:
+            self.supervisor.loop.remove_writer(self._ctrlin_fd)
+
+    def _wait(self):
+        """
+        Collects the exited Script and returns its exit code.
+        """
+
+        _, status = os.waitpid(self.pid, 0)
+        return os.waitstatus_to_exitcode(status)
+
+    def _reap(self):
+        self.supervisor.loop.remove_reader(self._pidfd)
+        returncode = self._wait()
+        os.close(self._pidfd)
+        self._pidfd = None
+
+        self._close_ctrlin()
+        # Log remaining output, which might have been written right before exiting
+        for fd in self._output_fds:
+            self._read_output(fd)
+        self._read_ctrl()
+        self._close_output()
+
+        if returncode is None:
+            self.runner_logger.info('Checker Script exited')
+            self.script_logger.info('[RUNNER] Checker Script exited')
+        else:
+            self.runner_logger.info('Checker Script exited with code %d', returncode)
+            self.script_logger.info('[RUNNER] Checker Script exited with code %d', returncode)
+        if self.task is not None:
+            self._finish_task()
+        self.last_task.close()
+        self.supervisor.process_exited(self)
+
+    def _close_ctrlin(self):
+        if self._write_buffer:
+            self.supervisor.loop.remove_writer(self._ctrlin_fd)
+        os.close(self._ctrlin_fd)
+        self._ctrlin_fd = None
+
+    def _close_output(self):
+        for fd in self._output_fds + [self._ctrlout_fd]:
+            self.supervisor.loop.remove_reader(fd)
+            os.close(fd)
+        self._output_fds = []
+        self._ctrlout_fd = None
+
+
+class _ZygoteProcess(_ScriptProcess):
+    """
+    Checker Script launched once per tick, which forks a child process for every task after importing its
+    modules. It requests the next task using TASK messages like a worker, with the PID of the previously
+    forked child as parameter. Responses contain the task's arguments, while the child's ends of its pipes
+    get passed on an additional Unix socket.
+    """
+
+    def __init__(self, supervisor, args, sudo_user):
+        super().__init__(supervisor, args, sudo_user, False)
+
+        # _ForkedScripts waiting to be forked
+        self.queue = deque()
+        # _ForkedScript whose PID has not been reported yet
+        self.forking = None
+        self.idle = False
+        self.retiring = False
+        self._fd_socket = None
+
+    def _launch(self, child_fds, extra_env=None, extra_fds=None):
+        self._fd_socket, child_socket = socket.socketpair()
+        child_socket_fd = _move_fd(child_socket.detach())
+        try:
+            super()._launch(child_fds, {'CTF_CHECKERSCRIPT_ZYGOTE': '1'}, {ZYGOTE_FD: child_socket_fd})
+        except OSError:
+            self._fd_socket.close()
+            raise
+        finally:
+            os.close(child_socket_fd)
+
+    def submit(self, task):
+        """
+        Queues a task to be forked from this zygote.
+        """
+
+        self.queue.append(_ForkedScript(self, task))
+        if self.idle:
+            self.idle = False
+            self._fork_next()
+
+    def retire(self):
+        """
+        Lets the zygote exit once all already submitted tasks have been forked.
+        """
+
+        self.retiring = True
+        if self.idle:
+            self.idle = False
+            self.send(None)
+
+    def fork(self, child, child_fds):
+        """
+        Sends a task to the zygote, which is waiting in a TASK request.
+        """
+
+        if self._ctrlin_fd is None:
+            raise OSError('Zygote has already exited')
+
+        socket.send_fds(self._fd_socket, [b'\0'], child_fds)
+        self.forking = child
+        self.send(child.task.args[1:])
+
+    def _fork_next(self):
+        while self.queue:
+            child = self.queue.popleft()
+            if child.start(child.task):
+                return True
+        return False
+
+    def _handle_request(self, action, param, message):
+        if action != ACTION_TASK:
+            self.runner_logger.error('Zygote must only send TASK messages: %s', message)
+            self.kill()
+            return
+
+        if self.forking is not None:
+            child = self.forking
+            self.forking = None
+            child.set_pid(param)
+
+        if self._fork_next():
+            return
+        if self.retiring:
+            self.send(None)
+        else:
+            self.idle = True
+
+    def _reap(self):
+        self._fd_socket.close()
+        super()._reap()
+
+        if self.forking is not None:
+            self.forking.zygote_exited()
+        for child in self.queue:
+            child.zygote_exited()
+        self.queue.clear()
+
+
+class _ForkedScript(_ScriptProcess):
+    """
+    Checker Script process for a single task, forked by a _ZygoteProcess. It has its own pipes and process
+    group like a launched one.
+    """
+
+    def __init__(self, zygote, task):
+        super().__init__(zygote.supervisor, task.args, zygote.sudo_user, False)
+        self.zygote = zygote
+        self.task = task
+        task.process = self
+        self._kill_pending = False
+
+    def start(self, task):
+        if self._kill_pending:
+            self._cancel()
+            return False
+
+        return super().start(task)
+
+    def _launch(self, child_fds, extra_env=None, extra_fds=None):
+        self.script_logger.info('[RUNNER] Forking Checker Script from zygote')
+        self.zygote.fork(self, child_fds)
+
+    def set_pid(self, pid):
+        if not isinstance(pid, int) or pid <= 0:
+            self.runner_logger.error('Zygote reported invalid PID: %s', pid)
+            self.zygote.kill()
+            self.zygote_exited()
+            return
+
+        self.pid = pid
+        try:
+            self._pidfd = os.pidfd_open(pid)
+        except OSError:
+            self.runner_logger.exception('Opening forked Checker Script failed:')
+            self.pid = None
+            self.zygote_exited()
+            return
+        self.supervisor.loop.add_reader(self._pidfd, self._reap)
+
+        if self._kill_pending:
+            self.kill()
+
+    def kill(self):
+        if self._pidfd is None:
+            # Not forked yet or PID not reported yet
+            self._kill_pending = True
+        else:
+            super().kill()
+
+    def zygote_exited(self):
+        """
+        Gives up on the task if its child has not been forked or its PID has not been reported.
+        """
+
+        if self._pidfd is not None or self.task is None:
+            return
+
+        if self._ctrlin_fd is not None:
+            self._close_ctrlin()
+            self._close_output()
+        self._cancel()
+
+    def _cancel(self):
+        self.script_logger.warning('[RUNNER] Checker Script has not been forked')
+        self._finish_task()
+        self.last_task.close()
+        self.supervisor.process_exited(self)
+
+    def _wait(self):
+        # The child gets reaped by the zygote, so its exit code is unknown
+        return None
+
+
+def _pipe():
+    """
+    Creates a pipe with file descriptor numbers above the ones forced within the Checker Script, so that
+    they cannot get overwritten when setting up the Script's file descriptors.
+    """
+
+    read_fd, write_fd = os.pipe()
+    return (_move_fd(read_fd), _move_fd(write_fd))
+
+
+def _move_fd(fd):
+
+    if fd > ZYGOTE_FD:
+        return fd
+
+    new_fd = fcntl.fcntl(fd, fcntl.F_DUPFD_CLOEXEC, ZYGOTE_FD + 1)
+    os.close(fd)
+    return new_fd
@@ -168,6 +168,18 @@ def _net_no_to_team_id(cursor, team_net_no, fake_team_id):
     return data[0]
 
 
+def get_team_ids(db_conn, prohibit_changes=False):
+    """
+    Returns a dict mapping from the net numbers of all teams to their IDs.
+    """
+
+    with transaction_cursor(db_conn, prohibit_changes) as cursor:
+        cursor.execute('SELECT net_number, user_id FROM registration_team WHERE net_number IS NOT NULL')
+        result = cursor.fetchall()
+
+    return dict(result)
+
+
 def commit_result(db_conn, service_id, team_net_no, tick, result, prohibit_changes=False, fake_team_id=None):
     """
     Saves the result from a Checker run to game database.
@@ -179,16 +191,27 @@ def commit_result(db_conn, service_id, team_net_no, tick, result, prohibit_chang
             logging.error('No team found with net number %d, cannot commit result', team_net_no)
             return
 
-        cursor.execute('INSERT INTO scoring_statuscheck'
-                       '    (service_id, team_id, tick, status, timestamp)'
-                       '    VALUES (%s, %s, %s, %s, NOW())', (service_id, team_id, tick, result))
-        if result != STATUS_TIMEOUT:
-            # (In case of `prohibit_changes`,) PostgreSQL checks the database grants even if nothing is
-            # matched by `WHERE`
-            cursor.execute('UPDATE scoring_flag'
-                           '    SET placement_end = NOW()'
-                           '    WHERE service_id = %s AND protecting_team_id = %s AND tick = %s',
-                           (service_id, team_id, tick))
+        _commit_results(cursor, service_id, [(team_id, tick, result)])
+
+
+def _commit_results(cursor, service_id, results):
+
+    params = []
+    for team_id, tick, result in results:
+        params += [service_id, team_id, tick, result]
+    cursor.execute('INSERT INTO scoring_statuscheck'    # nosec
+                   '    (service_id, team_id, tick, status, timestamp)'
+                   '    VALUES {}'.format(', '.join(['(%s, %s, %s, %s, NOW())'] * len(results))), params)
+
+    placements = [(team_id, tick) for team_id, tick, result in results if result != STATUS_TIMEOUT]
+    if len(placements) > 0:
+        # (In case of `prohibit_changes`,) PostgreSQL checks the database grants even if nothing is
+        # matched by `WHERE`
+        cursor.execute('UPDATE scoring_flag'    # nosec
+                       '    SET placement_end = NOW()'
+                       '    WHERE service_id = %s AND (protecting_team_id, tick) IN (VALUES {})'.format(
+                           ', '.join(['(%s, %s)'] * len(placements))
+                       ), [service_id] + [param for placement in placements for param in placement])
 
 
 def set_flagid(db_conn, service_id, team_net_no, tick, flagid, prohibit_changes=False, fake_team_id=None):
@@ -203,14 +226,25 @@ def set_flagid(db_conn, service_id, team_net_no, tick, flagid, prohibit_changes=
             logging.error('No team found with net number %d, cannot commit result', team_net_no)
             return
 
-        # (In case of `prohibit_changes`,) PostgreSQL checks the database grants even if nothing is matched
-        # by `WHERE`
-        cursor.execute('UPDATE scoring_flag'
-                       '    SET flagid = %s'
-                       '    WHERE service_id = %s AND protecting_team_id = %s AND tick = %s', (flagid,
-                                                                                               service_id,
-                                                                                               team_id,
-                                                                                               tick))
+        _set_flagids(cursor, service_id, [(team_id, tick, flagid)])
+
+
+def _set_flagids(cursor, service_id, flagids):
+
+    # Only the last Flag ID per flag counts
+    flagids = {(team_id, tick): flagid for team_id, tick, flagid in flagids}
+
+    case_params = []
+    for (team_id, tick), flagid in flagids.items():
+        case_params += [team_id, tick, flagid]
+    # (In case of `prohibit_changes`,) PostgreSQL checks the database grants even if nothing is matched
+    # by `WHERE`
+    cursor.execute('UPDATE scoring_flag'    # nosec
+                   '    SET flagid = CASE {} END'
+                   '    WHERE service_id = %s AND (protecting_team_id, tick) IN (VALUES {})'.format(
+                       ' '.join(['WHEN protecting_team_id = %s AND tick = %s THEN %s'] * len(flagids)),
+                       ', '.join(['(%s, %s)'] * len(flagids))
+                   ), case_params + [service_id] + [param for key in flagids for param in key])
 
 
 def load_state(db_conn, service_id, team_net_no, key, prohibit_changes=False):
@@ -242,8 +276,49 @@ def store_state(db_conn, service_id, team_net_no, key, data, prohibit_changes=Fa
             logging.error('No team found with net number %d, cannot store state', team_net_no)
             return
 
-        # (In case of `prohibit_changes`,) PostgreSQL checks the database grants even if no CONFLICT occurs
-        cursor.execute('INSERT INTO scoring_checkerstate (service_id, team_id, key, data)'
-                       '    VALUES (%s, %s, %s, %s)'
-                       '    ON CONFLICT (service_id, team_id, key)'
-                       '        DO UPDATE SET data = EXCLUDED.data', (service_id, team_id, key, data))
+        _store_states(cursor, service_id, [(team_id, key, data)])
+
+
+def _store_states(cursor, service_id, states):
+
+    # A single INSERT must not update the same row twice, so only keep the last data per key
+    states = {(team_id, key): data for team_id, key, data in states}
+
+    params = []
+    for (team_id, key), data in states.items():
+        params += [service_id, team_id, key, data]
+    # (In case of `prohibit_changes`,) PostgreSQL checks the database grants even if no CONFLICT occurs
+    cursor.execute('INSERT INTO scoring_checkerstate (service_id, team_id, key, data)'    # nosec
+                   '    VALUES {}'
+                   '    ON CONFLICT (service_id, team_id, key)'
+                   '        DO UPDATE SET data = EXCLUDED.data'.format(
+                       ', '.join(['(%s, %s, %s, %s)'] * len(states))
+                   ), params)
+
+
+def write_batch(db_conn, service_id, writes, prohibit_changes=False):
+    """
+    Saves multiple check results, Flag IDs and Checker states in a single transaction, using one multi-row
+    statement per kind of data.
+
+    Args:
+        writes: List of (kind, args) tuples, where `kind` is one of "result", "flagid" and "state". `args`
+                are tuples of (team_id, tick, result), (team_id, tick, flagid) and (team_id, key, data)
+                respectively.
+    """
+
+    writers = {
+        'flagid': _set_flagids,
+        'state': _store_states,
+        # Results last, as they mark the end of flag placement
+        'result': _commit_results
+    }
+
+    grouped_writes = {kind: [] for kind in writers}
+    for kind, args in writes:
+        grouped_writes[kind].append(args)
+
+    with transaction_cursor(db_conn, prohibit_changes) as cursor:
+        for kind, writer in writers.items():
+            if len(grouped_writes[kind]) > 0:
+                writer(cursor, service_id, grouped_writes[kind])
@@ -17,10 +17,16 @@ from ctf_gameserver.lib.database import transaction_cursor
 from ctf_gameserver.lib.exceptions import DBDataError
 import ctf_gameserver.lib.flag as flag_lib
 
-from . import database, metrics
+from . import asyncrunner, database, metrics
+from .asyncrunner import AsyncRunnerSupervisor
 from .supervisor import RunnerSupervisor
 from .supervisor import ACTION_FLAG, ACTION_FLAGID, ACTION_LOAD, ACTION_STORE, ACTION_RESULT
 
+# Maximum number of requests from Checker Scripts to handle in one step of the Master Loop
+REQUEST_BATCH_SIZE = 100
+# Maximum time in seconds to delay database writes from Checker Scripts to group them into one transaction
+WRITE_BATCH_INTERVAL = 0.2
+
 
 def main():
 
@@ -46,6 +52,17 @@ def main():
                        help='Number of Checker Masters running for this service')
     group.add_argument('--interval', type=float, required=True,
                        help='Time between launching batches of Checker Scripts in seconds')
+    group.add_argument('--runner-engine', choices=['process', 'asyncio'], default='process',
+                       help='How to run Checker Scripts: "process" uses an intermediate Runner process per '
+                       'Script, "asyncio" launches them directly from an event loop in the Master '
+                       '(default: process)')
+    group.add_argument('--worker-tasks', type=int, default=0,
+                       help='Keep Checker Scripts running as workers for up to this number of checks each, '
+                       'requires Scripts using the Python checkerlib and the "asyncio" Runner engine '
+                       '(default: 0, i.e. one Script process per check)')
+    group.add_argument('--zygote', action='store_true',
+                       help='Fork Checker Scripts from a zygote process started once per tick, requires '
+                       'Scripts using the Python checkerlib and the "asyncio" Runner engine')
 
     group = arg_parser.add_argument_group('logging', 'Checker Script logging')
     group.add_argument('--journald', action='store_true', help='Log Checker Script messages to journald')
@@ -62,6 +79,22 @@ def main():
         logging.error('`--interval` must be at least 3 seconds')
         return os.EX_USAGE
 
+    if args.runner_engine == 'asyncio' and not asyncrunner.is_available():
+        logging.error('asyncio Runner engine requires Linux 5.3 or newer')
+        return os.EX_USAGE
+    if args.worker_tasks < 0:
+        logging.error('`--worker-tasks` must not be negative')
+        return os.EX_USAGE
+    if args.worker_tasks > 0 and args.runner_engine != 'asyncio':
+        logging.error('`--worker-tasks` requires the "asyncio" Runner engine')
+        return os.EX_USAGE
+    if args.zygote and args.runner_engine != 'asyncio':
+        logging.error('`--zygote` requires the "asyncio" Runner engine')
+        return os.EX_USAGE
+    if args.zygote and args.worker_tasks > 0:
+        logging.error('`--zygote` and `--worker-tasks` cannot be combined')
+        return os.EX_USAGE
+
     logging_params = {}
 
     # Configure logging
@@ -155,6 +188,7 @@ def main():
         database.get_task_count(db_conn, service_id, prohibit_changes=True)
         database.get_new_tasks(db_conn, service_id, 1, prohibit_changes=True)
         database.get_flag_id(db_conn, service_id, 1, 1, prohibit_changes=True, fake_flag_id=42)
+        database.get_team_ids(db_conn, prohibit_changes=True)
         database.commit_result(db_conn, service_id, 1, 2147483647, 0, prohibit_changes=True, fake_team_id=1)
         database.set_flagid(db_conn, service_id, 1, 0, 'id', prohibit_changes=True, fake_team_id=1)
         database.load_state(db_conn, service_id, 1, 'key', prohibit_changes=True)
@@ -173,7 +207,8 @@ def main():
         try:
             master_loop = MasterLoop(db_conn, args.service, args.checkerscript, args.sudouser,
                                      args.stddeviations, args.checkercount, args.interval, args.ippattern,
-                                     flag_secret, logging_params, metrics_queue)
+                                     flag_secret, logging_params, metrics_queue, args.runner_engine,
+                                     args.worker_tasks, args.zygote)
             break
         except DBDataError as e:
             logging.warning('Waiting for valid database state: %s', e)
@@ -202,7 +237,8 @@ def main():
 class MasterLoop:
 
     def __init__(self, db_conn, service_slug, checker_script, sudo_user, std_dev_count, checker_count,
-                 interval, ip_pattern, flag_secret, logging_params, metrics_queue):
+                 interval, ip_pattern, flag_secret, logging_params, metrics_queue, runner_engine='process',
+                 worker_tasks=0, zygote=False):
         self.db_conn = db_conn
         self.checker_script = checker_script
         self.sudo_user = sudo_user
@@ -218,12 +254,23 @@ class MasterLoop:
         self.service = database.get_service_attributes(self.db_conn, service_slug)
         self.service['slug'] = service_slug
 
-        self.supervisor = RunnerSupervisor(metrics_queue)
+        if runner_engine == 'asyncio':
+            self.supervisor = AsyncRunnerSupervisor(metrics_queue, worker_tasks, zygote)
+        else:
+            self.supervisor = RunnerSupervisor(metrics_queue)
         self.known_tick = -1
         # Trigger launch of tasks in first step()
         self.last_launch = get_monotonic_time() - self.interval
         self.tasks_per_launch = None
         self.shutting_down = False
+        # Database writes to be grouped while handling a batch of requests, None outside of batches
+        self.pending_writes = None
+        # (request, writes) tuples of requests waiting for the next write transaction
+        self.write_requests = []
+        self.write_interval = WRITE_BATCH_INTERVAL
+        self.write_deadline = None
+        # Cached mapping from net numbers to team IDs
+        self.team_ids = {}
 
     def refresh_control_info(self):
         control_info = database.get_control_info(self.db_conn)
@@ -234,46 +281,36 @@ class MasterLoop:
 
     def step(self):
         """
-        Handles a request from the supervisor, kills overdue tasks and launches new ones.
-        Only processes one request at a time to make sure that launch_tasks() gets called regularly and
-        long-running tasks get killed, at the cost of accumulating a backlog of messages.
+        Handles pending requests from the supervisor, kills overdue tasks and launches new ones.
+        Requests get drained in batches of at most REQUEST_BATCH_SIZE to make sure that launch_tasks() gets
+        called regularly and long-running tasks get killed even under load. Their database writes are
+        committed every `write_interval` seconds.
 
         Returns:
-            A boolean indicating whether a request was handled.
+            A boolean indicating whether a request was handled or its writes have been committed.
         """
-        req = self.supervisor.get_request()
-        if req is not None:
-            resp = None
-            send_resp = True
+        if len(self.write_requests) > 0:
+            # Do not wait for requests beyond the next write transaction
+            timeout = min(max(self.write_deadline - time.monotonic(), 0), self.supervisor.queue_timeout)
+            req = self.supervisor.get_request(timeout > 0, timeout)
+        else:
+            req = self.supervisor.get_request()
 
-            try:
-                if req['action'] == ACTION_FLAG:
-                    resp = self.handle_flag_request(req['info'], req['param'])
-                elif req['action'] == ACTION_FLAGID:
-                    self.handle_flagid_request(req['info'], req['param'])
-                elif req['action'] == ACTION_LOAD:
-                    resp = self.handle_load_request(req['info'], req['param'])
-                elif req['action'] == ACTION_STORE:
-                    self.handle_store_request(req['info'], req['param'])
-                elif req['action'] == ACTION_RESULT:
-                    self.handle_result_request(req['info'], req['param'])
-                else:
-                    logging.error('Unknown action received from Checker Script for team %d (net number %d) '
-                                  'in tick %d: %s', req['info']['_team_id'], req['info']['team'],
-                                  req['info']['tick'], req['action'])
-                    # We can't signal an error to the Checker Script (which might be waiting for a response),
-                    # so our only option is to kill it
-                    self.supervisor.terminate_runner(req['runner_id'])
-                    metrics.inc(self.metrics_queue, 'killed_tasks')
-                    send_resp = False
-            except:    # noqa, pylint: disable=bare-except
-                logging.exception('Checker Script communication error for team %d (net number %d) in tick '
-                                  '%d:', req['info']['_team_id'], req['info']['team'], req['info']['tick'])
-                self.supervisor.terminate_runner(req['runner_id'])
-                metrics.inc(self.metrics_queue, 'killed_tasks')
-            else:
-                if send_resp:
-                    req['send'].send(resp)
+        requests = []
+        while req is not None:
+            requests.append(req)
+            if len(requests) >= REQUEST_BATCH_SIZE:
+                break
+            req = self.supervisor.get_request(block=False)
+
+        if len(requests) > 0:
+            self.handle_requests(requests)
+
+        flushed = False
+        if len(self.write_requests) > 0 and (time.monotonic() >= self.write_deadline or
+                                             len(self.write_requests) >= REQUEST_BATCH_SIZE):
+            self.flush_writes()
+            flushed = True
 
         if not self.shutting_down:
             # Launch new tasks and catch up missed intervals
@@ -285,7 +322,105 @@ class MasterLoop:
                 self.last_launch += self.interval
                 self.launch_tasks()
 
-        return req is not None
+        return len(requests) > 0 or flushed
+
+    def handle_requests(self, requests):
+        """
+        Handles a batch of requests from the supervisor. Database writes get queued for flush_writes(), the
+        respective Checker Scripts only get their responses once the writes have been committed.
+        """
+        now = time.monotonic()
+        for req in requests:
+            metrics.observe(self.metrics_queue, 'request_queue_delay_seconds', now - req['time'])
+
+        if any(req['action'] == ACTION_FLAG for req in requests):
+            # We need current value for self.contest_start which might have changed
+            self.refresh_control_info()
+
+        if len(self.write_requests) == 0:
+            self.write_deadline = time.monotonic() + self.write_interval
+
+        self.pending_writes = []
+        try:
+            for req in requests:
+                write_count = len(self.pending_writes)
+                resp, send_resp = self.handle_request(req)
+                if not send_resp:
+                    continue
+                if req['action'] in (ACTION_FLAGID, ACTION_STORE, ACTION_RESULT):
+                    self.write_requests.append((req, self.pending_writes[write_count:]))
+                else:
+                    req['send'].send(resp)
+        finally:
+            self.pending_writes = None
+
+    def flush_writes(self):
+        """
+        Commits the queued database writes in a single transaction and sends the responses to the respective
+        Checker Scripts.
+        """
+        write_requests = self.write_requests
+        self.write_requests = []
+        if len(write_requests) == 0:
+            return
+
+        try:
+            database.write_batch(self.db_conn, self.service['id'],
+                                 [write for _, writes in write_requests for write in writes])
+        except:    # noqa, pylint: disable=bare-except
+            logging.exception('Grouped database writes failed, retrying them per Checker Script:')
+        else:
+            for req, _ in write_requests:
+                req['send'].send(None)
+            return
+
+        # Only kill the Checker Scripts whose writes actually fail
+        for req, writes in write_requests:
+            try:
+                database.write_batch(self.db_conn, self.service['id'], writes)
+            except:    # noqa, pylint: disable=bare-except
+                self.handle_request_error(req)
+            else:
+                req['send'].send(None)
+
+    def handle_request(self, req):
+        """
+        Handles a single request from the supervisor.
+
+        Returns:
+            A tuple of the response and a boolean indicating whether it should be sent.
+        """
+        try:
+            if req['action'] == ACTION_FLAG:
+                return (self.handle_flag_request(req['info'], req['param']), True)
+            elif req['action'] == ACTION_FLAGID:
+                self.handle_flagid_request(req['info'], req['param'])
+            elif req['action'] == ACTION_LOAD:
+                return (self.handle_load_request(req['info'], req['param']), True)
+            elif req['action'] == ACTION_STORE:
+                self.handle_store_request(req['info'], req['param'])
+            elif req['action'] == ACTION_RESULT:
+                self.handle_result_request(req['info'], req['param'])
+            else:
+                logging.error('Unknown action received from Checker Script for team %d (net number %d) '
+                              'in tick %d: %s', req['info']['_team_id'], req['info']['team'],
+                              req['info']['tick'], req['action'])
+                # We can't signal an error to the Checker Script (which might be waiting for a response),
+                # so our only option is to kill it
+                self.supervisor.terminate_runner(req['runner_id'])
+                metrics.inc(self.metrics_queue, 'killed_tasks')
+                return (None, False)
+        except:    # noqa, pylint: disable=bare-except
+            self.handle_request_error(req)
+            return (None, False)
+
+        return (None, True)
+
+    def handle_request_error(self, req):
+        logging.exception('Checker Script communication error for team %d (net number %d) in tick %d:',
+                          req['info']['_team_id'], req['info']['team'], req['info']['tick'])
+        self.supervisor.terminate_runner(req['runner_id'])
+        metrics.inc(self.metrics_queue, 'killed_tasks')
 
     def handle_flag_request(self, task_info, params):
         try:
@@ -293,8 +428,10 @@ class MasterLoop:
         except (KeyError, ValueError):
             return None
 
-        # We need current value for self.contest_start which might have changed
-        self.refresh_control_info()
+        if self.pending_writes is None:
+            # We need current value for self.contest_start which might have changed, during batches of
+            # requests it gets refreshed once per batch
+            self.refresh_control_info()
 
         flag_id = database.get_flag_id(self.db_conn, self.service['id'], task_info['_team_id'], tick)
 
@@ -303,14 +440,13 @@ class MasterLoop:
                                  self.flag_prefix)
 
     def handle_flagid_request(self, task_info, param):
-        database.set_flagid(self.db_conn, self.service['id'], task_info['team'], task_info['tick'], param)
+        self.write('flagid', task_info['team'], task_info['tick'], param)
 
     def handle_load_request(self, task_info, param):
         return database.load_state(self.db_conn, self.service['id'], task_info['team'], param)
 
     def handle_store_request(self, task_info, params):
-        database.store_state(self.db_conn, self.service['id'], task_info['team'], params['key'],
-                             params['data'])
+        self.write('state', task_info['team'], params['key'], params['data'])
 
     def handle_result_request(self, task_info, param):
         try:
@@ -330,17 +466,44 @@ class MasterLoop:
         logging.info('Result from Checker Script for team %d (net number %d) in tick %d: %s',
                      task_info['_team_id'], task_info['team'], task_info['tick'], check_result)
         metrics.inc(self.metrics_queue, 'completed_tasks', labels={'result': check_result.name})
-        database.commit_result(self.db_conn, self.service['id'], task_info['team'], task_info['tick'],
-                               result)
+        self.write('result', task_info['team'], task_info['tick'], result)
+
+    def write(self, kind, team_net_no, *args):
+        """
+        Saves data from a Checker Script to the database, or adds it to the grouped transaction while
+        handling a batch of requests. See database.write_batch() for the arguments.
+        """
+        team_id = self.get_team_id(team_net_no)
+        if team_id is None:
+            logging.error('No team found with net number %d, cannot store %s', team_net_no, kind)
+            return
+
+        if self.pending_writes is None:
+            database.write_batch(self.db_conn, self.service['id'], [(kind, (team_id, *args))])
+        else:
+            self.pending_writes.append((kind, (team_id, *args)))
+
+    def get_team_id(self, team_net_no):
+        try:
+            return self.team_ids[team_net_no]
+        except KeyError:
+            # Teams might have been added since filling the cache
+            self.team_ids = database.get_team_ids(self.db_conn)
+            return self.team_ids.get(team_net_no)
 
     def launch_tasks(self):
+        # Results from Checker Scripts must not be overtaken by the timeouts when terminating them
+        self.flush_writes()
+
         def timeout_runners():
+            timeouts = []
             for task_info in self.supervisor.terminate_runners():
                 logging.info('Forcefully terminated Checker Script for team %d (net number %d) in tick %d',
                              task_info['_team_id'], task_info['team'], task_info['tick'])
                 metrics.inc(self.metrics_queue, 'timeout_tasks')
-                database.commit_result(self.db_conn, self.service['id'], task_info['team'],
-                                       task_info['tick'], STATUS_TIMEOUT)
+                timeouts.append(('result', (task_info['_team_id'], task_info['tick'], STATUS_TIMEOUT)))
+            if len(timeouts) > 0:
+                database.write_batch(self.db_conn, self.service['id'], timeouts)
 
         def change_tick(new_tick):
             timeout_runners()
@@ -367,6 +530,7 @@ class MasterLoop:
             change_tick(current_tick)
 
         for task in tasks:
+            self.team_ids[task['team_net_no']] = task['team_id']
             ip = self.ip_pattern % task['team_net_no']
             runner_args = [self.checker_script, ip, str(task['team_net_no']), str(task['tick'])]
 
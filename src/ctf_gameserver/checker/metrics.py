@@ -90,7 +90,9 @@ def checker_metrics_factory(registry, service):
         ('task_launch_delay_seconds', 'Differences between supposed and actual task launch times',
          (0.01, 0.03, 0.05, 0.1, 0.3, 0.5, 1, 3, 5, 10, 30, 60, float('inf'))),
         ('script_duration_seconds', 'Observed runtimes of Checker Scripts',
-         (1, 3, 5, 8, 10, 20, 30, 45, 60, 90, 120, 150, 180, 240, 300, float('inf')))
+         (1, 3, 5, 8, 10, 20, 30, 45, 60, 90, 120, 150, 180, 240, 300, float('inf'))),
+        ('request_queue_delay_seconds', 'Time requests from Checker Scripts waited before being handled',
+         (0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1, 3, 10, float('inf')))
     ]
     for name, doc, buckets in histograms:
         metrics[name] = prometheus_client.Histogram(metric_prefix+name, doc, ['service'], buckets=buckets,
@@ -21,6 +21,7 @@ ACTION_LOAD = 'LOAD'
 ACTION_STORE = 'STORE'
 ACTION_LOG = 'LOG'
 ACTION_RESULT = 'RESULT'
+ACTION_TASK = 'TASK'
 ACTION_RUNNER_EXIT = 'RUNNER_EXIT'
 
 ACTIONS = [
@@ -30,9 +31,16 @@ ACTIONS = [
     ACTION_STORE,
     ACTION_LOG,
     ACTION_RESULT,
+    ACTION_TASK,
     ACTION_RUNNER_EXIT
 ]
 
+# File descriptor numbers of the control pipes within the Checker Script
+CTRLIN_FD = 3
+CTRLOUT_FD = 4
+# File descriptor number of the Unix socket for passing the pipes of forked children to a zygote
+ZYGOTE_FD = 5
+
 
 class RunnerSupervisor:
     """
@@ -101,12 +109,15 @@ class RunnerSupervisor:
 
         return terminated_infos
 
-    def get_request(self):
+    def get_request(self, block=True, timeout=None):
+        if timeout is None:
+            timeout = self.queue_timeout
+
         # Use a loop to not leak our implementation detail for ACTION_RUNNER_EXIT: Only return None when the
         # queue is really empty (barring non-critical race conditions)
         while True:
             try:
-                request = self.work_queue.get(True, self.queue_timeout)
+                request = self.work_queue.get(block, timeout)
             except queue.Empty:
                 return None
             runner_id = request[0]
@@ -132,7 +143,8 @@ class RunnerSupervisor:
             'param': request[2],
             'runner_id': runner_id,
             'send': self.processes[runner_id][1],
-            'info': self.processes[runner_id][2]
+            'info': self.processes[runner_id][2],
+            'time': request[3]
         }
 
 
@@ -154,67 +166,14 @@ def _run_checker_script(args, sudo_user, info, logging_params, runner_id, queue_
     """
 
     runner_logger = logging.getLogger('Checker Runner: {}'.format(args))
-
-    class NanosFilter(logging.Filter):
-        """
-        Log Filter which adds a current timestamp in nanoseconds to Log Records.
-        """
-        def filter(self, record):
-            setattr(record, 'timestamp_nanos', time.time_ns())
-            return True
-
-    class InfoFilter(logging.Filter):
-        """
-        Log Filter which adds all metadata from an "info" dict as attributes to Log Records.
-        """
-        def __init__(self, info):
-            super().__init__()
-            self.info = info
-
-        def filter(self, record):
-            for key, value in self.info.items():
-                if hasattr(record, key):
-                    runner_logger.warning('Discarding log metadata "%s" due to a naming conflict', key)
-                else:
-                    setattr(record, key, value)
-            return True
-
-    script_logger = logging.getLogger('Checker Script')
-    script_logger.setLevel(logging.INFO)
-    script_logger.propagate = False
-    script_logger.addFilter(NanosFilter())
-    if info is not None:
-        script_logger.addFilter(InfoFilter(info))
-
-    if 'journald' in logging_params:
-        from systemd.journal import JournalHandler    # pylint: disable=import-outside-toplevel,import-error
-        syslog_identifier = 'checker_{}-team{:03d}-tick{:03d}'.format(info['service'], info['team'],
-                                                                      info['tick'])
-        journal_handler = JournalHandler(SYSLOG_IDENTIFIER=syslog_identifier)
-        script_logger.addHandler(journal_handler)
-    if 'gelf' in logging_params:
-        # pylint: disable=import-outside-toplevel,import-error
-        import graypy
-
-        # Work-around for missing IPv6 support in Python's
-        # logging.handlers.DatagramHandler (https://bugs.python.org/issue14855)
-        class GELFHandler(graypy.GELFUDPHandler):
-            # pylint: disable=invalid-name
-            def makeSocket(self):
-                return socket.socket(logging_params['gelf']['family'], socket.SOCK_DGRAM)
-
-        gelf_handler = GELFHandler(logging_params['gelf']['host'], logging_params['gelf']['port'])
-        script_logger.addHandler(gelf_handler)
+    script_logger = make_script_logger(logging.getLogger('Checker Script'), info, logging_params,
+                                       runner_logger)
 
     stdout_read, stdout_write = os.pipe()
     stderr_read, stderr_write = os.pipe()
     ctrlin_read, ctrlin_write = os.pipe()
     ctrlout_read, ctrlout_write = os.pipe()
 
-    # File descriptor numbers after dup_ctrl_fds()
-    CTRLIN_FD = 3    # pylint: disable=invalid-name
-    CTRLOUT_FD = 4    # pylint: disable=invalid-name
-
     def dup_ctrl_fds():
         """
         preexec_fn for subprocess.Popen() which forces specific numbers for file descriptors within the
@@ -225,10 +184,7 @@ def _run_checker_script(args, sudo_user, info, logging_params, runner_id, queue_
         os.dup2(ctrlout_write, CTRLOUT_FD)
         os.close(ctrlout_write)
 
-    if sudo_user is not None:
-        args = ['sudo', '--user='+sudo_user, '--preserve-env=PATH,CTF_CHECKERSCRIPT,CHECKERSCRIPT_PIDFILE',
-                '--close-from=5', '--non-interactive', '--'] + args
-
+    args = get_script_args(args, sudo_user)
     env = {**os.environ, 'CTF_CHECKERSCRIPT': '1'}
     script_logger.info('[RUNNER] Executing Checker Script')
     # Python doesn't specify if preexec_fn gets executed before or after closing file descriptors, thus we
@@ -251,13 +207,7 @@ def _run_checker_script(args, sudo_user, info, logging_params, runner_id, queue_
     # Kill all children when this process gets terminated (requires `start_new_session=True` above)
     def sigterm_handler(_, __):
         script_logger.warning('[RUNNER] Terminating Checker Script')
-        # Yeah kids, this is how Unix works
-        pgid = -1 * proc.pid
-        # Avoid using kill(1) because of https://bugs.debian.org/cgi-bin/bugreport.cgi?bug=1005376
-        kill_args = ['python3', '-c', f'import os; import signal; os.kill({pgid}, signal.SIGKILL)']
-        if sudo_user is not None:
-            kill_args = ['sudo', '--user='+sudo_user, '--non-interactive', '--'] + kill_args
-        subprocess.check_call(kill_args)
+        subprocess.check_call(get_kill_args(proc.pid, sudo_user))
         # Best-effort attempt to join zombies, primarily for CI runs without an init process
         # Use a timeout to guarantee the Runner itself will always exit within a reasonable time frame
         # This will not work if the timeout expires or if our child fork()ed again; those zombies will be
@@ -334,6 +284,36 @@ def _run_checker_script(args, sudo_user, info, logging_params, runner_id, queue_
     script_logger.info('[RUNNER] Checker Script exited with code %d', proc.returncode)
 
 
+def get_script_args(args, sudo_user, last_fd=CTRLOUT_FD):
+    """
+    Returns the command line for executing a Checker Script with the given arguments, optionally as a
+    different user. File descriptors up to `last_fd` are kept open.
+    """
+
+    if sudo_user is None:
+        return args
+
+    return ['sudo', '--user='+sudo_user, '--preserve-env=PATH,CTF_CHECKERSCRIPT,CTF_CHECKERSCRIPT_WORKER,'
+            'CTF_CHECKERSCRIPT_ZYGOTE,CHECKERSCRIPT_PIDFILE', '--close-from={}'.format(last_fd+1),
+            '--non-interactive', '--'] + args
+
+
+def get_kill_args(pid, sudo_user):
+    """
+    Returns the command line for killing the process group (i.e. all children, requires the Script to be
+    started in a new session) of the Checker Script with the given PID.
+    """
+
+    # Yeah kids, this is how Unix works
+    pgid = -1 * pid
+    # Avoid using kill(1) because of https://bugs.debian.org/cgi-bin/bugreport.cgi?bug=1005376
+    kill_args = ['python3', '-c', f'import os; import signal; os.kill({pgid}, signal.SIGKILL)']
+    if sudo_user is not None:
+        kill_args = ['sudo', '--user='+sudo_user, '--non-interactive', '--'] + kill_args
+
+    return kill_args
+
+
 def handle_script_message(message, ctrlin_fd, runner_id, queue_to_master, pipe_from_master, runner_logger,
                           script_logger):
     """
@@ -341,19 +321,42 @@ def handle_script_message(message, ctrlin_fd, runner_id, queue_to_master, pipe_f
     by the Checker Script, we (as the Runner) only respond.
     """
 
+    request = preprocess_script_message(message, runner_logger, script_logger)
+    if request is None:
+        return
+
+    # CLOCK_MONOTONIC is system-wide, so the Master can compare the time to its own
+    queue_to_master.put((runner_id, *request, time.monotonic()))
+    response = pipe_from_master.recv()
+
+    try:
+        os.write(ctrlin_fd, encode_response(response))
+    except OSError:
+        runner_logger.exception('Write to child pipe failed:')
+
+
+def preprocess_script_message(message, runner_logger, script_logger):
+    """
+    Validates a message from a Checker Script and handles the parts which do not involve the Master, i.e.
+    logging.
+
+    Returns:
+        A tuple of (action, param) for messages which have to be passed to the Master, None otherwise.
+    """
+
     try:
         action = message['action']
         param = message['param']
     except KeyError:
         runner_logger.error('Message must have "action" and "param" keys: %s', message)
-        return
+        return None
 
     if action not in ACTIONS:
         runner_logger.error('Message has invalid "action" key: %s', message)
-        return
+        return None
     if action == ACTION_RUNNER_EXIT:
         runner_logger.error('RUNNER_EXIT messages must not be generated by the Script: %s', message)
-        return
+        return None
 
     if action == ACTION_LOG:
         record = make_script_log_record(param)
@@ -361,7 +364,7 @@ def handle_script_message(message, ctrlin_fd, runner_id, queue_to_master, pipe_f
             runner_logger.error('Malformed log message from the Script: %s', param)
         else:
             script_logger.handle(record)
-        return
+        return None
 
     if action == ACTION_RESULT:
         try:
@@ -373,15 +376,75 @@ def handle_script_message(message, ctrlin_fd, runner_id, queue_to_master, pipe_f
             script_logger.info('[RUNNER] Checker Script result: %s', result.name,
                                extra={'result': result.value})
 
-    queue_to_master.put((runner_id, action, param))
-    response = pipe_from_master.recv()
+    return (action, param)
 
-    try:
-        # Make sure that our JSON consists of just a single line
-        response_json = json.dumps({'response': response}).replace('\n', '') + '\n'
-        os.write(ctrlin_fd, response_json.encode())
-    except OSError:
-        runner_logger.exception('Write to child pipe failed:')
+
+def encode_response(response):
+
+    # Make sure that our JSON consists of just a single line
+    return (json.dumps({'response': response}).replace('\n', '') + '\n').encode()
+
+
+def make_script_logger(script_logger, info, logging_params, runner_logger):
+    """
+    Configures the given Logger for messages from a Checker Script, according to the logging parameters
+    from the Master. Returns the Logger.
+    """
+
+    script_logger.setLevel(logging.INFO)
+    script_logger.propagate = False
+    script_logger.addFilter(NanosFilter())
+    if info is not None:
+        script_logger.addFilter(InfoFilter(info, runner_logger))
+
+    if 'journald' in logging_params:
+        from systemd.journal import JournalHandler    # pylint: disable=import-outside-toplevel,import-error
+        syslog_identifier = 'checker_{}-team{:03d}-tick{:03d}'.format(info['service'], info['team'],
+                                                                      info['tick'])
+        journal_handler = JournalHandler(SYSLOG_IDENTIFIER=syslog_identifier)
+        script_logger.addHandler(journal_handler)
+    if 'gelf' in logging_params:
+        # pylint: disable=import-outside-toplevel,import-error
+        import graypy
+
+        # Work-around for missing IPv6 support in Python's
+        # logging.handlers.DatagramHandler (https://bugs.python.org/issue14855)
+        class GELFHandler(graypy.GELFUDPHandler):
+            # pylint: disable=invalid-name
+            def makeSocket(self):
+                return socket.socket(logging_params['gelf']['family'], socket.SOCK_DGRAM)
+
+        gelf_handler = GELFHandler(logging_params['gelf']['host'], logging_params['gelf']['port'])
+        script_logger.addHandler(gelf_handler)
+
+    return script_logger
+
+
+class NanosFilter(logging.Filter):
+    """
+    Log Filter which adds a current timestamp in nanoseconds to Log Records.
+    """
+    def filter(self, record):
+        setattr(record, 'timestamp_nanos', time.time_ns())
+        return True
+
+
+class InfoFilter(logging.Filter):
+    """
+    Log Filter which adds all metadata from an "info" dict as attributes to Log Records.
+    """
+    def __init__(self, info, runner_logger):
+        super().__init__()
+        self.info = info
+        self.runner_logger = runner_logger
+
+    def filter(self, record):
+        for key, value in self.info.items():
+            if hasattr(record, key):
+                self.runner_logger.warning('Discarding log metadata "%s" due to a naming conflict', key)
+            else:
+                setattr(record, key, value)
+        return True
 
 
 def make_script_log_record(json_record):
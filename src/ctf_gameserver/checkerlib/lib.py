@@ -12,6 +12,7 @@ import socket
 import ssl
 import sys
 import threading
+import traceback
 from typing import Any, Type
 
 import ctf_gameserver.lib.flag
@@ -21,6 +22,7 @@ from ctf_gameserver.lib.checkresult import CheckResult
 _TIMEOUT_SECONDS = 10.0    # Default timeout for socket operations
 _LOCAL_STATE_PATH_TMPL = '_{team:d}_state.json'
 _LOCAL_STATE_PATH = None
+_ZYGOTE_FD = 5
 
 _ctrl_in = None    # pylint: disable=invalid-name
 _ctrl_out = None    # pylint: disable=invalid-name
@@ -217,6 +219,13 @@ def run_check(checker_cls: Type[BaseChecker]) -> None:
     Launch execution of the specified Checker implementation. Must be called by all Checker Scripts.
     """
 
+    if _launched_as_zygote():
+        _run_zygote(checker_cls)
+        return
+    if _launched_as_worker():
+        _run_worker(checker_cls)
+        return
+
     if len(sys.argv) != 4:
         raise Exception('Invalid arguments, usage: {} <ip> <team-net-no> <tick>'.format(sys.argv[0]))
 
@@ -235,13 +244,104 @@ def run_check(checker_cls: Type[BaseChecker]) -> None:
     result = _run_check_steps(checker, tick)
 
     if not _launched_without_runner():
-        _send_ctrl_message({'action': 'RESULT', 'param': result.value})
-        # Wait for acknowledgement
-        _recv_ctrl_message()
+        _send_result(result)
     else:
         print('Check result: {}'.format(result))
 
 
+def _run_worker(checker_cls):
+    """
+    Worker mode of run_check(): Instead of a single check from the command line, successive checks are
+    received from the Master until it tells us to exit. Asking for the next task marks the end of the
+    previous one. Exceptions still let the Checker Script die, so the Master will launch a fresh worker.
+    """
+
+    while True:
+        _send_ctrl_message({'action': 'TASK', 'param': None})
+        message_json = _ctrl_in.readline()
+        if not message_json:
+            # Master has exited
+            return
+        args = json.loads(message_json)['response']
+        if args is None:
+            return
+
+        ip = args[0]
+        team = int(args[1])
+        tick = int(args[2])
+
+        checker = checker_cls(ip, team)
+        result = _run_check_steps(checker, tick)
+        _send_result(result)
+
+
+def _run_zygote(checker_cls):
+    """
+    Zygote mode of run_check(): For every check received from the Master, a child process gets forked with
+    the control and output pipes passed on the zygote socket. This saves the child from importing the
+    Checker Script's modules again. Asking for the next task reports the PID of the previous child.
+    """
+
+    global _ctrl_out_lock    # pylint: disable=invalid-name
+
+    fd_socket = socket.socket(fileno=_ZYGOTE_FD)
+    child_pid = None
+
+    while True:
+        _send_ctrl_message({'action': 'TASK', 'param': child_pid})
+        message_json = _ctrl_in.readline()
+        # Children may only be reaped once the Master has been told about them
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+        if not message_json:
+            # Master has exited
+            return
+        args = json.loads(message_json)['response']
+        if args is None:
+            return
+
+        _, fds, _, _ = socket.recv_fds(fd_socket, 1, 4)
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        child_pid = os.fork()
+        if child_pid == 0:
+            try:
+                os.setsid()
+                for target_fd, fd in zip((1, 2, 3, 4), fds):
+                    os.dup2(fd, target_fd)
+                    os.close(fd)
+                fd_socket.close()
+                _ctrl_out_lock = threading.RLock()
+
+                checker = checker_cls(args[0], int(args[1]))
+                result = _run_check_steps(checker, int(args[2]))
+                _send_result(result)
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except BaseException:    # pylint: disable=broad-except
+                traceback.print_exc()
+                sys.stderr.flush()
+                os._exit(1)
+            os._exit(0)
+
+        for fd in fds:
+            os.close(fd)
+
+
+def _send_result(result):
+
+    _send_ctrl_message({'action': 'RESULT', 'param': result.value})
+    # Wait for acknowledgement
+    _recv_ctrl_message()
+
+
 def _run_check_steps(checker, tick):
 
     tick_lookback = 5
@@ -294,6 +394,20 @@ def _launched_without_runner():
     return _ctrl_in is None
 
 
+def _launched_as_worker():
+    """
+    Returns True if the Checker Script has been launched by the Master to handle multiple checks.
+    """
+    return not _launched_without_runner() and 'CTF_CHECKERSCRIPT_WORKER' in os.environ
+
+
+def _launched_as_zygote():
+    """
+    Returns True if the Checker Script has been launched by the Master to fork a child for every check.
+    """
+    return not _launched_without_runner() and 'CTF_CHECKERSCRIPT_ZYGOTE' in os.environ
+
+
 def _recv_ctrl_message():
 
     message_json = _ctrl_in.readline()
@@ -35,6 +35,8 @@ def increase_tick(db_conn, prohibit_changes=False):
                        '    FROM scoring_service service, auth_user, registration_team team,'
                        '         scoring_gamecontrol control'
                        '    WHERE auth_user.id = team.user_id AND auth_user.is_active')
+        # Let the Submission servers know about the new tick (only delivered upon commit)
+        cursor.execute('NOTIFY ctf_gamecontrol')
 
 
 def cancel_checks(db_conn, prohibit_changes=False):
@@ -1,4 +1,10 @@
 import logging
+import os
+import socket
+
+
+# First file descriptor passed through socket activation, see sd_listen_fds(3)
+SD_LISTEN_FDS_START = 3
 
 
 def notify(*args, **kwargs):
@@ -8,3 +14,30 @@ def notify(*args, **kwargs):
         systemd.daemon.notify(*args, **kwargs)
     except ImportError:
         logging.info('Ignoring daemon notification due to missing systemd module')
+
+
+def listen_sockets():
+    """
+    Returns the sockets passed by systemd through socket activation, as list of (name, socket) tuples. The
+    names come from `FileDescriptorName=` in the socket unit and default to "unknown". Implements the
+    protocol from sd_listen_fds(3) without requiring the systemd module.
+    """
+
+    try:
+        if int(os.environ['LISTEN_PID']) != os.getpid():
+            return []
+        fd_count = int(os.environ['LISTEN_FDS'])
+    except (KeyError, ValueError):
+        return []
+
+    names = os.environ.get('LISTEN_FDNAMES', '').split(':')
+    # Do not pass the sockets on to child processes
+    for var in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+        os.environ.pop(var, None)
+
+    sockets = []
+    for i in range(fd_count):
+        name = names[i] if i < len(names) and names[i] else 'unknown'
+        sockets.append((name, socket.socket(fileno=SD_LISTEN_FDS_START + i)))
+
+    return sockets
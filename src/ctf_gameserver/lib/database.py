@@ -84,6 +84,9 @@ def _translate_operation(operation):
     # "LOCK TABLE"
     if operation.startswith('LOCK TABLE'):
         return ''
+    # Same for PostgreSQL's asynchronous notifications
+    if operation.startswith('NOTIFY'):
+        return ''
 
     # The placeholder is always "%s" in Psycopg2, "even if a different placeholder (such as a %d for
     # integers or %f for floats) may look more appropriate"
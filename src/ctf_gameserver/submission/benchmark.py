@@ -0,0 +1,521 @@
+"""
+Load generator and latency benchmark for the Submission server.
+
+Starts a server process against a generated database fixture (a temporary SQLite database or a dedicated,
+empty local PostgreSQL database) and submits flags from many concurrent simulated team connections. Every
+team connects from its own loopback address, 127.0.<net number>.1.
+
+Run as `python3 -m ctf_gameserver.submission.benchmark`.
+"""
+
+import argparse
+import asyncio
+from collections import deque
+import datetime
+import logging
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+import timeit
+
+import prometheus_client
+import psycopg2
+
+import ctf_gameserver.lib.flag as flag_lib
+from ctf_gameserver.lib.database import transaction_cursor
+
+from . import eventloop
+from .metrics import make_metrics
+from .pool import ConnectionPool
+from .submission import default_params, serve
+
+
+FLAG_SECRET = b'benchmark'
+FLAG_PREFIX = 'BENCH_'
+TEAM_REGEX = r'^127\.0\.(\d+)\.\d+$'
+
+CURRENT_TICK = 10
+VALID_TICKS = 5
+
+# Types of submissions which can be generated
+SUBMISSION_KINDS = ['valid', 'dup', 'expired', 'own', 'invalid']
+RESPONSE_CLASSES = ['OK', 'DUP', 'OLD', 'OWN', 'INV', 'ERR']
+
+# Just the tables and columns used by the Submission server, compatible with SQLite and PostgreSQL
+SCHEMA = [
+    'CREATE TABLE scoring_gamecontrol (competition_name VARCHAR(100), flag_prefix VARCHAR(20),'
+    '    start TIMESTAMP, "end" TIMESTAMP, current_tick INTEGER, valid_ticks INTEGER)',
+    'CREATE TABLE registration_team (user_id INTEGER PRIMARY KEY, net_number INTEGER, nop_team BOOLEAN)',
+    'CREATE TABLE scoring_service (id INTEGER PRIMARY KEY, slug VARCHAR(30))',
+    'CREATE TABLE scoring_flag (id INTEGER PRIMARY KEY, service_id INTEGER, tick INTEGER)',
+    'CREATE TABLE scoring_capture (flag_id INTEGER, capturing_team_id INTEGER, timestamp TIMESTAMP,'
+    '    tick INTEGER, UNIQUE (flag_id, capturing_team_id))'
+]
+TABLES = ['scoring_gamecontrol', 'registration_team', 'scoring_service', 'scoring_flag', 'scoring_capture']
+
+
+def main():
+
+    arg_parser = argparse.ArgumentParser(description='CTF Gameserver Submission Server Benchmark')
+    arg_parser.add_argument('--listen', default='127.0.0.1:6666',
+                            help='Address and port for the server to listen on (default: 127.0.0.1:6666)')
+    arg_parser.add_argument('--teams', type=int, default=50, help='Number of teams (default: 50)')
+    arg_parser.add_argument('--flags-per-team', type=int, default=100,
+                            help='Number of valid flags protected by every team (default: 100)')
+    arg_parser.add_argument('--connections', type=int, default=100,
+                            help='Number of concurrent client connections, distributed among the teams '
+                            '(default: 100)')
+    arg_parser.add_argument('--submissions', type=int, default=1000,
+                            help='Number of flags to submit per connection (default: 1000)')
+    arg_parser.add_argument('--pipeline-depth', type=int, default=1,
+                            help='Number of flags a client submits without waiting for the responses '
+                            '(default: 1)')
+    arg_parser.add_argument('--mix', default='valid=60,dup=20,expired=5,own=5,invalid=10',
+                            help='Relative weights of the kinds of submitted flags '
+                            '(default: valid=60,dup=20,expired=5,own=5,invalid=10)')
+    arg_parser.add_argument('--seed', type=int, default=0, help='Seed for generating the flags (default: 0)')
+    arg_parser.add_argument('--event-loops', default='asyncio',
+                            help='Comma-separated event loop implementations for the server (from '
+                            f'{", ".join(eventloop.EVENT_LOOPS)}), which all get benchmarked with the same '
+                            'load for comparison (default: asyncio)')
+    arg_parser.add_argument('--dbhost', help='Hostname of the PostgreSQL database')
+    arg_parser.add_argument('--dbname', help='Name of a dedicated, empty PostgreSQL database to use instead '
+                            'of SQLite, the benchmark tables get dropped afterwards')
+    arg_parser.add_argument('--dbuser', help='User name for PostgreSQL database access')
+    arg_parser.add_argument('--dbpassword', help='Password for PostgreSQL database access if needed')
+    arg_parser.add_argument('--dbconnections', type=int, default=4,
+                            help='Number of database connections for the server, always 1 with SQLite '
+                            '(default: 4)')
+    arg_parser.add_argument('--flag-verification', action='store_true',
+                            help='Only compare the speed of FlagVerifier with plain flag verification, '
+                            'without running a server')
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.WARNING)
+
+    if args.flag_verification:
+        print(format_verification_comparison(compare_flag_verification()))
+        return os.EX_OK
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError:
+        logging.error('Mix must be specified as "<kind>=<weight>,...", with kinds from %s',
+                      ', '.join(SUBMISSION_KINDS))
+        return os.EX_USAGE
+
+    if not 2 <= args.teams <= 255:
+        logging.error('Number of teams must be between 2 and 255')
+        return os.EX_USAGE
+
+    event_loops = [name.strip() for name in args.event_loops.split(',')]
+    for name in event_loops:
+        if name not in eventloop.EVENT_LOOPS:
+            logging.error('Event loops must be from %s', ', '.join(eventloop.EVENT_LOOPS))
+            return os.EX_USAGE
+        if not eventloop.is_available(name):
+            logging.error('Event loop %s is not installed', name)
+            return os.EX_USAGE
+
+    host, port = args.listen.rsplit(':', 1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.dbname is None:
+            sqlite_path = os.path.join(temp_dir, 'benchmark.sqlite3')
+            connect_db = sqlite_connector(sqlite_path)
+            db_connections = 1
+        else:
+            connect_db = postgresql_connector(args.dbhost, args.dbname, args.dbuser, args.dbpassword)
+            db_connections = args.dbconnections
+
+        runs = []
+        for name in event_loops:
+            results, elapsed = run_benchmark(connect_db, db_connections, host, int(port), {
+                'teams': args.teams,
+                'flags_per_team': args.flags_per_team,
+                'connections': args.connections,
+                'submissions': args.submissions,
+                'pipeline_depth': args.pipeline_depth,
+                'mix': mix,
+                'seed': args.seed,
+                'event_loop': name
+            })
+            runs.append((name, results, elapsed))
+
+    for name, results, elapsed in runs:
+        if len(runs) > 1:
+            print(f'== {name} ==')
+        print(format_report(results, elapsed))
+        print()
+    if len(runs) > 1:
+        print(format_comparison(runs))
+
+    return os.EX_OK
+
+
+def parse_mix(text):
+    """
+    Parses a mix specification like "valid=60,invalid=40" into a dict of weights by submission kind.
+    """
+
+    mix = {}
+
+    for item in text.split(','):
+        kind, weight = item.split('=')
+        kind = kind.strip()
+        if kind not in SUBMISSION_KINDS:
+            raise ValueError(f'Unknown submission kind "{kind}"')
+        mix[kind] = float(weight)
+
+    if sum(mix.values()) <= 0:
+        raise ValueError('Weights must not all be zero')
+
+    return mix
+
+
+def run_benchmark(connect_db, db_connections, host, port, options):
+    """
+    Creates the fixture, starts the server in a separate process and runs the load against it.
+
+    Args:
+        connect_db: Function returning a new connection to the (empty) benchmark database.
+        db_connections: Number of database connections for the server.
+        options: Dict with the keys "teams", "flags_per_team", "connections", "submissions",
+                 "pipeline_depth", "mix", "seed" and "event_loop" (the server's implementation).
+
+    Returns:
+        A tuple of (results, elapsed_seconds), where `results` is a dict mapping response classes to lists of
+        latencies in seconds.
+    """
+
+    db_conn = connect_db()
+    create_fixture(db_conn, options['teams'], options['flags_per_team'])
+    db_conn.close()
+
+    # Forked instead of spawned because `connect_db` may be a closure
+    context = multiprocessing.get_context('fork')
+    server = context.Process(target=_run_server, args=(connect_db, db_connections, host, port,
+                                                       options['event_loop']))
+    server.start()
+
+    try:
+        plans = make_plans(options)
+        return asyncio.run(run_load(host, port, plans, options['pipeline_depth']))
+    finally:
+        server.terminate()
+        server.join()
+
+        db_conn = connect_db()
+        with transaction_cursor(db_conn) as cursor:
+            for table in TABLES:
+                cursor.execute(f'DROP TABLE {table}')    # nosec
+        db_conn.close()
+
+
+def create_fixture(db_conn, team_count, flags_per_team):
+    """
+    Creates the tables and game state for a running competition with the given number of teams, whose net
+    numbers and team IDs both go from 1 to `team_count`. All flags belong to a single service.
+    """
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    with transaction_cursor(db_conn) as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+
+        cursor.execute('INSERT INTO scoring_gamecontrol (competition_name, flag_prefix, start, "end",'
+                       '                                 current_tick, valid_ticks)'
+                       '    VALUES (%s, %s, %s, %s, %s, %s)',
+                       ('Benchmark CTF', FLAG_PREFIX, now - datetime.timedelta(hours=1),
+                        now + datetime.timedelta(days=1), CURRENT_TICK, VALID_TICKS))
+        cursor.executemany('INSERT INTO registration_team (user_id, net_number, nop_team)'
+                           '    VALUES (%s, %s, false)', [(net_no, net_no) for net_no in
+                                                          range(1, team_count+1)])
+        cursor.execute("INSERT INTO scoring_service (id, slug) VALUES (1, 'bench')")
+        cursor.executemany('INSERT INTO scoring_flag (id, service_id, tick) VALUES (%s, 1, %s)',
+                           [(flag_id, CURRENT_TICK) for flag_id in range(1, team_count*flags_per_team+1)])
+
+
+def make_plans(options):
+    """
+    Generates the flags to submit for every client connection.
+
+    Returns:
+        A list of (net_no, flags) tuples, with one item per connection and `flags` as list of bytes.
+    """
+
+    rng = random.Random(options['seed'])
+    team_count = options['teams']
+    flags_per_team = options['flags_per_team']
+    kinds = list(options['mix'].keys())
+    weights = list(options['mix'].values())
+
+    valid_expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    expired_expiration = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)
+
+    def gen_flag(flag_no, protecting_net_no, expiration=valid_expiration):
+        # Flag IDs are unique across all teams
+        flag_id = (protecting_net_no - 1) * flags_per_team + flag_no + 1
+        return flag_lib.generate(expiration, flag_id, protecting_net_no, FLAG_SECRET,
+                                 FLAG_PREFIX).encode('ascii')
+
+    plans = []
+
+    for conn_no in range(options['connections']):
+        net_no = conn_no % team_count + 1
+        others = [n for n in range(1, team_count+1) if n != net_no]
+        submitted = []
+        flags = []
+
+        for kind in rng.choices(kinds, weights, k=options['submissions']):
+            if kind == 'dup' and submitted:
+                flags.append(rng.choice(submitted))
+            elif kind == 'expired':
+                flags.append(gen_flag(rng.randrange(flags_per_team), rng.choice(others), expired_expiration))
+            elif kind == 'own':
+                flags.append(gen_flag(rng.randrange(flags_per_team), net_no))
+            elif kind == 'invalid':
+                # Valid format, but wrong MAC
+                flag = gen_flag(rng.randrange(flags_per_team), rng.choice(others))
+                flags.append(flag[:-2] + (b'AA' if flag[-2:] != b'AA' else b'BB'))
+            else:
+                # Might still be a duplicate if the flag has been chosen before
+                flag = gen_flag(rng.randrange(flags_per_team), rng.choice(others))
+                submitted.append(flag)
+                flags.append(flag)
+
+        plans.append((net_no, flags))
+
+    return plans
+
+
+async def run_load(host, port, plans, pipeline_depth):
+    """
+    Runs one client connection per plan from make_plans() concurrently.
+
+    Returns:
+        A tuple of (results, elapsed_seconds) like run_benchmark().
+    """
+
+    await _wait_for_server(host, port)
+
+    start_time = time.monotonic()
+    client_results = await asyncio.gather(*(
+        _run_client(host, port, f'127.0.{net_no}.1', flags, pipeline_depth) for net_no, flags in plans
+    ))
+    elapsed = time.monotonic() - start_time
+
+    results = {response_class: [] for response_class in RESPONSE_CLASSES}
+    for client_result in client_results:
+        for response_class, latency in client_result:
+            results.setdefault(response_class, []).append(latency)
+
+    return (results, elapsed)
+
+
+async def _wait_for_server(host, port):
+
+    for _ in range(100):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(0.1)
+        else:
+            await reader.readuntil(b'\n\n')
+            writer.close()
+            return
+
+    raise Exception('Server did not start')
+
+
+async def _run_client(host, port, source_addr, flags, pipeline_depth):
+    """
+    Submits the given flags over a single connection, with at most `pipeline_depth` flags awaiting their
+    response at any time.
+
+    Returns:
+        A list of (response_class, latency_seconds) tuples.
+    """
+
+    reader, writer = await asyncio.open_connection(host, port, local_addr=(source_addr, 0))
+    await reader.readuntil(b'\n\n')
+
+    window = asyncio.Semaphore(pipeline_depth)
+    send_times = deque()
+    results = []
+
+    async def send():
+        for flag in flags:
+            await window.acquire()
+            send_times.append(time.monotonic())
+            writer.write(flag + b'\n')
+            await writer.drain()
+
+    send_task = asyncio.create_task(send())
+
+    for _ in flags:
+        response = await reader.readline()
+        latency = time.monotonic() - send_times.popleft()
+        window.release()
+
+        try:
+            response_class = response.rstrip(b'\n').split(b' ')[1].decode('ascii')
+        except IndexError:
+            response_class = 'ERR'
+        results.append((response_class, latency))
+
+    await send_task
+    writer.close()
+
+    return results
+
+
+def _run_server(connect_db, db_connections, host, port, event_loop):
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    db_pool = ConnectionPool([connect_db() for _ in range(db_connections)], connect_db)
+
+    eventloop.run(serve(host, port, db_pool, {
+        **default_params(),
+        'flag_secret': FLAG_SECRET,
+        'team_regex': re.compile(TEAM_REGEX),
+        'competition_name': 'Benchmark CTF',
+        'flag_prefix': FLAG_PREFIX,
+        'log_summary_interval': 0,
+        'listen_backlog': 1024,
+        'metrics': make_metrics(prometheus_client.CollectorRegistry())
+    }), event_loop)
+
+
+def sqlite_connector(path):
+
+    def connect():
+        # Same setup as for the tests, see `ctf_gameserver.lib.test_util`
+        return sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                               isolation_level='')
+
+    return connect
+
+
+def postgresql_connector(host, dbname, user, password):
+
+    def connect():
+        db_conn = psycopg2.connect(host=host, database=dbname, user=user, password=password)
+        with transaction_cursor(db_conn) as cursor:
+            cursor.execute('SET TIME ZONE "UTC"')
+        return db_conn
+
+    return connect
+
+
+def percentile(sorted_values, percent):
+    """
+    Returns the given percentile from a sorted list using the nearest-rank method.
+    """
+
+    if not sorted_values:
+        return None
+
+    rank = max(int(len(sorted_values) * percent / 100 + 0.5), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def format_report(results, elapsed):
+
+    total = sum(len(latencies) for latencies in results.values())
+    lines = [
+        f'{total} responses in {elapsed:.2f} s, {total / elapsed:.0f} flags/s',
+        '',
+        f'{"Class":<6} {"Count":>8} {"p50 [ms]":>10} {"p95 [ms]":>10} {"p99 [ms]":>10}'
+    ]
+
+    for response_class, latencies in results.items():
+        if not latencies:
+            continue
+        latencies = sorted(latencies)
+        percentiles = [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+        lines.append(f'{response_class:<6} {len(latencies):>8} ' +
+                     ' '.join(f'{p:>10.2f}' for p in percentiles))
+
+    return '\n'.join(lines)
+
+
+def format_comparison(runs):
+    """
+    Compares throughput and latency of multiple runs with the first one.
+
+    Args:
+        runs: List of (event_loop, results, elapsed_seconds) tuples.
+    """
+
+    def summarize(results, elapsed):
+        latencies = sorted(latency for class_latencies in results.values() for latency in class_latencies)
+        return (len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99))
+
+    base_throughput, _, _ = summarize(*runs[0][1:])
+    lines = [f'{"Loop":<10} {"Flags/s":>10} {"Speedup":>8} {"p50 [ms]":>10} {"p99 [ms]":>10}']
+
+    for name, results, elapsed in runs:
+        throughput, p50, p99 = summarize(results, elapsed)
+        lines.append(f'{name:<10} {throughput:>10.0f} {throughput / base_throughput:>7.2f}x '
+                     f'{p50 * 1000:>10.2f} {p99 * 1000:>10.2f}')
+
+    return '\n'.join(lines)
+
+
+def compare_flag_verification(flag_count=500, repeat=5):
+    """
+    Measures the time for verifying batches of valid flags and of valid flags mixed with typical junk, once
+    individually through `flag_lib.verify()` and once through `FlagVerifier.verify_many()`.
+
+    Returns:
+        A list of (batch_name, plain_seconds, verifier_seconds) tuples.
+    """
+
+    expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    valid_flags = [flag_lib.generate(expiration, i, i % 100, FLAG_SECRET, FLAG_PREFIX)
+                   for i in range(flag_count)]
+    # Typical junk submitted by teams
+    invalid_flags = ['', FLAG_PREFIX, FLAG_PREFIX + 'Q1RGLRmVnOVTRVJBRV9tRpcBKDN', 'test']
+    invalid_flags *= flag_count // len(invalid_flags)
+    verifier = flag_lib.FlagVerifier(FLAG_SECRET, FLAG_PREFIX)
+
+    def verify_each(flags):
+        for flag in flags:
+            try:
+                flag_lib.verify(flag, FLAG_SECRET, FLAG_PREFIX)
+            except flag_lib.FlagVerificationError:
+                pass
+
+    def measure(func):
+        return min(timeit.repeat(func, number=5, repeat=repeat))
+
+    comparison = []
+    for name, flags in [('valid', valid_flags), ('mixed', valid_flags + invalid_flags)]:
+        comparison.append((name, measure(lambda flags=flags: verify_each(flags)),
+                           measure(lambda flags=flags: verifier.verify_many(flags))))
+
+    return comparison
+
+
+def format_verification_comparison(comparison):
+
+    lines = [f'{"Flags":<6} {"verify() [ms]":>14} {"FlagVerifier [ms]":>18} {"Speedup":>8}']
+
+    for name, plain_seconds, verifier_seconds in comparison:
+        lines.append(f'{name:<6} {plain_seconds * 1000:>14.2f} {verifier_seconds * 1000:>18.2f} '
+                     f'{plain_seconds / verifier_seconds:>7.2f}x')
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import asyncio
+import datetime
+import logging
+import sqlite3
+
+import psycopg2
+
+from . import database
+
+
+class DuplicateIndex:
+    """
+    In-process index of captures for flags which might still be valid, used to answer duplicate submissions
+    without accessing the database.
+    Captures are stored in one set of (flag_id, capturing_team_id) pairs per tick of capture. A flag captured
+    in some tick cannot have been created earlier than `valid_ticks` before it, so whole ticks can be dropped
+    once these flags have expired.
+    The index is only an optimization: Captures missing from it still get detected as duplicates through the
+    database.
+    """
+
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self._captures_by_tick = {}
+
+    async def load(self, db_pool):
+        """
+        Populates the index with the relevant captures from the database.
+        """
+
+        captures = await db_pool.run(database.get_captures, self._min_tick())
+        for flag_id, team_id, tick in captures:
+            self.add(flag_id, team_id, tick)
+
+    def contains(self, flag_id, capturing_team_id):
+        for captures in self._captures_by_tick.values():
+            if (flag_id, capturing_team_id) in captures:
+                return True
+        return False
+
+    def add(self, flag_id, capturing_team_id, tick):
+        try:
+            captures = self._captures_by_tick[tick]
+        except KeyError:
+            self._expire()
+            captures = set()
+            self._captures_by_tick[tick] = captures
+
+        captures.add((flag_id, capturing_team_id))
+
+    def __len__(self):
+        return sum(len(captures) for captures in self._captures_by_tick.values())
+
+    def _min_tick(self):
+        return self.game_state.current_tick - self.game_state.valid_ticks + 1
+
+    def _expire(self):
+        min_tick = self._min_tick()
+        for tick in list(self._captures_by_tick.keys()):
+            if tick < min_tick:
+                del self._captures_by_tick[tick]
+
+
+class CaptureBatcher:
+    """
+    Group commit for captures: Collects the captures from all client connections for a short time window and
+    then stores them in the database all at once, using a single transaction and statement.
+    With a CaptureJournal, batches get stored there instead while the database is failing or too slow. Such
+    captures can only be checked for duplicates against the DuplicateIndex, so duplicates which are only
+    known to the database get answered as new captures (but will not be stored twice).
+    """
+
+    def __init__(self, db_pool, window_seconds, max_size, dup_index, journal=None, db_timeout=None):
+        """
+        Args:
+            db_pool: ConnectionPool to use for storing the captures.
+            window_seconds: Maximum time to wait for further captures after the first one of a batch.
+            max_size: Number of captures after which a batch gets stored without waiting any longer.
+            dup_index: DuplicateIndex to answer duplicate submissions from and to record new captures in.
+            journal: Optional CaptureJournal to fall back to if the database is unavailable.
+            db_timeout: Time in seconds after which to fall back to the journal if the database has not
+                        stored a batch yet, only used with a journal.
+        """
+
+        self.db_pool = db_pool
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self.dup_index = dup_index
+        self.journal = journal
+        self.db_timeout = db_timeout
+
+        # List of ((flag_id, capturing_team_id, tick), future) tuples
+        self._pending = []
+        self._flush_timer = None
+        # Keep references to running tasks, see https://docs.python.org/3/library/asyncio-task.html
+        self._flush_tasks = set()
+
+    async def add(self, flag_id, capturing_team_id, tick):
+        """
+        Stores a capture of the given flag by the given team in the given tick with the next batch. Only
+        returns once the batch has been committed. Raises the exception database.add_captures() reports for
+        the individual capture, i.e. DuplicateCapture.
+        """
+
+        if self.dup_index.contains(flag_id, capturing_team_id):
+            raise database.DuplicateCapture()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((flag_id, capturing_team_id, tick), future))
+
+        if len(self._pending) >= self.max_size:
+            self._start_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.window_seconds, self._start_flush)
+
+        return await future
+
+    async def flush(self):
+        """
+        Immediately stores all pending captures and waits for all batches to be committed.
+        """
+
+        self._start_flush()
+        if len(self._flush_tasks) > 0:
+            await asyncio.wait(self._flush_tasks)
+
+    def _start_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        if len(self._pending) == 0:
+            return
+
+        batch = self._pending
+        self._pending = []
+
+        task = asyncio.create_task(self._store_batch(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _store_batch(self, batch):
+        if self.journal is not None and not self.journal.db_available:
+            await self._journal_batch(batch, None)
+            return
+
+        try:
+            store_coro = self.db_pool.run(database.add_captures, [capture for capture, _ in batch])
+            if self.journal is not None:
+                store_coro = asyncio.wait_for(store_coro, self.db_timeout)
+            results = await store_coro
+        except (psycopg2.Error, sqlite3.Error, asyncio.TimeoutError) as e:
+            if self.journal is not None:
+                logging.warning('Could not store captures in database, using journal until it is available '
+                                'again: %s', repr(e))
+                self.journal.db_available = False
+                await self._journal_batch(batch, e)
+            else:
+                self._fail_batch(batch, e)
+            return
+        except Exception as e:    # pylint: disable=broad-except
+            self._fail_batch(batch, e)
+            return
+
+        for ((flag_id, team_id, tick), future), result in zip(batch, results):
+            # For duplicates, we don't know the tick of the original capture, but the current one is a safe
+            # choice for expiry from the index
+            self.dup_index.add(flag_id, team_id, tick)
+
+            # Future might have been cancelled because its connection got closed
+            if future.done():
+                continue
+            if result is None:
+                future.set_result(None)
+            else:
+                future.set_exception(result)
+
+    async def _journal_batch(self, batch, db_error):
+        """
+        Stores a batch in the journal. If that fails as well, the batch fails with the original database
+        error (if any).
+        """
+
+        timestamp = datetime.datetime.now(datetime.timezone.utc)
+        entries = []
+        results = []
+        batch_keys = set()
+
+        for flag_id, team_id, tick in (capture for capture, _ in batch):
+            if (flag_id, team_id) in batch_keys or self.dup_index.contains(flag_id, team_id):
+                results.append(database.DuplicateCapture())
+            else:
+                batch_keys.add((flag_id, team_id))
+                entries.append((flag_id, team_id, tick, timestamp))
+                results.append(None)
+
+        try:
+            await self.journal.append(entries)
+        except OSError as e:
+            logging.error('Could not write captures to journal: %s', e)
+            self._fail_batch(batch, db_error if db_error is not None else e)
+            return
+
+        for flag_id, team_id, tick, _ in entries:
+            self.dup_index.add(flag_id, team_id, tick)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result is None:
+                future.set_result(None)
+            else:
+                future.set_exception(result)
+
+    @staticmethod
+    def _fail_batch(batch, error):
+        # Let every waiting connection handle the error by itself
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
@@ -1,8 +1,3 @@
-import sqlite3
-
-# See https://github.com/PyCQA/pylint/issues/2948 for Pylint behavior
-from psycopg2.errors import UniqueViolation    # pylint: disable=no-name-in-module
-
 from ctf_gameserver.lib.database import transaction_cursor
 from ctf_gameserver.lib.date_time import ensure_utc_aware
 from ctf_gameserver.lib.exceptions import DBDataError
@@ -25,68 +20,122 @@ def get_static_info(db_conn):
 
 def get_dynamic_info(db_conn):
     """
-    Returns the competition's start and end time, as stored in the database.
+    Returns the competition's start and end time, its current tick and the number of ticks for which flags
+    are valid, as stored in the database.
     """
 
     with transaction_cursor(db_conn) as cursor:
-        cursor.execute('SELECT start, "end" FROM scoring_gamecontrol')
+        cursor.execute('SELECT start, "end", current_tick, valid_ticks FROM scoring_gamecontrol')
         result = cursor.fetchone()
 
     if result is None:
         raise DBDataError('Game control information has not been configured')
 
-    return (ensure_utc_aware(result[0]), ensure_utc_aware(result[1]))
+    return (ensure_utc_aware(result[0]), ensure_utc_aware(result[1]), result[2], result[3])
 
 
-def team_is_nop(db_conn, team_net_no):
+def get_teams(db_conn):
     """
-    Returns whether the team with the given net number is marked as NOP team.
+    Returns the ID and NOP status of all teams, as a dict mapping from their net number to tuples of
+    (team_id, nop_team).
     """
 
     with transaction_cursor(db_conn) as cursor:
-        cursor.execute('SELECT nop_team FROM registration_team WHERE net_number = %s', (team_net_no,))
-        result = cursor.fetchone()
+        cursor.execute('SELECT net_number, user_id, nop_team FROM registration_team'
+                       '    WHERE net_number IS NOT NULL')
+        result = cursor.fetchall()
 
-    if result is None:
-        return False
+    return {net_no: (team_id, bool(nop_team)) for net_no, team_id, nop_team in result}
 
-    return result[0]
 
+def get_flag_services(db_conn, min_tick):
+    """
+    Returns the protected service for all flags from the given tick or later, as list of (flag_id, tick,
+    service_slug) tuples.
+    """
+
+    with transaction_cursor(db_conn) as cursor:
+        cursor.execute('SELECT flag.id, flag.tick, service.slug'
+                       '    FROM scoring_flag flag, scoring_service service'
+                       '    WHERE flag.service_id = service.id AND flag.tick >= %s', (min_tick,))
+        result = cursor.fetchall()
 
-def add_capture(db_conn, flag_id, capturing_team_net_no, prohibit_changes=False, fake_team_id=None,
-                fake_tick=None):
+    return result
+
+
+def get_captures(db_conn, min_tick):
     """
-    Stores a capture of the given flag by the given team in the database.
+    Returns all captures from the given tick or later as list of (flag_id, capturing_team_id, tick) tuples.
     """
 
+    with transaction_cursor(db_conn) as cursor:
+        cursor.execute('SELECT flag_id, capturing_team_id, tick FROM scoring_capture WHERE tick >= %s',
+                       (min_tick,))
+        result = cursor.fetchall()
+
+    return result
+
+
+def add_captures(db_conn, captures, prohibit_changes=False):
+    """
+    Stores multiple captures in the database within a single transaction, using one multi-row INSERT
+    statement.
+
+    Args:
+        captures: List of (flag_id, capturing_team_id, tick) tuples
+
+    Returns:
+        A list with one entry per capture in `captures`. The entry is None if the capture has been stored and
+        an instance of DuplicateCapture otherwise.
+    """
+
+    results = [None] * len(captures)
+
+    # Index of the first occurrence for every (flag_id, capturing_team_id) pair in this batch
+    row_indexes = {}
+    for i, (flag_id, team_id, _) in enumerate(captures):
+        if (flag_id, team_id) in row_indexes:
+            results[i] = DuplicateCapture()
+        else:
+            row_indexes[(flag_id, team_id)] = i
+
+    # Concurrent batches (from other connections or worker processes) must lock the unique index entries in
+    # the same order, otherwise they can deadlock on overlapping captures
+    params = []
+    for flag_id, team_id in sorted(row_indexes):
+        params += [flag_id, team_id, captures[row_indexes[(flag_id, team_id)]][2]]
+
     with transaction_cursor(db_conn, prohibit_changes) as cursor:
-        cursor.execute('SELECT user_id FROM registration_team WHERE net_number = %s',
-                       (capturing_team_net_no,))
-        result = cursor.fetchone()
-        if fake_team_id is not None:
-            result = (fake_team_id,)
-        if result is None:
-            raise TeamNotExisting()
-        capturing_team_id = result[0]
+        # Duplicates get detected per row through the unique constraint on (flag_id, capturing_team_id)
+        cursor.execute('INSERT INTO scoring_capture (flag_id, capturing_team_id, timestamp, tick)'    # nosec
+                       '    VALUES {}'
+                       '    ON CONFLICT (flag_id, capturing_team_id) DO NOTHING'
+                       '    RETURNING flag_id, capturing_team_id'.format(
+                           ', '.join(['(%s, %s, NOW(), %s)'] * len(row_indexes))
+                       ), params)
+        inserted = set(cursor.fetchall())
 
-        cursor.execute('SELECT current_tick FROM scoring_gamecontrol')
-        result = cursor.fetchone()
-        if fake_tick is not None:
-            result = (fake_tick,)
-        tick = result[0]
+    for key, i in row_indexes.items():
+        if key not in inserted:
+            results[i] = DuplicateCapture()
 
-        try:
-            cursor.execute('INSERT INTO scoring_capture (flag_id, capturing_team_id, timestamp, tick)'
-                           '    VALUES (%s, %s, NOW(), %s)', (flag_id, capturing_team_id, tick))
-        except (UniqueViolation, sqlite3.IntegrityError):
-            raise DuplicateCapture() from None
+    return results
 
 
-class TeamNotExisting(DBDataError):
+def replay_captures(db_conn, captures):
     """
-    Indicates that a Team for the given parameters could not be found in the database.
+    Stores captures with their original tick and timestamp, silently skipping the ones which already exist.
+    This makes it safe to store the same captures multiple times.
+
+    Args:
+        captures: List of (flag_id, capturing_team_id, tick, timestamp) tuples
     """
 
+    with transaction_cursor(db_conn) as cursor:
+        cursor.executemany('INSERT INTO scoring_capture (flag_id, capturing_team_id, tick, timestamp)'
+                           '    VALUES (%s, %s, %s, %s)'
+                           '    ON CONFLICT (flag_id, capturing_team_id) DO NOTHING', captures)
+
 
 class DuplicateCapture(DBDataError):
     """
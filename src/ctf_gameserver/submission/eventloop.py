@@ -0,0 +1,68 @@
+"""
+Choice of the event loop implementation and tuning of client sockets.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import socket
+
+
+EVENT_LOOPS = ['asyncio', 'uvloop']
+
+
+def get_loop_factory(name):
+    """
+    Returns a function creating a new event loop of the given implementation, as expected by
+    asyncio.Runner(). uvloop is optional, without it this falls back to asyncio's default loop.
+    """
+
+    if name == 'uvloop':
+        try:
+            # pylint: disable=import-outside-toplevel,import-error
+            import uvloop
+        except ImportError:
+            logging.warning('uvloop module is not installed, using the default asyncio event loop instead')
+        else:
+            return uvloop.new_event_loop
+    elif name != 'asyncio':
+        raise ValueError(f'Unknown event loop "{name}"')
+
+    # asyncio.Runner() creates the default loop for None
+    return None
+
+
+def is_available(name):
+    """
+    Returns whether the given event loop implementation is installed.
+    """
+
+    return name == 'asyncio' or importlib.util.find_spec(name) is not None
+
+
+def run(coro, loop_name):
+    """
+    Runs a coroutine to completion like asyncio.run(), on a new event loop of the given implementation.
+    """
+
+    with asyncio.Runner(loop_factory=get_loop_factory(loop_name)) as runner:
+        return runner.run(coro)
+
+
+def tune_connection(writer, tcp_nodelay, write_buffer_limit):
+    """
+    Applies socket options and buffer limits to a new client connection.
+
+    Args:
+        writer: StreamWriter of the connection.
+        tcp_nodelay: Whether to disable Nagle's algorithm, so that responses get sent without delay.
+        write_buffer_limit: Number of bytes of pending output above which StreamWriter.drain() blocks, None
+                            for the default.
+    """
+
+    sock = writer.get_extra_info('socket')
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, tcp_nodelay)
+
+    if write_buffer_limit is not None:
+        writer.transport.set_write_buffer_limits(high=write_buffer_limit)
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+
+class VerifiedFlagCache:
+    """
+    Bounded LRU cache of flags which passed MAC verification, keyed by the raw bytes submitted by clients.
+    Popular flags usually get submitted by lots of teams, which then only requires a dictionary lookup
+    instead of decoding and verifying them over and over again.
+    Expiration is still checked on every lookup, so cached flags get rejected once they have expired.
+    """
+
+    def __init__(self, verifier, max_size, metrics):
+        """
+        Args:
+            verifier: FlagVerifier for flags not found in the cache.
+            max_size: Maximum number of cached flags, 0 disables caching.
+            metrics: Metrics dict as returned by make_metrics().
+        """
+
+        self.verifier = verifier
+        self.max_size = max_size
+        self.metrics = metrics
+
+        # Values are (flag_id, protecting_net_no, expiration_timestamp) tuples
+        self._entries = OrderedDict()
+
+    def verify(self, raw_flag, now=None, timer=None):
+        """
+        Verifies a flag like FlagVerifier.verify(), raising its exceptions and additionally
+        UnicodeDecodeError for flags which are not ASCII.
+
+        Args:
+            timer: Optional StageTimer to record the durations of the "decode" and "mac_verify" stages in.
+                   For flags which get rejected, the caller has to record the current stage.
+
+        Returns:
+            Data from the flag as a tuple of (flag_id, protecting_net_no)
+        """
+
+        try:
+            entry = self._entries[raw_flag]
+        except KeyError:
+            self.metrics['flag_cache_misses'].inc()
+            protected_data, flag_mac = self.verifier.parse(raw_flag.decode('ascii'))
+            if timer is not None:
+                timer.lap('decode')
+            entry = self.verifier.check_mac(protected_data, flag_mac)
+            if timer is not None:
+                timer.lap('mac_verify')
+            # Invalid flags do not get cached, to prevent junk from evicting the popular ones
+            self._add(raw_flag, entry)
+        else:
+            self.metrics['flag_cache_hits'].inc()
+            self._entries.move_to_end(raw_flag)
+
+        flag_id, protecting_net_no, expiration_timestamp = entry
+        self.verifier.check_expiration(expiration_timestamp, now, flag_id)
+        if timer is not None:
+            timer.lap('decode')
+
+        return (flag_id, protecting_net_no)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _add(self, raw_flag, entry):
+        if self.max_size == 0:
+            return
+
+        self._entries[raw_flag] = entry
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
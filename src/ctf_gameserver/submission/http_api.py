@@ -0,0 +1,111 @@
+"""
+Minimal HTTP/1.1 implementation for the JSON submission API, just enough for POST requests with a
+Content-Length from typical HTTP clients.
+"""
+
+import asyncio
+from http import HTTPStatus
+import json
+
+
+# Maximum size of the request line plus headers
+MAX_HEAD_SIZE = 8192
+
+
+class HTTPError(Exception):
+    """
+    Indicates that a request cannot be handled, to be answered with the given status code.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+
+    def __init__(self, method, target, version, headers, body):
+        self.method = method
+        self.target = target
+        self.version = version
+        # Names are lowercase
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+async def read_request(reader, max_body_size):
+    """
+    Reads an HTTP request from the given StreamReader.
+
+    Returns:
+        A Request object or None if the connection got closed before a new request started.
+    """
+
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Incomplete request') from None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Request head too large') from None
+    if len(head) > MAX_HEAD_SIZE:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Request head too large')
+
+    request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+    try:
+        method, target, version = request_line.split(' ')
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid request line') from None
+    if version not in ('HTTP/1.0', 'HTTP/1.1'):
+        raise HTTPError(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED, 'Unsupported HTTP version')
+
+    headers = {}
+    for line in header_lines:
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid header line')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'transfer-encoding' in headers:
+        raise HTTPError(HTTPStatus.LENGTH_REQUIRED, 'Chunked requests are not supported')
+    try:
+        content_length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length') from None
+    if content_length < 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length')
+    if content_length > max_body_size:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+
+    try:
+        body = await reader.readexactly(content_length)
+    except asyncio.IncompleteReadError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Incomplete request') from None
+
+    return Request(method, target, version, headers, body)
+
+
+def write_response(writer, status, data, keep_alive):
+    """
+    Writes an HTTP response with `data` serialized as JSON body.
+    """
+
+    body = json.dumps(data).encode('utf-8')
+    status = HTTPStatus(status)
+    connection = 'keep-alive' if keep_alive else 'close'
+
+    head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {connection}\r\n'
+            '\r\n')
+    writer.writelines([head.encode('ascii'), body])
@@ -0,0 +1,169 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import logging
+import os
+
+from . import database
+
+
+# Maximum number of captures to replay into the database within one transaction
+REPLAY_CHUNK_SIZE = 1000
+
+
+class CaptureJournal:
+    """
+    Write-ahead journal for captures which could not be stored in the database, because it is unavailable or
+    too slow. Captures get appended to a local file and are only acknowledged once that has been synced to
+    disk. A background task replays them into the database with their original tick and timestamp.
+    Replaying is idempotent, so captures which did make it into the database after all are no problem.
+    """
+
+    def __init__(self, path, replay_interval, metrics):
+        """
+        Args:
+            path: Path of the journal file, which gets created if it does not exist.
+            replay_interval: Interval in seconds in which to try replaying the journal into the database.
+            metrics: Metrics dict as returned by make_metrics().
+        """
+
+        self.path = path
+        self.replay_interval = replay_interval
+        self.metrics = metrics
+        # Whether captures should be stored in the database right away, reset after failures until the next
+        # successful replay
+        self.db_available = True
+
+        # List of (flag_id, capturing_team_id, tick, timestamp) tuples which have not been replayed yet
+        self._entries = []
+        self._file = None
+        # File operations must be serialized and should not block the event loop
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='capture-journal')
+
+    def open(self):
+        """
+        Opens the journal file, loading captures which have not been replayed in a previous run.
+
+        Returns:
+            The loaded captures as list of (flag_id, capturing_team_id, tick, timestamp) tuples.
+        """
+
+        try:
+            with open(self.path, 'r', encoding='ascii') as journal_file:
+                for line in journal_file:
+                    try:
+                        self._entries.append(_parse_entry(line))
+                    except ValueError:
+                        # Incomplete last line from a crash during writing, that capture was never
+                        # acknowledged
+                        logging.warning('Ignoring invalid capture journal entry %s', repr(line))
+        except FileNotFoundError:
+            pass
+
+        self._file = open(self.path, 'ab')
+        self.metrics['journal_captures'].set(len(self._entries))
+
+        if self._entries:
+            logging.warning('Loaded %d captures from journal, they will be replayed into the database',
+                            len(self._entries))
+            self.db_available = False
+
+        return list(self._entries)
+
+    def close(self):
+        self._executor.shutdown()
+        self._file.close()
+
+    async def append(self, captures):
+        """
+        Durably appends the given (flag_id, capturing_team_id, tick, timestamp) captures to the journal.
+        """
+
+        # Add entries before writing them, so that a concurrent rewrite of the file cannot lose them (it
+        # might store them twice, which is harmless)
+        self._entries.extend(captures)
+        self.metrics['journal_captures'].set(len(self._entries))
+
+        data = ''.join(_format_entry(capture) for capture in captures).encode('ascii')
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._write, data)
+        self.metrics['captures_journaled'].inc(len(captures))
+
+    async def replay(self, db_pool):
+        """
+        Stores all captures from the journal in the database and removes them from the journal.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while self._entries:
+            chunk = self._entries[:REPLAY_CHUNK_SIZE]
+            await db_pool.run(database.replay_captures, chunk)
+
+            # Captures might have been appended in the meantime, but always at the end
+            self._entries = self._entries[len(chunk):]
+            self.metrics['journal_captures'].set(len(self._entries))
+            data = ''.join(_format_entry(capture) for capture in self._entries).encode('ascii')
+            await loop.run_in_executor(self._executor, self._rewrite, data)
+
+            logging.info('Replayed %d captures from journal into the database', len(chunk))
+
+        self.db_available = True
+
+    async def run(self, db_pool):
+        """
+        Coroutine replaying the journal whenever there is something to replay, runs forever.
+        """
+
+        while True:
+            await asyncio.sleep(self.replay_interval)
+
+            if self.db_available and not self._entries:
+                continue
+
+            try:
+                await self.replay(db_pool)
+            except Exception as e:    # pylint: disable=broad-except
+                logging.warning('Could not replay capture journal, retrying later: %s', e)
+
+    def _write(self, data):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _rewrite(self, data):
+        """
+        Atomically replaces the journal file's contents.
+        """
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'ab')
+
+        # Make the rename durable
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _format_entry(capture):
+
+    flag_id, capturing_team_id, tick, timestamp = capture
+    return f'{flag_id} {capturing_team_id} {tick} {timestamp.isoformat()}\n'
+
+
+def _parse_entry(line):
+
+    if not line.endswith('\n'):
+        raise ValueError('Incomplete line')
+
+    flag_id, capturing_team_id, tick, timestamp = line.split()
+    return (int(flag_id), int(capturing_team_id), int(tick), datetime.datetime.fromisoformat(timestamp))
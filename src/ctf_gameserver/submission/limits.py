@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket for rate limiting, which allows bursts of up to one second's worth of tokens. Tokens can be
+    taken even if there are not enough of them, the bucket then tells how long the caller has to wait to
+    settle its debt.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = rate
+
+        self._tokens = rate
+        self._last_refill = time.monotonic()
+
+    def take(self, count):
+        """
+        Takes the given number of tokens and returns the time in seconds until they are actually available.
+        """
+
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+        self._tokens -= count
+        if self._tokens >= 0:
+            return 0
+        return -self._tokens / self.rate
+
+
+class AdmissionControl:
+    """
+    Per-team limits on the rate of submitted flags and on the number of concurrent connections, to keep one
+    team from starving the others. Limits get enforced by delaying, never by rejecting input: Connections
+    over the limit wait for a free slot and flags over the rate do not get processed (and no further input is
+    read) until the team's bucket has enough tokens again.
+    """
+
+    def __init__(self, flag_rate, max_connections, team_metrics):
+        """
+        Args:
+            flag_rate: Maximum number of flags per second per team, 0 for no limit.
+            max_connections: Maximum number of concurrent connections per team, 0 for no limit.
+            team_metrics: TeamMetrics for the per-team metrics.
+        """
+
+        self.flag_rate = flag_rate
+        self.max_connections = max_connections
+        self.team_metrics = team_metrics
+
+        self._buckets = {}
+        self._connection_slots = {}
+
+    async def throttle(self, net_no, flag_count):
+        """
+        Waits until the team with the given net number may submit the given number of flags.
+        """
+
+        if self.flag_rate == 0:
+            return
+
+        try:
+            bucket = self._buckets[net_no]
+        except KeyError:
+            bucket = TokenBucket(self.flag_rate)
+            self._buckets[net_no] = bucket
+
+        delay = bucket.take(flag_count)
+        if delay > 0:
+            self.team_metrics.bind(net_no)['rate_limited_seconds'].inc(delay)
+            await asyncio.sleep(delay)
+
+    @contextlib.asynccontextmanager
+    async def connection_slot(self, net_no):
+        """
+        Asynchronous context manager which waits for one of the connection slots of the team with the given
+        net number to become free and holds it while active.
+        """
+
+        if self.max_connections == 0:
+            yield
+            return
+
+        try:
+            slots = self._connection_slots[net_no]
+        except KeyError:
+            slots = asyncio.Semaphore(self.max_connections)
+            self._connection_slots[net_no] = slots
+
+        waiting = slots.locked()
+        wait_start = time.monotonic()
+        async with slots:
+            if waiting:
+                wait_time = time.monotonic() - wait_start
+                self.team_metrics.bind(net_no)['connection_limited_seconds'].inc(wait_time)
+            yield
+
+
+class LineSplitter:
+    """
+    Splits data received from a client into lines while keeping at most `max_length + 1` bytes of any line
+    in memory. Longer lines get truncated to that size and the rest up to the next newline gets discarded,
+    so callers can recognize them by their length.
+    """
+
+    def __init__(self, max_length):
+        self.max_length = max_length
+
+        # Incomplete line from the previous data
+        self._partial = b''
+
+    def feed(self, data):
+        """
+        Returns the list of lines completed by the given data, without the newlines. Lines may also end with
+        CRLF, as sent by clients like telnet.
+        """
+
+        keep = self.max_length + 1
+        *lines, partial = data.split(b'\n')
+
+        if lines:
+            lines[0] = self._partial + lines[0]
+            lines = [line[:-1] if line.endswith(b'\r') else line for line in lines]
+            lines = [line[:keep] if len(line) > keep else line for line in lines]
+            self._partial = partial[:keep]
+        elif len(self._partial) < keep:
+            self._partial = (self._partial + partial)[:keep]
+
+        return lines
@@ -0,0 +1,154 @@
+import asyncio
+from collections import Counter
+import logging
+import logging.handlers
+import queue
+import random
+
+
+class SubmissionLog:
+    """
+    Logging for the outcomes of submitted flags, which may be way too many to log every single one of them.
+    Outcomes can be sampled by response code and get aggregated into periodic summaries per team. Messages
+    without a response code, such as errors, are always logged.
+    """
+
+    def __init__(self, sample_rates, summary_interval):
+        """
+        Args:
+            sample_rates: Dict mapping response codes to the fraction of flags with that outcome to log
+                          individually. Codes which are not present get logged completely.
+            summary_interval: Interval in seconds for summaries of outcomes per team, 0 to disable them.
+        """
+
+        self.sample_rates = sample_rates
+        self.summary_interval = summary_interval
+
+        # Counters of response codes per team net number
+        self._outcomes = {}
+
+    def log(self, net_no, client_addr, level_name, message, *args, code=None):
+        """
+        Logs a message concerning the client with the given net number and address. Messages with `code` are
+        about the outcome of a single flag and subject to sampling.
+        """
+
+        if code is not None:
+            try:
+                outcomes = self._outcomes[net_no]
+            except KeyError:
+                outcomes = Counter()
+                self._outcomes[net_no] = outcomes
+            outcomes[code] += 1
+
+            sample_rate = self.sample_rates.get(code, 1)
+            if sample_rate < 1 and random.random() >= sample_rate:    # nosec
+                return
+
+        level = logging.getLevelName(level_name)
+        logging.log(level, '%s [%s]: ' + message, net_no, client_addr, *args)
+
+    def log_summaries(self):
+        for net_no, outcomes in sorted(self._outcomes.items()):
+            counts = ', '.join(f'{code}: {count}' for code, count in sorted(outcomes.items()))
+            logging.info('%s: %d flags in the last %d seconds (%s)', net_no, sum(outcomes.values()),
+                         self.summary_interval, counts)
+
+        self._outcomes = {}
+
+    async def run(self):
+        """
+        Coroutine logging the summaries periodically, runs forever.
+        """
+
+        if self.summary_interval == 0:
+            return
+
+        while True:
+            await asyncio.sleep(self.summary_interval)
+            self.log_summaries()
+
+
+def parse_sample_rates(text):
+    """
+    Parses a specification like "DUP=0.01,INV=0.1" into a dict of sample rates by response code.
+    """
+
+    sample_rates = {}
+
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        code, rate = item.split('=')
+        code = code.strip().upper()
+        rate = float(rate)
+        if code == 'ERR':
+            raise ValueError('Errors cannot be sampled')
+        if not 0 <= rate <= 1:
+            raise ValueError('Sample rates must be between 0 and 1')
+        sample_rates[code] = rate
+
+    return sample_rates
+
+
+def start_log_writer(queue_size, metrics):
+    """
+    Moves the actual writing of log records from the calling threads to a separate writer thread. Records
+    are passed through a bounded queue. If it is full, records below WARNING level get dropped, while more
+    severe ones get written synchronously. Records of level ERROR and above are always written synchronously,
+    so they cannot get lost when the process exits right afterwards.
+
+    Returns:
+        A logging.handlers.QueueListener, which must be stopped to flush the queue.
+    """
+
+    root_logger = logging.getLogger()
+    log_queue = queue.Queue(queue_size)
+
+    handlers = list(root_logger.handlers)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(_BoundedQueueHandler(log_queue, handlers, metrics))
+
+    listener.start()
+    return listener
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+
+    def __init__(self, log_queue, handlers, metrics):
+        super().__init__(log_queue)
+        # Handlers of the writer thread, for records which must not be queued
+        self.handlers = handlers
+        self.metrics = metrics
+
+    def prepare(self, record):
+        # Defer formatting to the writer thread, our log arguments are immutable anyway
+        # Tracebacks, however, must be rendered while the exception is still around
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.ERROR:
+            self._write(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self._write(record)
+            else:
+                self.metrics['log_records_dropped'].inc()
+
+    def _write(self, record):
+        """
+        Writes a record from the calling thread, like the writer thread would do.
+        """
+
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
@@ -0,0 +1,316 @@
+"""
+Prometheus metrics of the Submission server.
+"""
+
+from collections import Counter
+import os
+import time
+
+import prometheus_client
+
+
+# Processing stages are way faster than whole submissions, so the default buckets are too coarse
+STAGE_BUCKETS = (.00001, .000025, .00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25,
+                 .5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# Modes for metrics with a "team_net_no" label, see TeamMetrics
+TEAM_METRICS_MODES = ['full', 'top', 'buckets']
+# Label value for teams without series of their own in mode "top"
+OTHER_TEAMS_LABEL = 'other'
+# Per-team counters by response code of the flag
+FLAG_COUNTERS = {
+    'OK': 'flags_ok',
+    'DUP': 'flags_dup',
+    'OLD': 'flags_old',
+    'OWN': 'flags_own',
+    'INV': 'flags_inv',
+    'ERR': 'flags_err'
+}
+
+
+def make_metrics(registry=prometheus_client.REGISTRY):
+
+    metrics = {}
+    metric_prefix = 'ctf_submission_'
+
+    counters = [
+        ('connections', 'Total number of connections', ['team_net_no']),
+        ('http_requests', 'Total number of HTTP API requests with flags', ['team_net_no']),
+        ('flags_ok', 'Number of submitted valid flags', ['team_net_no']),
+        ('flags_dup', 'Number of submitted duplicate flags', ['team_net_no']),
+        ('flags_old', 'Number of submitted expired flags', ['team_net_no']),
+        ('flags_own', 'Number of submitted own flags', ['team_net_no']),
+        ('flags_inv', 'Number of submitted invalid flags', ['team_net_no']),
+        ('flags_err', 'Number of submitted flags which resulted in an error', ['team_net_no']),
+        ('flags', 'Number of submitted flags across all teams by response code', ['code']),
+        ('flags_by_service', 'Number of submitted flags with valid MAC by protected service and response '
+         'code', ['service', 'code']),
+        ('flag_cache_hits', 'Number of submitted flags found in the cache of verified flags', []),
+        ('flag_cache_misses', 'Number of submitted flags which had to be verified cryptographically', []),
+        ('rate_limited_seconds', 'Time for which processing of flags was delayed due to the rate limit in '
+         'seconds', ['team_net_no']),
+        ('connection_limited_seconds', 'Time which connections had to wait due to the connection limit in '
+         'seconds', ['team_net_no']),
+        ('overlong_lines', 'Number of submitted lines exceeding the maximum length', ['team_net_no']),
+        ('write_stalls', 'Number of times processing of input was paused until the client read pending '
+         'responses', ['team_net_no']),
+        ('write_timeouts', 'Number of connections closed because the client did not read responses in time',
+         ['team_net_no']),
+        ('captures_journaled', 'Number of captures stored in the journal instead of the database', []),
+        ('traffic_records_dropped', 'Number of received lines not recorded because writing the recording '
+         'could not keep up', []),
+        ('log_records_dropped', 'Number of log records discarded because the log queue was full', []),
+        ('server_kills', 'Number of times the server was force-restarted due to fatal errors', []),
+        ('unhandled_exceptions', 'Number of unexpected exceptions in client connections', [])
+    ]
+    for name, doc, labels in counters:
+        metrics[name] = prometheus_client.Counter(metric_prefix+name, doc, labels, registry=registry)
+
+    # Last item is the aggregation across worker processes in multi-process mode
+    gauges = [
+        ('start_timestamp', '(Unix) timestamp when the process was started', [], 'max'),
+        ('open_connections', 'Number of currently open connections', ['team_net_no'], 'livesum'),
+        ('journal_captures', 'Number of captures in the journal which have not been stored in the database '
+         'yet', [], 'livesum')
+    ]
+    for name, doc, labels, multiprocess_mode in gauges:
+        metrics[name] = prometheus_client.Gauge(metric_prefix+name, doc, labels, registry=registry,
+                                                multiprocess_mode=multiprocess_mode)
+
+    # Last item are the buckets, None for the defaults
+    histograms = [
+        ('submission_duration', 'Time spent processing a single flag in seconds', [], None),
+        ('stage_duration', 'Time spent in the individual processing stages per batch of flags in seconds',
+         ['stage'], STAGE_BUCKETS)
+    ]
+    for name, doc, labels, buckets in histograms:
+        if buckets is None:
+            buckets = prometheus_client.Histogram.DEFAULT_BUCKETS
+        metrics[name] = prometheus_client.Histogram(metric_prefix+name, doc, labels, registry=registry,
+                                                    buckets=buckets)
+
+    return metrics
+
+
+class StageTimer:
+    """
+    Measures the time spent in the processing stages for a batch of flags, accumulated per stage across the
+    batch. Stages are "decode", "mac_verify", "game_state_check", "nop_check" (including the lookup of the
+    submitting team), "capture_insert" and "response_write".
+    """
+
+    def __init__(self):
+        self._durations = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """
+        Attributes the time since the previous call to lap() or skip() to the given stage.
+        """
+
+        now = time.perf_counter()
+        self._durations[stage] = self._durations.get(stage, 0) + now - self._last
+        self._last = now
+
+    def skip(self):
+        """
+        Discards the time since the previous call to lap() or skip().
+        """
+
+        self._last = time.perf_counter()
+
+    def observe(self, histogram):
+        """
+        Records the duration of every stage which occurred in the batch in the given histogram, which must
+        have a "stage" label.
+        """
+
+        for stage, duration in self._durations.items():
+            histogram.labels(stage).observe(duration)
+
+
+class TeamMetrics:
+    """
+    Provides the children of metrics with a "team_net_no" label. Depending on the mode, there are series
+    for every team ("full"), only for the teams which submitted the most flags while the others get
+    aggregated as "other" ("top") or for ranges of net numbers ("buckets"). Children get created once per
+    label value and then reused, so that connections do not have to look them up for every flag.
+
+    In mode "top", the series of teams which drop out of the top get removed and their connections continue
+    counting as "other". Prometheus_client's multi-process mode cannot remove series though, so they stay
+    exported with their last values there.
+    """
+
+    def __init__(self, metrics, mode='full', size=0, top_refresh_interval=10):
+        """
+        Args:
+            metrics: Metrics dict as returned by make_metrics().
+            mode: One of TEAM_METRICS_MODES.
+            size: Number of teams with series of their own in mode "top", number of net numbers per bucket
+                  in mode "buckets".
+            top_refresh_interval: Time in seconds after which the teams with the most flags get determined
+                                  again in mode "top".
+        """
+
+        if mode not in TEAM_METRICS_MODES:
+            raise ValueError(f'Unknown team metrics mode "{mode}"')
+
+        self.metrics = metrics
+        self.mode = mode
+        self.size = size
+        self.top_refresh_interval = top_refresh_interval
+
+        self._children = {}
+        self._totals = _Children(self._bind_total)
+        # Submitted flags per net number, only used in mode "top"
+        self._volumes = Counter()
+        self._top_teams = set()
+        self._top_refresh_time = None
+
+    def label(self, net_no):
+        """
+        Returns the value of the "team_net_no" label for the given net number.
+        """
+
+        # Unknown teams (-1) always get their own series
+        if self.mode == 'full' or net_no < 0:
+            return net_no
+
+        if self.mode == 'buckets':
+            start = net_no // self.size * self.size
+            return f'{start}-{start + self.size - 1}'
+
+        now = time.monotonic()
+        if self._top_refresh_time is None or now - self._top_refresh_time >= self.top_refresh_interval:
+            top_teams = {top_net_no for top_net_no, _ in self._volumes.most_common(self.size)}
+            for dropped_net_no in self._top_teams - top_teams:
+                self._move_to_other(dropped_net_no)
+            self._top_teams = top_teams
+            self._top_refresh_time = now
+
+        if net_no in self._top_teams:
+            return net_no
+        # Until enough teams have submitted flags, any team can get a series of its own
+        if len(self._top_teams) < self.size:
+            self._top_teams.add(net_no)
+            return net_no
+        return OTHER_TEAMS_LABEL
+
+    def bind(self, net_no):
+        """
+        Returns a BoundTeamMetrics object for a connection of the team with the given net number. The label
+        value gets determined at this point and stays the same for the connection's lifetime.
+        """
+
+        children = self._get_children(self.label(net_no))
+        return BoundTeamMetrics(net_no, children, self._totals, self._volumes)
+
+    def _get_children(self, label):
+
+        try:
+            return self._children[label]
+        except KeyError:
+            children = _Children(lambda name: self.metrics[name].labels(label))
+            self._children[label] = children
+            return children
+
+    def _move_to_other(self, net_no):
+        """
+        Removes the series of a team which dropped out of the top and makes its existing BoundTeamMetrics
+        use the "other" series instead.
+        """
+
+        try:
+            children = self._children.pop(net_no)
+        except KeyError:
+            return
+        other_children = self._get_children(OTHER_TEAMS_LABEL)
+
+        for name, child in children.items():
+            metric = self.metrics[name]
+            if isinstance(metric, prometheus_client.Gauge):
+                # Keep the sum across teams intact for open connections, which get decremented as "other"
+                other_children[name].inc(_get_gauge_value(metric, net_no))
+                child.set(0)
+            if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+                metric.remove(net_no)
+
+        children.rebind(other_children.__getitem__)
+
+    def _bind_total(self, code):
+
+        return self.metrics['flags'].labels(code)
+
+
+class ServiceMetrics:
+    """
+    Provides the children of the metrics with "service" and "code" labels. Like with TeamMetrics, children
+    get created once per label values and then reused.
+    """
+
+    def __init__(self, metrics):
+        self._children = _Children(lambda labels: metrics['flags_by_service'].labels(*labels))
+
+    def count_flag(self, service, code):
+        """
+        Counts a submitted flag protected by the given service with the given response code.
+        """
+
+        self._children[(service, code)].inc()
+
+
+class BoundTeamMetrics:
+    """
+    Children of the per-team metrics for a single team, see TeamMetrics.bind(). Access by metric name like
+    the metrics dict, e.g. `team_metrics['connections'].inc()`.
+    """
+
+    def __init__(self, net_no, children, totals, volumes):
+        self.net_no = net_no
+        self._children = children
+        self._totals = totals
+        self._volumes = volumes
+
+    def __getitem__(self, name):
+        return self._children[name]
+
+    def count_flag(self, code):
+        """
+        Counts a submitted flag with the given response code for the team and in the global totals.
+        """
+
+        self._children[FLAG_COUNTERS[code]].inc()
+        self._totals[code].inc()
+        self._volumes[self.net_no] += 1
+
+
+class _Children(dict):
+    """
+    Dict which creates missing values through the given factory function.
+    """
+
+    def __init__(self, factory):
+        super().__init__()
+        self._factory = factory
+
+    def __missing__(self, key):
+        value = self._factory(key)
+        self[key] = value
+        return value
+
+    def rebind(self, factory):
+        """
+        Discards all values and creates them through the new factory function from now on.
+        """
+
+        self.clear()
+        self._factory = factory
+
+
+def _get_gauge_value(gauge, net_no):
+
+    for sample in gauge.collect()[0].samples:
+        if sample.labels.get('team_net_no') == str(net_no):
+            return sample.value
+
+    return 0
@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+import psycopg2
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of database connections for usage from asyncio code.
+    Psycopg2 does not support asyncio, so the (blocking) functions from the `database` module get executed in
+    a worker thread, with one thread per connection. This way, database work for different client connections
+    happens concurrently and never stalls the event loop.
+    """
+
+    def __init__(self, db_conns, connect=None):
+        """
+        Args:
+            db_conns: List of initial connections.
+            connect: Callable returning a new connection, used to replace connections which have been closed
+                     (e.g. after a database failover). Without it, closed connections stay in the pool.
+                     With it, the pool owns its connections and closes them in close().
+        """
+
+        if len(db_conns) == 0:
+            raise ValueError('Connection pool requires at least one connection')
+
+        self.size = len(db_conns)
+        self._connect = connect
+        # All connections, whether idle or in use
+        self._conns = set(db_conns)
+        self._idle_conns = asyncio.Queue()
+        for db_conn in db_conns:
+            self._idle_conns.put_nowait(db_conn)
+        self._executor = ThreadPoolExecutor(self.size, thread_name_prefix='submission-db')
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Calls `func(db_conn, *args, **kwargs)` with an idle connection from the pool in a worker thread and
+        returns its result. Waits for a connection to become available if all of them are busy.
+        """
+
+        db_conn = await self._idle_conns.get()
+        loop = asyncio.get_running_loop()
+
+        def call():
+            nonlocal db_conn
+
+            if self._connect is not None and _is_closed(db_conn):
+                logging.warning('Database connection has been closed, reconnecting')
+                # If this fails, the closed connection goes back to the pool and the next call tries again
+                new_conn = self._connect()
+                self._conns.discard(db_conn)
+                self._conns.add(new_conn)
+                db_conn = new_conn
+
+            try:
+                return func(db_conn, *args, **kwargs)
+            except (psycopg2.InterfaceError, psycopg2.OperationalError):
+                # Psycopg2 does not always mark connections as closed when the server has gone away, make
+                # sure the connection gets replaced
+                if self._connect is not None:
+                    db_conn.close()
+                raise
+
+        def release(_):
+            loop.call_soon_threadsafe(self._idle_conns.put_nowait, db_conn)
+
+        # Only give the connection back once the worker thread is really done with it, even if the awaiting
+        # coroutine gets cancelled in the meantime
+        future = self._executor.submit(call)
+        future.add_done_callback(release)
+
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        """
+        Stops the worker threads after the currently running functions and closes the connections if the
+        pool owns them.
+        """
+
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+        if self._connect is not None:
+            for db_conn in self._conns:
+                db_conn.close()
+
+
+def _is_closed(db_conn):
+
+    # Psycopg2 connections have a `closed` attribute, which is non-zero once they are unusable
+    return bool(getattr(db_conn, 'closed', False))
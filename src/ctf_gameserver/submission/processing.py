@@ -0,0 +1,166 @@
+"""
+Checks of submitted flags and storing of the resulting captures, independent of the protocol used for
+submission.
+"""
+
+import asyncio
+import logging
+import sqlite3
+
+import psycopg2
+
+import ctf_gameserver.lib.flag as flag_lib
+
+from . import database
+
+
+async def process_flags(raw_flags, params, client_net_no, team_metrics, log, timer):
+    """
+    Handles a batch of submitted flags from a single client and returns the responses in the same order.
+    The time spent in the individual stages gets recorded in the given StageTimer.
+    """
+
+    game_state = params['game_state']
+    responses = [None] * len(raw_flags)
+
+    # Checks which do not require database access get performed for the whole batch first, the remaining
+    # captures then get stored concurrently
+    captures = []
+    for i, raw_flag in enumerate(raw_flags):
+        response, capture = check_flag(raw_flag, params, client_net_no, team_metrics, log, timer)
+        if capture is None:
+            responses[i] = response
+        else:
+            captures.append((i, raw_flag, capture))
+
+    if not captures:
+        return responses
+
+    timer.skip()
+    results = await asyncio.gather(*(
+        params['capture_batcher'].add(flag_id, client_team_id, game_state.current_tick)
+        for _, _, (flag_id, client_team_id) in captures
+    ), return_exceptions=True)
+    timer.lap('capture_insert')
+
+    for (i, raw_flag, (flag_id, _)), result in zip(captures, results):
+        if result is None:
+            responses[i] = raw_flag + b' OK\n'
+            log('INFO', 'Flag %s accepted', repr(raw_flag.decode('ascii')), code='OK')
+            team_metrics.count_flag('OK')
+            count_service_outcome(params, flag_id, 'OK')
+        elif isinstance(result, database.DuplicateCapture):
+            responses[i] = raw_flag + b' DUP You already submitted this flag\n'
+            log('INFO', 'Flag %s rejected because it has already been submitted before',
+                repr(raw_flag.decode('ascii')), code='DUP')
+            team_metrics.count_flag('DUP')
+            count_service_outcome(params, flag_id, 'DUP')
+        elif isinstance(result, (psycopg2.Error, sqlite3.Error)):
+            logging.error('Database error:', exc_info=result)
+            raise KillServerException() from result
+        else:
+            raise result
+
+    return responses
+
+
+def check_flag(raw_flag, params, client_net_no, team_metrics, log, timer):
+    """
+    Performs all checks for a single submitted flag which can be done without accessing the database.
+
+    Returns:
+        A tuple of (response, capture). If the flag got rejected, `response` is the line to send to the
+        client and `capture` is None. Otherwise, `capture` is a tuple of (flag_id, capturing_team_id) to
+        store.
+    """
+
+    game_state = params['game_state']
+    team_directory = params['team_directory']
+
+    # Do not attribute logging and bookkeeping for the previous flag to any stage
+    timer.skip()
+
+    if len(raw_flag) > params['max_line_length']:
+        timer.lap('decode')
+        log('INFO', 'Flag rejected because it exceeds the maximum length', code='INV')
+        team_metrics.count_flag('INV')
+        team_metrics['overlong_lines'].inc()
+        return (raw_flag + b' INV Flag is too long\n', None)
+
+    try:
+        flag_id, protecting_net_no = params['flag_cache'].verify(raw_flag, timer=timer)
+    except UnicodeDecodeError:
+        timer.lap('decode')
+        log('INFO', 'Flag %s rejected due to bad encoding', repr(raw_flag), code='INV')
+        team_metrics.count_flag('INV')
+        return (raw_flag + b' INV Invalid flag\n', None)
+    except flag_lib.InvalidFlagFormat:
+        timer.lap('decode')
+        log('INFO', 'Flag %s rejected due to invalid format', repr(raw_flag.decode('ascii')), code='INV')
+        team_metrics.count_flag('INV')
+        return (raw_flag + b' INV Invalid flag\n', None)
+    except flag_lib.InvalidFlagMAC:
+        timer.lap('mac_verify')
+        log('INFO', 'Flag %s rejected due to invalid MAC', repr(raw_flag.decode('ascii')), code='INV')
+        team_metrics.count_flag('INV')
+        return (raw_flag + b' INV Invalid flag\n', None)
+    except flag_lib.FlagExpired as e:
+        timer.lap('decode')
+        log('INFO', 'Flag %s rejected because it has expired since %s', repr(raw_flag.decode('ascii')),
+            e.expiration_time.isoformat(), code='OLD')
+        team_metrics.count_flag('OLD')
+        count_service_outcome(params, e.flag_id, 'OLD')
+        return (raw_flag + b' OLD Flag has expired\n', None)
+
+    # Only used for logging, cannot fail for a verified flag
+    flag = raw_flag.decode('ascii')
+
+    if protecting_net_no == client_net_no:
+        log('INFO', 'Flag %s rejected because it is protected by submitting team', repr(flag), code='OWN')
+        team_metrics.count_flag('OWN')
+        count_service_outcome(params, flag_id, 'OWN')
+        return (raw_flag + b' OWN You cannot submit your own flag\n', None)
+
+    started, over = game_state.is_running()
+    timer.lap('game_state_check')
+    if not started:
+        log('INFO', 'Flag %s rejected because competition has not started', repr(flag), code='ERR')
+        team_metrics.count_flag('ERR')
+        count_service_outcome(params, flag_id, 'ERR')
+        return (raw_flag + b' ERR Competition has not even started yet\n', None)
+    if over:
+        log('INFO', 'Flag %s rejected because competition is over', repr(flag), code='ERR')
+        team_metrics.count_flag('ERR')
+        count_service_outcome(params, flag_id, 'ERR')
+        return (raw_flag + b' ERR Competition is over\n', None)
+
+    nop = team_directory.is_nop(protecting_net_no)
+    client_team_id = team_directory.get_team_id(client_net_no)
+    timer.lap('nop_check')
+    if nop:
+        log('INFO', 'Flag %s rejected because it is protected by a NOP team', repr(flag), code='INV')
+        team_metrics.count_flag('INV')
+        count_service_outcome(params, flag_id, 'INV')
+        return (raw_flag + b' INV You cannot submit flags of a NOP team\n', None)
+
+    if client_team_id is None:
+        log('WARNING', 'Flag %s: Could not find team for net number %d in database', repr(flag),
+            client_net_no, code='ERR')
+        team_metrics.count_flag('ERR')
+        count_service_outcome(params, flag_id, 'ERR')
+        return (raw_flag + b' ERR Could not find team\n', None)
+
+    return (None, (flag_id, client_team_id))
+
+
+def count_service_outcome(params, flag_id, code):
+
+    service = params['flag_services'].get_service(flag_id)
+    params['service_metrics'].count_flag(service, code)
+
+
+class KillServerException(Exception):
+    """
+    Indicates that a fatal error occured and the server shall be stopped (and then usually get restarted
+    through systemd).
+    """
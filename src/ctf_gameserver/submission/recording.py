@@ -0,0 +1,136 @@
+"""
+Recording of submission traffic in a compact binary format, to be replayed for load tests.
+
+A recording file starts with FILE_MAGIC, followed by one record per received line: A RECORD_HEADER with the
+Unix timestamp of receipt, the client's net number and the length of the line, then the raw line (without
+newline).
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import logging
+import struct
+import time
+
+
+FILE_MAGIC = b'CTFSUBREC1\n'
+RECORD_HEADER = struct.Struct('<diI')
+# Interval in seconds in which recorded lines get written to the file
+FLUSH_INTERVAL = 1
+# Maximum number of bytes waiting to be written, further lines do not get recorded
+MAX_PENDING_SIZE = 64 * 2**20
+
+
+class TrafficRecorder:
+    """
+    Records the lines received by the Submission server. Records get collected in memory and are written to
+    the file by a separate thread, so recording does not block the event loop. If writing cannot keep up,
+    lines get dropped.
+    """
+
+    def __init__(self, path, metrics):
+        """
+        Args:
+            path: Path of the recording file, which must not exist yet. Files never get appended to, because
+                  an incomplete last record from a crash would corrupt the following ones.
+            metrics: Metrics dict as returned by make_metrics().
+        """
+
+        self.path = path
+        self.metrics = metrics
+
+        self._buffer = bytearray()
+        # Number of bytes currently being written by the executor
+        self._pending_size = 0
+        self._file = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='traffic-recorder')
+
+    def open(self):
+
+        self._file = open(self.path, 'xb')
+        self._file.write(FILE_MAGIC)
+
+    def close(self):
+        """
+        Writes all remaining records and closes the file.
+        """
+
+        self._executor.shutdown()
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+        self._file.close()
+
+    def record(self, net_no, lines):
+        """
+        Records lines which have just been received from the team with the given net number.
+        """
+
+        if self._pending_size + len(self._buffer) > MAX_PENDING_SIZE:
+            self.metrics['traffic_records_dropped'].inc(len(lines))
+            return
+
+        timestamp = time.time()
+        for line in lines:
+            self._buffer += RECORD_HEADER.pack(timestamp, net_no, len(line))
+            self._buffer += line
+
+    async def flush(self):
+        """
+        Writes the records collected so far to the file.
+        """
+
+        if not self._buffer:
+            return
+
+        data = self._buffer
+        self._buffer = bytearray()
+        self._pending_size += len(data)
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, data)
+        except OSError as e:
+            logging.warning('Could not write traffic recording: %s', e)
+        finally:
+            self._pending_size -= len(data)
+
+    async def run(self):
+
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    def _write(self, data):
+
+        self._file.write(data)
+        self._file.flush()
+
+
+def read_records(path):
+    """
+    Generator yielding the records from a recording file as (timestamp, net_no, line) tuples. An incomplete
+    last record (from a crash during writing) gets ignored.
+    """
+
+    with open(path, 'rb') as record_file:
+        if record_file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f'{path} is not a traffic recording')
+
+        while True:
+            header = record_file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, net_no, length = RECORD_HEADER.unpack(header)
+            line = record_file.read(length)
+            if len(line) < length:
+                return
+            yield (timestamp, net_no, line)
+
+
+def merge_records(paths):
+    """
+    Merges the records from multiple recording files (e.g. from multiple worker processes) by timestamp.
+    """
+
+    return heapq.merge(*(read_records(path) for path in paths), key=lambda record: record[0])
@@ -0,0 +1,182 @@
+"""
+Replays submission traffic recorded with `--traffic-record-dir` against a Submission server, to load test it
+with the traffic shape of a real competition.
+
+Lines get submitted with their original timing (optionally accelerated) over one connection per team, from
+the source address given by a template with the net number. For meaningful responses, the target server
+has to use the flag secret and a copy of the database from the recorded competition.
+
+Run as `python3 -m ctf_gameserver.submission.replay`.
+"""
+
+import argparse
+import asyncio
+from collections import deque
+import logging
+import os
+import sys
+import time
+
+from ctf_gameserver.lib.args import parse_host_port
+
+from .benchmark import RESPONSE_CLASSES, format_report
+from .recording import merge_records
+
+
+def main():
+
+    arg_parser = argparse.ArgumentParser(description='CTF Gameserver Submission Traffic Replay')
+    arg_parser.add_argument('recordings', nargs='+', help='Recording files, which get merged by time')
+    arg_parser.add_argument('--target', default='127.0.0.1:6666',
+                            help='Address and port of the Submission server (default: 127.0.0.1:6666)')
+    arg_parser.add_argument('--speed', type=float, default=1,
+                            help='Factor by which to accelerate the replay (default: 1)')
+    arg_parser.add_argument('--source-address', default='127.0.{net_no}.1',
+                            help='Template for the source address of the connection per team, "{net_no}" '
+                            'gets replaced by the net number (default: 127.0.{net_no}.1)')
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.WARNING)
+
+    if args.speed <= 0:
+        logging.error('Speed must be positive')
+        return os.EX_USAGE
+
+    try:
+        host, port, _ = parse_host_port(args.target)
+    except ValueError:
+        logging.error('Target must be specified as "<host>:<port>"')
+        return os.EX_USAGE
+
+    for path in args.recordings:
+        if not os.path.isfile(path):
+            logging.error('Recording "%s" does not exist', path)
+            return os.EX_USAGE
+
+    try:
+        results, elapsed, max_lag = asyncio.run(run_replay(host, port, merge_records(args.recordings),
+                                                           args.speed, args.source_address))
+    except ValueError as e:
+        logging.error('%s', e)
+        return os.EX_DATAERR
+
+    print(format_report(results, elapsed))
+    print()
+    print(f'Maximum lag behind the schedule: {max_lag:.2f} s')
+
+    return os.EX_OK
+
+
+async def run_replay(host, port, records, speed, source_address):
+    """
+    Submits the lines from the given records like they were received, but `speed` times faster.
+
+    Args:
+        records: Iterable of (timestamp, net_no, line) tuples ordered by time, as from merge_records().
+        source_address: Template for the source address per team, see main().
+
+    Returns:
+        A tuple of (results, elapsed_seconds, max_lag_seconds), where `results` is a dict mapping response
+        classes to lists of latencies in seconds and `max_lag_seconds` tells how far the replay fell behind
+        the recorded timing.
+    """
+
+    clients = {}
+    start_time = time.monotonic()
+    first_timestamp = None
+    max_lag = 0
+
+    try:
+        for timestamp, net_no, line in records:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+
+            delay = (timestamp - first_timestamp) / speed - (time.monotonic() - start_time)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+
+            try:
+                client = clients[net_no]
+            except KeyError:
+                client = _ReplayClient()
+                await client.connect(host, port, source_address.format(net_no=net_no))
+                clients[net_no] = client
+
+            client.send(line)
+    finally:
+        for client in clients.values():
+            client.finish()
+        client_results = await asyncio.gather(*(client.receive_task for client in clients.values()))
+
+    elapsed = time.monotonic() - start_time
+
+    results = {response_class: [] for response_class in RESPONSE_CLASSES}
+    for client_result in client_results:
+        for response_class, latency in client_result:
+            results.setdefault(response_class, []).append(latency)
+
+    return (results, elapsed, max_lag)
+
+
+class _ReplayClient:
+    """
+    Connection of a single team, which sends lines and concurrently reads the responses.
+    """
+
+    def __init__(self):
+        self.receive_task = None
+        self._reader = None
+        self._writer = None
+        # (send_time, line) tuples of lines waiting for their response
+        self._sent = deque()
+
+    async def connect(self, host, port, source_address):
+
+        self._reader, self._writer = await asyncio.open_connection(host, port,
+                                                                   local_addr=(source_address, 0))
+        await self._reader.readuntil(b'\n\n')
+        self.receive_task = asyncio.create_task(self._receive())
+
+    def send(self, line):
+
+        if self._writer.is_closing():
+            return
+
+        self._sent.append((time.monotonic(), line))
+        self._writer.write(line + b'\n')
+
+    def finish(self):
+        """
+        Signals that no more lines will be sent, the server closes the connection once it has responded.
+        """
+
+        if not self._writer.is_closing():
+            self._writer.write_eof()
+
+    async def _receive(self):
+        """
+        Returns a list of (response_class, latency_seconds) tuples.
+        """
+
+        results = []
+
+        while True:
+            response = await self._reader.readline()
+            if not response.endswith(b'\n') or not self._sent:
+                break
+
+            send_time, line = self._sent.popleft()
+            # Responses are "<line> <code>[ <message>]\n"
+            response_class = response[len(line)+1:].rstrip(b'\n').split(b' ', 1)[0]
+            results.append((response_class.decode('ascii', 'replace') or 'ERR',
+                            time.monotonic() - send_time))
+
+        self._writer.close()
+        return results
+
+
+if __name__ == '__main__':
+    sys.exit(main())
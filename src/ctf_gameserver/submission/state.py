@@ -0,0 +1,296 @@
+import asyncio
+import datetime
+import logging
+
+from . import database
+
+
+# PostgreSQL notification channels on which changes to the game control information and to teams get
+# announced
+GAMECONTROL_CHANNEL = 'ctf_gamecontrol'
+TEAMS_CHANNEL = 'ctf_teams'
+
+
+class _CachedState:
+    """
+    Base class for in-process snapshots of database contents, which get refreshed upon change notifications
+    and additionally after a fixed interval. The interval bounds the staleness if notifications are not
+    available (e.g. with SQLite).
+    """
+
+    def __init__(self, db_pool, refresh_interval, load):
+        """
+        Args:
+            load: Coroutine function without arguments, which updates the snapshot from the database.
+        """
+
+        self.db_pool = db_pool
+        self.refresh_interval = refresh_interval
+        self._load = load
+
+        self._changed = asyncio.Event()
+
+    async def refresh(self):
+        """
+        Updates the snapshot right away.
+        """
+        await self._load()
+
+    def notify(self):
+        """
+        Triggers a refresh of the snapshot as soon as possible.
+        """
+        self._changed.set()
+
+    async def run(self):
+        """
+        Coroutine keeping the snapshot up to date, runs forever.
+        """
+
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+
+            try:
+                await self.refresh()
+            except Exception:    # pylint: disable=broad-except
+                logging.exception('Could not refresh %s, keeping previous values:', type(self).__name__)
+
+
+class GameState(_CachedState):
+    """
+    Snapshot of the competition's start and end time, its current tick and the flag validity, which saves us
+    from querying them from the database for every submitted flag.
+    """
+
+    def __init__(self, db_pool, refresh_interval):
+        super().__init__(db_pool, refresh_interval, self._load_dynamic_info)
+
+        self.start = None
+        self.end = None
+        self.current_tick = None
+        self.valid_ticks = None
+
+        self._tick_callbacks = []
+
+    async def _load_dynamic_info(self):
+        previous_tick = self.current_tick
+        self.start, self.end, self.current_tick, self.valid_ticks = \
+            await self.db_pool.run(database.get_dynamic_info)
+
+        if self.current_tick != previous_tick:
+            for callback in self._tick_callbacks:
+                callback()
+
+    def on_tick_change(self, callback):
+        """
+        Calls `callback()` (without arguments) whenever a refresh reveals a change of the current tick.
+        """
+
+        self._tick_callbacks.append(callback)
+
+    def is_running(self, now=None):
+        """
+        Returns a tuple of two booleans, indicating whether the competition has already started and whether
+        it is already over.
+        """
+
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+
+        started = self.start is not None and now >= self.start
+        over = self.end is not None and now >= self.end
+
+        return (started, over)
+
+
+class TeamDirectory(_CachedState):
+    """
+    Snapshot of all teams' IDs and NOP status by their net number, which allows to check submissions for
+    unknown teams and NOP teams without accessing the database.
+    """
+
+    def __init__(self, db_pool, refresh_interval):
+        super().__init__(db_pool, refresh_interval, self._load_teams)
+
+        self._teams = {}
+
+    async def _load_teams(self):
+        self._teams = await self.db_pool.run(database.get_teams)
+
+    def get_team_id(self, net_no):
+        """
+        Returns the ID of the team with the given net number or None if there is no such team.
+        """
+
+        try:
+            return self._teams[net_no][0]
+        except KeyError:
+            return None
+
+    def is_nop(self, net_no):
+        """
+        Returns whether the team with the given net number is marked as NOP team.
+        """
+
+        try:
+            return self._teams[net_no][1]
+        except KeyError:
+            return False
+
+
+class FlagServices(_CachedState):
+    """
+    Snapshot of the protected service for all flags which are still valid (plus one tick of expired ones), to
+    break down submission metrics by service. Flags get created together with a new tick, so this only needs
+    to be refreshed when `game_state` sees a tick change and then just loads the flags of ticks it does not
+    know yet.
+    """
+
+    # Label for flags which are not known (yet)
+    UNKNOWN = 'unknown'
+
+    def __init__(self, db_pool, refresh_interval, game_state):
+        super().__init__(db_pool, refresh_interval, self._load_new_flags)
+
+        self.game_state = game_state
+        game_state.on_tick_change(self.notify)
+
+        self._services = {}
+        # Mapping from ticks to the IDs of their flags in `_services`
+        self._tick_flags = {}
+
+    async def _load_new_flags(self):
+        min_tick = self.game_state.current_tick - self.game_state.valid_ticks
+        if self._tick_flags:
+            load_tick = max(min_tick, max(self._tick_flags) + 1)
+        else:
+            load_tick = min_tick
+
+        for flag_id, tick, service in await self.db_pool.run(database.get_flag_services, load_tick):
+            self._services[flag_id] = service
+            self._tick_flags.setdefault(tick, []).append(flag_id)
+
+        for tick in [t for t in self._tick_flags if t < min_tick]:
+            for flag_id in self._tick_flags.pop(tick):
+                del self._services[flag_id]
+
+    def get_service(self, flag_id):
+        """
+        Returns the slug of the service protected by the flag with the given ID, or UNKNOWN.
+        """
+
+        return self._services.get(flag_id, self.UNKNOWN)
+
+
+class NotificationListener:
+    """
+    Receives PostgreSQL notifications (from `NOTIFY`) on a dedicated connection without blocking the event
+    loop and dispatches them to callbacks.
+    """
+
+    # Time in seconds to wait between attempts to replace a broken connection
+    RECONNECT_INTERVAL = 5
+
+    def __init__(self, db_conn, connect=None):
+        """
+        Args:
+            db_conn: Psycopg2 connection, which must not be used for anything else.
+            connect: Function without arguments returning a new connection, which gets used to replace
+                     `db_conn` if it breaks. Without it, no more notifications get received after an error.
+        """
+
+        self.db_conn = db_conn
+        self.db_conn.autocommit = True
+        self._connect = connect
+        self._callbacks = {}
+        self._fd = None
+        self._reconnect_task = None
+
+    def subscribe(self, channel, callback):
+        """
+        Calls `callback()` (without arguments) whenever a notification is received on `channel`.
+        """
+
+        _listen(self.db_conn, [channel])
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._fd = self.db_conn.fileno()
+        loop.add_reader(self._fd, self._handle_readable)
+
+    def stop(self):
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self._fd)
+
+    def close(self):
+        """
+        Stops listening for good, including attempts to replace a broken connection, and closes the
+        connection.
+        """
+
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._fd is not None:
+            self.stop()
+        self.db_conn.close()
+
+    def _handle_readable(self):
+        try:
+            self.db_conn.poll()
+        except Exception:    # pylint: disable=broad-except
+            self.stop()
+            if self._connect is None:
+                # Regular refreshes will keep our state from getting too stale
+                logging.exception('Error on notification connection, not listening anymore:')
+            else:
+                logging.exception('Error on notification connection, reconnecting:')
+                self._reconnect_task = asyncio.create_task(self._reconnect())
+            return
+
+        while self.db_conn.notifies:
+            notification = self.db_conn.notifies.pop(0)
+            for callback in self._callbacks.get(notification.channel, []):
+                callback()
+
+    async def _reconnect(self):
+        """
+        Replaces the broken connection and subscribes to all previous channels again. Retries until it
+        succeeds.
+        """
+
+        loop = asyncio.get_running_loop()
+        self.db_conn.close()
+
+        while True:
+            try:
+                db_conn = await loop.run_in_executor(None, self._connect)
+                db_conn.autocommit = True
+                await loop.run_in_executor(None, _listen, db_conn, list(self._callbacks))
+            except Exception:    # pylint: disable=broad-except
+                logging.exception('Could not replace notification connection, retrying in %d seconds:',
+                                  self.RECONNECT_INTERVAL)
+                await asyncio.sleep(self.RECONNECT_INTERVAL)
+            else:
+                break
+
+        self.db_conn = db_conn
+        self.start()
+        logging.info('Replaced notification connection')
+
+        # Notifications may have been missed in the meantime, so refresh everything
+        for callbacks in self._callbacks.values():
+            for callback in callbacks:
+                callback()
+
+
+def _listen(db_conn, channels):
+
+    with db_conn.cursor() as cursor:
+        for channel in channels:
+            # Channel names are identifiers and cannot be passed as query parameters
+            cursor.execute(f'LISTEN {channel}')
@@ -1,11 +1,17 @@
+import argparse
 import asyncio
 import base64
 from binascii import Error as BinasciiError
-import datetime
+import contextlib
+import functools
+from http import HTTPStatus
+import json
 import logging
 import os
 import re
-import sqlite3
+import shutil
+import signal
+import tempfile
 import time
 
 import prometheus_client
@@ -19,23 +25,130 @@ from ctf_gameserver.lib.database import transaction_cursor
 from ctf_gameserver.lib.exceptions import DBDataError
 from ctf_gameserver.lib.metrics import start_metrics_server
 
-from . import database
+from . import database, eventloop, http_api, workers
+from .captures import CaptureBatcher, DuplicateIndex
+from .flags import VerifiedFlagCache
+from .journal import CaptureJournal
+from .limits import AdmissionControl, LineSplitter
+from .metrics import TEAM_METRICS_MODES, ServiceMetrics, StageTimer, TeamMetrics, make_metrics
+from .logs import SubmissionLog, parse_sample_rates, start_log_writer
+from .pool import ConnectionPool
+from .processing import KillServerException, process_flags
+from .recording import TrafficRecorder
+from .state import FlagServices, GameState, NotificationListener, TeamDirectory, GAMECONTROL_CHANNEL, \
+    TEAMS_CHANNEL
 
 
 TIMEOUT_SECONDS = 300
+# Upper bound for the number of bytes a response line adds to the submitted flag
+MAX_RESPONSE_OVERHEAD = 64
+HTTP_PATH = '/flags'
+# `FileDescriptorName=` of sockets from systemd to serve the HTTP API on, all others use the line protocol
+HTTP_SOCKET_NAME = 'http'
 
 
 def main():
 
     arg_parser = get_arg_parser_with_db('CTF Gameserver Submission Server')
     arg_parser.add_argument('--listen', default="localhost:6666",
-                            help='Address and port to listen on ("<host>:<port>")')
+                            help='Address and port to listen on ("<host>:<port>"), ignored with sockets '
+                            'from systemd')
     arg_parser.add_argument('--flagsecret', required=True,
                             help='Base64 string used as secret in flag generation')
     arg_parser.add_argument('--teamregex', required=True,
                             help='Python regex (with match group) to extract team net number from '
                             'connecting IP address')
+    arg_parser.add_argument('--http-listen', help='Additionally accept flags as JSON via HTTP on this '
+                            'address and port ("<host>:<port>"), ignored with sockets from systemd')
+    arg_parser.add_argument('--http-max-flags', type=int, default=500,
+                            help='Maximum number of flags per HTTP request (default: 500)')
     arg_parser.add_argument('--metrics-listen', help='Expose Prometheus metrics via HTTP ("<host>:<port>")')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes, which all listen on the same port '
+                            '(default: 1)')
+    arg_parser.add_argument('--dbconnections', type=int, default=4,
+                            help='Number of database connections to use concurrently per worker process '
+                            '(default: 4)')
+    arg_parser.add_argument('--capture-batch-window', type=float, default=0.01,
+                            help='Maximum time in seconds to collect captures before storing them in the '
+                            'database together (default: 0.01)')
+    arg_parser.add_argument('--capture-batch-size', type=int, default=500,
+                            help='Maximum number of captures to store in the database together '
+                            '(default: 500)')
+    arg_parser.add_argument('--capture-journal-dir', type=str,
+                            help='Directory for journals of captures which could not be stored in the '
+                            'database, enables acknowledging captures while the database is unavailable '
+                            '(default: no journal)')
+    arg_parser.add_argument('--capture-db-timeout', type=float, default=5,
+                            help='Time in seconds after which to store captures in the journal if the '
+                            'database has not stored them yet (default: 5)')
+    arg_parser.add_argument('--traffic-record-dir', type=str,
+                            help='Directory in which to record all received lines (one file per worker '
+                            'process and start) for replaying them with '
+                            '`python3 -m ctf_gameserver.submission.replay` (default: no recording)')
+    arg_parser.add_argument('--journal-replay-interval', type=float, default=5,
+                            help='Interval in seconds in which to try storing captures from the journal in '
+                            'the database (default: 5)')
+    arg_parser.add_argument('--event-loop', choices=eventloop.EVENT_LOOPS, default='asyncio',
+                            help='Event loop implementation, uvloop is faster but must be installed '
+                            'separately (default: asyncio)')
+    arg_parser.add_argument('--listen-backlog', type=int, default=100,
+                            help='Maximum number of pending connections on the listening sockets '
+                            '(default: 100)')
+    arg_parser.add_argument('--tcp-nodelay', action=argparse.BooleanOptionalAction, default=True,
+                            help='Disable Nagle\'s algorithm on client connections (default: enabled)')
+    arg_parser.add_argument('--read-buffer-limit', type=int, default=2**16,
+                            help='Number of bytes to buffer per connection before pausing reading from '
+                            'the socket (which happens at twice the limit) (default: 65536)')
+    arg_parser.add_argument('--write-buffer-limit', type=int, default=2**16,
+                            help='Number of bytes of pending output per connection above which no further '
+                            'input gets processed (default: 65536)')
+    arg_parser.add_argument('--max-line-length', type=int, default=1024,
+                            help='Maximum length of a submitted line in bytes, longer lines get rejected '
+                            'as invalid (default: 1024)')
+    arg_parser.add_argument('--write-timeout', type=float, default=TIMEOUT_SECONDS,
+                            help='Maximum time in seconds to wait for a client to read pending responses '
+                            f'before closing the connection (default: {TIMEOUT_SECONDS})')
+    arg_parser.add_argument('--drain-timeout', type=float, default=10,
+                            help='Maximum time in seconds to finish processing submissions upon SIGTERM '
+                            'before closing the connections forcibly (default: 10)')
+    arg_parser.add_argument('--flag-cache-size', type=int, default=20000,
+                            help='Maximum number of verified flags to keep in memory per worker process, '
+                            '0 to disable the cache (default: 20000)')
+    arg_parser.add_argument('--team-flag-rate', type=float, default=0,
+                            help='Maximum number of flags per second to process per team (and worker '
+                            'process), 0 for no limit (default: 0)')
+    arg_parser.add_argument('--team-connection-limit', type=int, default=0,
+                            help='Maximum number of concurrent connections per team (and worker process), '
+                            'additional ones have to wait, 0 for no limit (default: 0)')
+    arg_parser.add_argument('--team-metrics', choices=TEAM_METRICS_MODES, default='full',
+                            help='Granularity of per-team metrics: "full" for series per team, "top" for '
+                            'the teams with the most flags plus "other", "buckets" for ranges of net '
+                            'numbers (default: full)')
+    arg_parser.add_argument('--team-metrics-top', type=int, default=50,
+                            help='Number of teams with series of their own for `--team-metrics top` '
+                            '(default: 50)')
+    arg_parser.add_argument('--team-metrics-bucket-size', type=int, default=100,
+                            help='Number of net numbers per bucket for `--team-metrics buckets` '
+                            '(default: 100)')
+    arg_parser.add_argument('--log-queue-size', type=int, default=10000,
+                            help='Maximum number of log records waiting to be written by a separate thread, '
+                            '0 to write them synchronously (default: 10000)')
+    arg_parser.add_argument('--log-sampling', default='',
+                            help='Fraction of flags to log individually per response code, e.g. '
+                            '"DUP=0.01,INV=0.1", codes not specified get logged completely (default: none)')
+    arg_parser.add_argument('--log-summary-interval', type=float, default=60,
+                            help='Interval in seconds in which to log a summary of submitted flags per '
+                            'team, 0 to disable (default: 60)')
+    arg_parser.add_argument('--state-refresh-interval', type=float, default=5,
+                            help='Maximum time in seconds after which cached game state gets refreshed from '
+                            'the database, even without a change notification (default: 5)')
+    arg_parser.add_argument('--teams-refresh-interval', type=float, default=60,
+                            help='Maximum time in seconds after which cached team information gets '
+                            'refreshed from the database, even without a change notification (default: 60)')
+    arg_parser.add_argument('--flags-refresh-interval', type=float, default=300,
+                            help='Maximum time in seconds after which cached flag information gets '
+                            'refreshed from the database, even without a tick change (default: 300)')
 
     args = arg_parser.parse_args()
 
@@ -64,17 +177,104 @@ def main():
         logging.error('Team regex must contain one match group')
         return os.EX_USAGE
 
+    if args.http_listen is not None:
+        try:
+            http_host, http_port, _ = parse_host_port(args.http_listen)
+        except ValueError:
+            logging.error('HTTP listen address needs to be specified as "<host>:<port>"')
+            return os.EX_USAGE
+        http_listen = (http_host, http_port)
+    else:
+        http_listen = None
+    if args.http_max_flags < 1:
+        logging.error('`--http-max-flags` must be at least 1')
+        return os.EX_USAGE
+
+    if args.dbconnections < 1:
+        logging.error('`--dbconnections` must be at least 1')
+        return os.EX_USAGE
+    if args.capture_batch_window < 0 or args.capture_batch_size < 1:
+        logging.error('Capture batch window must not be negative and batch size must be at least 1')
+        return os.EX_USAGE
+
+    if args.capture_journal_dir is not None:
+        if not os.path.isdir(args.capture_journal_dir):
+            logging.error('Capture journal directory "%s" does not exist', args.capture_journal_dir)
+            return os.EX_USAGE
+        _check_orphaned_journals(args.capture_journal_dir, args.workers)
+    if args.traffic_record_dir is not None and not os.path.isdir(args.traffic_record_dir):
+        logging.error('Traffic record directory "%s" does not exist', args.traffic_record_dir)
+        return os.EX_USAGE
+    if args.capture_db_timeout <= 0 or args.journal_replay_interval <= 0:
+        logging.error('Capture database timeout and journal replay interval must be positive')
+        return os.EX_USAGE
+
+    if args.flag_cache_size < 0:
+        logging.error('`--flag-cache-size` must not be negative')
+        return os.EX_USAGE
+
+    if args.team_flag_rate < 0 or args.team_connection_limit < 0:
+        logging.error('Team limits must not be negative')
+        return os.EX_USAGE
+
     try:
-        db_conn = psycopg2.connect(host=args.dbhost, database=args.dbname, user=args.dbuser,
-                                   password=args.dbpassword)
+        log_sample_rates = parse_sample_rates(args.log_sampling)
+    except ValueError:
+        logging.error('Log sampling must be specified as "<code>=<rate>,...", with rates between 0 and 1 '
+                      'and no sampling for ERR')
+        return os.EX_USAGE
+    if args.log_queue_size < 0 or args.log_summary_interval < 0:
+        logging.error('Log queue size and summary interval must not be negative')
+        return os.EX_USAGE
+
+    if args.state_refresh_interval <= 0 or args.teams_refresh_interval <= 0 or \
+       args.flags_refresh_interval <= 0:
+        logging.error('Refresh intervals must be positive')
+        return os.EX_USAGE
+
+    if args.workers < 1:
+        logging.error('`--workers` must be at least 1')
+        return os.EX_USAGE
+
+    if args.drain_timeout < 0:
+        logging.error('`--drain-timeout` must not be negative')
+        return os.EX_USAGE
+
+    if args.listen_backlog < 1 or args.read_buffer_limit < 1 or args.write_buffer_limit < 1:
+        logging.error('Listen backlog and buffer limits must be positive')
+        return os.EX_USAGE
+
+    if args.max_line_length < 1 or args.write_timeout <= 0:
+        logging.error('Maximum line length and write timeout must be positive')
+        return os.EX_USAGE
+
+    if args.team_metrics_top < 1 or args.team_metrics_bucket_size < 1:
+        logging.error('`--team-metrics-top` and `--team-metrics-bucket-size` must be at least 1')
+        return os.EX_USAGE
+    if args.team_metrics == 'top':
+        team_metrics_size = args.team_metrics_top
+    elif args.team_metrics == 'buckets':
+        team_metrics_size = args.team_metrics_bucket_size
+    else:
+        team_metrics_size = 0
+
+    # Socket activation, worker processes share the sockets
+    listen_sockets = daemon.listen_sockets()
+    if listen_sockets:
+        logging.info('Using %d sockets from systemd', len(listen_sockets))
+
+    if args.metrics_listen is not None:
+        try:
+            metrics_host, metrics_port, metrics_family = parse_host_port(args.metrics_listen)
+        except ValueError:
+            logging.error('Metrics listen address needs to be specified as "<host>:<port>"')
+            return os.EX_USAGE
+
+    try:
+        db_conn = _connect_database(args, 1)[0]
     except psycopg2.OperationalError as e:
         logging.error('Could not establish database connection: %s', e)
         return os.EX_UNAVAILABLE
-    logging.info('Established database connection')
-
-    # Keep our mental model easy by always using (timezone-aware) UTC for dates and times
-    with transaction_cursor(db_conn) as cursor:
-        cursor.execute('SET TIME ZONE "UTC"')
 
     # Check database grants
     try:
@@ -84,8 +284,9 @@ def main():
         except DBDataError as e:
             logging.warning('Invalid database state: %s', e)
 
-        database.team_is_nop(db_conn, 1)
-        database.add_capture(db_conn, 2147483647, 1, prohibit_changes=True, fake_team_id=42, fake_tick=1)
+        database.get_teams(db_conn)
+        database.get_flag_services(db_conn, 0)
+        database.add_captures(db_conn, [(2147483647, 42, 1)], prohibit_changes=True)
     except psycopg2.ProgrammingError as e:
         if e.pgcode == postgres_errors.INSUFFICIENT_PRIVILEGE:
             # Log full exception because only the backtrace will tell which kind of permission is missing
@@ -93,85 +294,271 @@ def main():
             return os.EX_NOPERM
         else:
             raise
+    finally:
+        # Workers use connections of their own, sharing connections across forks is not possible
+        db_conn.close()
 
-    if args.metrics_listen is not None:
-        try:
-            metrics_host, metrics_port, metrics_family = parse_host_port(args.metrics_listen)
-        except ValueError:
-            logging.error('Metrics listen address needs to be specified as "<host>:<port>"')
-            return os.EX_USAGE
-
-        start_metrics_server(metrics_host, metrics_port, metrics_family)
+    if args.workers > 1:
+        metrics_dir = tempfile.mkdtemp(prefix='ctf-submission-metrics-')
+        metrics_registry = workers.enable_multiprocess_metrics(metrics_dir)
+    else:
+        metrics_dir = None
+        metrics_registry = prometheus_client.REGISTRY
 
     metrics = make_metrics()
     metrics['start_timestamp'].set_to_current_time()
 
-    daemon.notify('READY=1')
+    worker_args = (args, listen_host, listen_port, args.workers > 1, {
+        **default_params(),
+        'flag_secret': flag_secret,
+        'team_regex': team_regex,
+        'capture_batch_window': args.capture_batch_window,
+        'capture_batch_size': args.capture_batch_size,
+        'capture_journal_dir': args.capture_journal_dir,
+        'capture_db_timeout': args.capture_db_timeout,
+        'journal_replay_interval': args.journal_replay_interval,
+        'traffic_record_dir': args.traffic_record_dir,
+        'worker_no': 0,
+        'http_listen': http_listen,
+        'http_max_flags': args.http_max_flags,
+        'flag_cache_size': args.flag_cache_size,
+        'team_flag_rate': args.team_flag_rate,
+        'team_connection_limit': args.team_connection_limit,
+        'team_metrics_mode': args.team_metrics,
+        'team_metrics_size': team_metrics_size,
+        'log_queue_size': args.log_queue_size,
+        'log_sample_rates': log_sample_rates,
+        'log_summary_interval': args.log_summary_interval,
+        'state_refresh_interval': args.state_refresh_interval,
+        'teams_refresh_interval': args.teams_refresh_interval,
+        'flags_refresh_interval': args.flags_refresh_interval,
+        'listen_sockets': listen_sockets,
+        'listen_backlog': args.listen_backlog,
+        'tcp_nodelay': args.tcp_nodelay,
+        'read_buffer_limit': args.read_buffer_limit,
+        'write_buffer_limit': args.write_buffer_limit,
+        'max_line_length': args.max_line_length,
+        'write_timeout': args.write_timeout,
+        'drain_timeout': args.drain_timeout,
+        'metrics': metrics
+    })
+
+    if args.workers == 1:
+        if args.metrics_listen is not None:
+            start_metrics_server(metrics_host, metrics_port, metrics_family, metrics_registry)
+        daemon.notify('READY=1')
+        return run_worker(*worker_args)
+
+    try:
+        # Fork before starting the metrics server, as forking a multi-threaded process is prone to deadlocks
+        worker_processes = workers.start_workers(args.workers, run_worker, worker_args)
+        if args.metrics_listen is not None:
+            start_metrics_server(metrics_host, metrics_port, metrics_family, metrics_registry)
+        daemon.notify('READY=1')
+        return workers.supervise_workers(worker_processes)
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def _check_orphaned_journals(journal_dir, worker_count):
+    """
+    Warns about journals from workers which will not exist, because their captures would never get stored.
+    """
+
+    for file_name in os.listdir(journal_dir):
+        match = re.fullmatch(r'captures-(\d+)\.journal', file_name)
+        if match and int(match.group(1)) >= worker_count and \
+           os.path.getsize(os.path.join(journal_dir, file_name)) > 0:
+            logging.warning('Capture journal %s is not used with %d workers, its captures will not be '
+                            'stored', file_name, worker_count)
+
+
+def _connect_database(args, count):
+    """
+    Establishes the given number of database connections, all of them using UTC as time zone.
+    """
+
+    db_conns = []
+    for _ in range(count):
+        db_conn = psycopg2.connect(host=args.dbhost, database=args.dbname, user=args.dbuser,
+                                   password=args.dbpassword)
+
+        # Keep our mental model easy by always using (timezone-aware) UTC for dates and times
+        with transaction_cursor(db_conn) as cursor:
+            cursor.execute('SET TIME ZONE "UTC"')
+
+        db_conns.append(db_conn)
+
+    return db_conns
+
+
+def run_worker(args, listen_host, listen_port, reuse_port, params):
+    """
+    Runs a complete server with its own database connections, either in the main process or in a forked
+    worker process.
+    """
+
+    try:
+        # One additional connection is exclusively used to listen for notifications
+        db_conns = _connect_database(args, args.dbconnections + 1)
+    except psycopg2.OperationalError as e:
+        logging.error('Could not establish database connection: %s', e)
+        return os.EX_UNAVAILABLE
+    logging.info('Established %d database connections', len(db_conns))
+    notify_conn = db_conns.pop()
 
     while True:
         try:
-            competition_name, flag_prefix = database.get_static_info(db_conn)
+            competition_name, flag_prefix = database.get_static_info(db_conns[0])
         except DBDataError as e:
             logging.warning('Invalid database state, sleeping for 60 seconds: %s', e)
             time.sleep(60)
         else:
             break
 
-    asyncio.run(serve(listen_host, listen_port, db_conn, {
-        'flag_secret': flag_secret,
-        'team_regex': team_regex,
-        'competition_name': competition_name,
-        'flag_prefix': flag_prefix,
-        'metrics': metrics
-    }))
-
-    return os.EX_OK
-
-
-def make_metrics(registry=prometheus_client.REGISTRY):
+    def connect():
+        return _connect_database(args, 1)[0]
 
-    metrics = {}
-    metric_prefix = 'ctf_submission_'
+    db_pool = ConnectionPool(db_conns, connect)
 
-    counters = [
-        ('connections', 'Total number of connections', ['team_net_no']),
-        ('flags_ok', 'Number of submitted valid flags', ['team_net_no']),
-        ('flags_dup', 'Number of submitted duplicate flags', ['team_net_no']),
-        ('flags_old', 'Number of submitted expired flags', ['team_net_no']),
-        ('flags_own', 'Number of submitted own flags', ['team_net_no']),
-        ('flags_inv', 'Number of submitted invalid flags', ['team_net_no']),
-        ('flags_err', 'Number of submitted flags which resulted in an error', ['team_net_no']),
-        ('server_kills', 'Number of times the server was force-restarted due to fatal errors', []),
-        ('unhandled_exceptions', 'Number of unexpected exceptions in client connections', [])
-    ]
-    for name, doc, labels in counters:
-        metrics[name] = prometheus_client.Counter(metric_prefix+name, doc, labels, registry=registry)
+    # Writer thread has to be started here because threads do not survive forking
+    if params['log_queue_size'] > 0:
+        log_writer = start_log_writer(params['log_queue_size'], params['metrics'])
+    else:
+        log_writer = None
 
-    gauges = [
-        ('start_timestamp', '(Unix) timestamp when the process was started', []),
-        ('open_connections', 'Number of currently open connections', ['team_net_no'])
-    ]
-    for name, doc, labels in gauges:
-        metrics[name] = prometheus_client.Gauge(metric_prefix+name, doc, labels, registry=registry)
-
-    histograms = [
-        ('submission_duration', 'Time spent processing a single flag in seconds', [])
-    ]
-    for name, doc, labels in histograms:
-        # The default buckets seem appropriate for our use case
-        metrics[name] = prometheus_client.Histogram(metric_prefix+name, doc, labels, registry=registry)
+    try:
+        eventloop.run(serve(listen_host, listen_port, db_pool, {
+            **params,
+            'competition_name': competition_name,
+            'flag_prefix': flag_prefix,
+            'notify_conn': notify_conn,
+            'db_connect': connect
+        }, reuse_port), args.event_loop)
+    finally:
+        if log_writer is not None:
+            log_writer.stop()
 
-    return metrics
+    return os.EX_OK
 
 
-async def serve(host, port, db_conn, params):
+def default_params():
+    """
+    Returns the params for run_worker() and serve() with the same defaults as the command-line options.
+    Callers must add "flag_secret", "competition_name", "flag_prefix" and "metrics" and can override
+    anything else.
+    """
 
-    async def wrapper(reader, writer):
+    return {
+        'team_regex': None,
+        'capture_batch_window': 0.01,
+        'capture_batch_size': 500,
+        'capture_journal_dir': None,
+        'capture_db_timeout': 5,
+        'journal_replay_interval': 5,
+        'traffic_record_dir': None,
+        'worker_no': 0,
+        'http_listen': None,
+        'http_max_flags': 500,
+        'flag_cache_size': 20000,
+        'team_flag_rate': 0,
+        'team_connection_limit': 0,
+        'team_metrics_mode': 'full',
+        'team_metrics_size': 0,
+        'log_queue_size': 10000,
+        'log_sample_rates': {},
+        'log_summary_interval': 60,
+        'state_refresh_interval': 5,
+        'teams_refresh_interval': 60,
+        'flags_refresh_interval': 300,
+        'listen_sockets': [],
+        'listen_backlog': 100,
+        'tcp_nodelay': True,
+        'read_buffer_limit': 2**16,
+        'write_buffer_limit': 2**16,
+        'max_line_length': 1024,
+        'write_timeout': TIMEOUT_SECONDS,
+        'drain_timeout': 10,
+        'notify_conn': None,
+        'db_connect': None
+    }
+
+
+async def serve(host, port, db_pool, params, reuse_port=False):
+
+    game_state = GameState(db_pool, params['state_refresh_interval'])
+    team_directory = TeamDirectory(db_pool, params['teams_refresh_interval'])
+    await game_state.refresh()
+    await team_directory.refresh()
+    flag_services = FlagServices(db_pool, params['flags_refresh_interval'], game_state)
+    await flag_services.refresh()
+    submission_log = SubmissionLog(params['log_sample_rates'], params['log_summary_interval'])
+    background_tasks = [asyncio.create_task(game_state.run()), asyncio.create_task(team_directory.run()),
+                        asyncio.create_task(flag_services.run()), asyncio.create_task(submission_log.run())]
+
+    dup_index = DuplicateIndex(game_state)
+    await dup_index.load(db_pool)
+    logging.info('Loaded %d previous captures', len(dup_index))
+
+    if params['capture_journal_dir'] is not None:
+        journal_path = os.path.join(params['capture_journal_dir'], f'captures-{params["worker_no"]}.journal')
+        journal = CaptureJournal(journal_path, params['journal_replay_interval'], params['metrics'])
+        for flag_id, team_id, tick, _ in journal.open():
+            dup_index.add(flag_id, team_id, tick)
+        background_tasks.append(asyncio.create_task(journal.run(db_pool)))
+    else:
+        journal = None
+
+    if params['traffic_record_dir'] is not None:
+        file_name = f'traffic-{time.strftime("%Y%m%d%H%M%S")}-{os.getpid()}.rec'
+        recorder = TrafficRecorder(os.path.join(params['traffic_record_dir'], file_name), params['metrics'])
+        recorder.open()
+        background_tasks.append(asyncio.create_task(recorder.run()))
+    else:
+        recorder = None
+
+    if params['notify_conn'] is not None:
+        listener = NotificationListener(params['notify_conn'], params['db_connect'])
+        listener.subscribe(GAMECONTROL_CHANNEL, game_state.notify)
+        listener.subscribe(TEAMS_CHANNEL, team_directory.notify)
+        listener.start()
+    else:
+        listener = None
+
+    team_metrics = TeamMetrics(params['metrics'], params['team_metrics_mode'], params['team_metrics_size'])
+
+    params = {
+        **params,
+        'game_state': game_state,
+        'team_directory': team_directory,
+        'flag_services': flag_services,
+        'submission_log': submission_log,
+        'flag_cache': VerifiedFlagCache(flag_lib.FlagVerifier(params['flag_secret'], params['flag_prefix']),
+                                        params['flag_cache_size'], params['metrics']),
+        'team_metrics': team_metrics,
+        'service_metrics': ServiceMetrics(params['metrics']),
+        'traffic_recorder': recorder,
+        'admission_control': AdmissionControl(params['team_flag_rate'], params['team_connection_limit'],
+                                              team_metrics),
+        'capture_batcher': CaptureBatcher(db_pool, params['capture_batch_window'],
+                                          params['capture_batch_size'], dup_index, journal,
+                                          params['capture_db_timeout'])
+    }
+
+    # Handler tasks of open connections and their StreamReaders
+    connections = {}
+
+    async def wrapper(handler, reader, writer):
         metrics = params['metrics']
         client_addr = writer.get_extra_info('peername')[0]
+        task = asyncio.current_task()
+        connections[task] = reader
+        eventloop.tune_connection(writer, params['tcp_nodelay'], params['write_buffer_limit'])
 
         try:
-            await handle_connection(reader, writer, db_conn, params)
+            await handler(reader, writer, params)
+        except (ConnectionDrained, asyncio.CancelledError):
+            writer.close()
         except KillServerException:
             logging.error('Encountered fatal error, exiting')
             metrics['server_kills'].inc()
@@ -184,161 +571,347 @@ async def serve(host, port, db_conn, params):
             logging.exception('[%s]: Exception in client connection, closing the connection:', client_addr)
             metrics['unhandled_exceptions'].inc()
             writer.close()
+        finally:
+            del connections[task]
+
+    servers = []
+    server_options = {
+        'backlog': params['listen_backlog'],
+        'limit': params['read_buffer_limit'],
+        'start_serving': False
+    }
+
+    if params['listen_sockets']:
+        # Sockets from systemd survive restarts of the service, so no connections get refused meanwhile
+        for name, sock in params['listen_sockets']:
+            handler = handle_http_connection if name == HTTP_SOCKET_NAME else handle_connection
+            logging.info('Starting %s on socket %s from systemd',
+                         'HTTP API' if name == HTTP_SOCKET_NAME else 'server', sock.getsockname())
+            servers.append(await asyncio.start_server(functools.partial(wrapper, handler), sock=sock,
+                                                      **server_options))
+    else:
+        logging.info('Starting server on %s:%d', host, port)
+        # With multiple worker processes, the kernel distributes connections among all of them
+        servers.append(await asyncio.start_server(functools.partial(wrapper, handle_connection), host, port,
+                                                  reuse_port=reuse_port, **server_options))
+
+        if params['http_listen'] is not None:
+            http_host, http_port = params['http_listen']
+            logging.info('Starting HTTP API on %s:%d', http_host, http_port)
+            servers.append(await asyncio.start_server(functools.partial(wrapper, handle_http_connection),
+                                                      http_host, http_port, reuse_port=reuse_port,
+                                                      **server_options))
+
+    loop = asyncio.get_running_loop()
+    terminate = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, terminate.set)
+
+    try:
+        for server in servers:
+            await server.start_serving()
+        await terminate.wait()
+
+        logging.info('Received SIGTERM, draining %d connections', len(connections))
+        for server in servers:
+            server.close()
+        await _drain_connections(connections, params['drain_timeout'])
+        await params['capture_batcher'].flush()
+        logging.info('Finished draining, exiting')
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+        for server in servers:
+            server.close()
+        for task in background_tasks:
+            task.cancel()
+        if journal is not None:
+            journal.close()
+        if recorder is not None:
+            recorder.close()
+        if listener is not None:
+            listener.close()
+        # Worker threads would otherwise keep the process from exiting
+        db_pool.close()
+
+
+async def _drain_connections(connections, timeout):
+    """
+    Gracefully closes all connections from the given dict, mapping handler tasks to StreamReaders. Reading
+    from the connections fails with ConnectionDrained, so batches of flags which are being processed get
+    finished and answered. Handlers which take longer than `timeout` seconds get cancelled.
+    """
 
-    logging.info('Starting server on %s:%d', host, port)
-    server = await asyncio.start_server(wrapper, host, port)
+    for reader in connections.values():
+        reader.set_exception(ConnectionDrained())
 
-    async with server:
-        await server.serve_forever()
+    if not connections:
+        return
 
+    _, pending = await asyncio.wait(list(connections.keys()), timeout=timeout)
+    if pending:
+        logging.warning('Cancelling %d connections which did not finish in time', len(pending))
+        for task in pending:
+            task.cancel()
+        await asyncio.wait(pending)
 
-async def handle_connection(reader, writer, db_conn, params):
+
+async def handle_connection(reader, writer, params):
     """
     Coroutine managing the protocol flow with a single client.
     """
 
-    metrics = params['metrics']
     client_addr = writer.get_extra_info('peername')[0]
 
     try:
         client_net_no = _match_net_number(params['team_regex'], client_addr)
     except ValueError:
         logging.error('[%s]: Could not match client address with team, closing the connection', client_addr)
-        metrics['connections'].labels(-1).inc()
+        params['team_metrics'].bind(-1)['connections'].inc()
         writer.write(b'Error: Could not match your IP address with a team\n')
         writer.close()
         return
 
-    metrics['connections'].labels(client_net_no).inc()
-    metrics['open_connections'].labels(client_net_no).inc()
+    # Label values of the per-team metrics are fixed for the connection's lifetime
+    team_metrics = params['team_metrics'].bind(client_net_no)
+    team_metrics['connections'].inc()
+    team_metrics['open_connections'].inc()
 
     try:
-        await handle_team_connection(reader, writer, db_conn, params, client_addr, client_net_no)
+        # Connections over the limit are accepted, but do not get served until a slot becomes free
+        async with params['admission_control'].connection_slot(client_net_no):
+            await handle_team_connection(reader, writer, params, client_addr, client_net_no, team_metrics)
     finally:
-        metrics['open_connections'].labels(client_net_no).dec()
+        team_metrics['open_connections'].dec()
 
 
-async def handle_team_connection(reader, writer, db_conn, params, client_addr, client_net_no):
+async def handle_http_connection(reader, writer, params):
     """
-    Continuation of handle_connection() for when the net number is already known.
-    Communication with the database happens synchronously because psycopg2 does not support asyncio. We do
-    not think that is a practical issue.
+    Coroutine managing the HTTP API for a single client. Flags get POSTed to HTTP_PATH as JSON array and
+    the response contains a JSON object per flag (in the same order) with the keys "flag", "code" and
+    "message", whose values correspond to the line-based protocol.
     """
 
-    metrics = params['metrics']
+    client_addr = writer.get_extra_info('peername')[0]
+
+    try:
+        client_net_no = _match_net_number(params['team_regex'], client_addr)
+    except ValueError:
+        logging.error('[%s]: Could not match client address with team', client_addr)
+        params['team_metrics'].bind(-1)['connections'].inc()
+        client_net_no = None
+        team_metrics = None
+        slot = contextlib.nullcontext()
+    else:
+        team_metrics = params['team_metrics'].bind(client_net_no)
+        team_metrics['connections'].inc()
+        slot = params['admission_control'].connection_slot(client_net_no)
+
+    log = functools.partial(params['submission_log'].log, client_net_no, client_addr)
+
+    # Leave room for quotes, separators and some whitespace around every flag
+    max_body_size = params['http_max_flags'] * (len(params['flag_prefix']) + flag_lib.ENCODED_LEN + 8) + 2
+
+    async with slot:
+        while True:
+            try:
+                request = await asyncio.wait_for(http_api.read_request(reader, max_body_size),
+                                                 TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                log('INFO', 'Read timeout expired')
+                break
+            except ConnectionDrained:
+                log('INFO', 'Server is shutting down')
+                break
+            except http_api.HTTPError as e:
+                http_api.write_response(writer, e.status, {'error': e.message}, False)
+                await writer.drain()
+                break
+
+            if request is None:
+                break
+
+            timer = StageTimer()
+            try:
+                result = await _handle_http_request(request, params, client_net_no, team_metrics, log, timer)
+            except http_api.HTTPError as e:
+                http_api.write_response(writer, e.status, {'error': e.message}, request.keep_alive)
+                timer = None
+            else:
+                http_api.write_response(writer, HTTPStatus.OK, result, request.keep_alive)
+
+            try:
+                await asyncio.wait_for(writer.drain(), params['write_timeout'])
+            except ConnectionDrained:
+                break
+            except asyncio.TimeoutError:
+                log('INFO', 'Write timeout expired')
+                if team_metrics is not None:
+                    team_metrics['write_timeouts'].inc()
+                break
+            except:    # noqa, pylint: disable=bare-except
+                log('INFO', 'Could not write response')
+                break
+            if timer is not None:
+                timer.lap('response_write')
+                timer.observe(params['metrics']['stage_duration'])
+
+            if not request.keep_alive:
+                break
+
+    writer.close()
+
+
+async def _handle_http_request(request, params, client_net_no, team_metrics, log, timer):
+
+    if request.target != HTTP_PATH:
+        raise http_api.HTTPError(HTTPStatus.NOT_FOUND, f'Flags must be submitted to {HTTP_PATH}')
+    if request.method != 'POST':
+        raise http_api.HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'Flags must be submitted using POST')
+    if client_net_no is None:
+        raise http_api.HTTPError(HTTPStatus.FORBIDDEN, 'Could not match your IP address with a team')
+
+    try:
+        flags = json.loads(request.body)
+    except ValueError:
+        flags = None
+    if not isinstance(flags, list) or not all(isinstance(flag, str) for flag in flags):
+        raise http_api.HTTPError(HTTPStatus.BAD_REQUEST, 'Body must be a JSON array of strings')
+    if len(flags) > params['http_max_flags']:
+        raise http_api.HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                 f'At most {params["http_max_flags"]} flags are allowed per request')
+
+    team_metrics['http_requests'].inc()
 
-    def log(level_name, message, *args):
-        level = logging.getLevelName(level_name)
-        logging.log(level, '%d [%s]: ' + message, client_net_no, client_addr, *args)
+    raw_flags = [flag.encode('utf-8', 'replace') for flag in flags]
+    if params['traffic_recorder'] is not None:
+        params['traffic_recorder'].record(client_net_no, raw_flags)
+    await params['admission_control'].throttle(client_net_no, len(raw_flags))
+    responses = await process_flags(raw_flags, params, client_net_no, team_metrics, log, timer)
+
+    results = []
+    for flag, raw_flag, response in zip(flags, raw_flags, responses):
+        # Responses are "<flag> <code>[ <message>]\n"
+        code, _, message = response[len(raw_flag)+1:-1].decode('utf-8').partition(' ')
+        results.append({'flag': flag, 'code': code, 'message': message})
+
+    return results
+
+
+async def handle_team_connection(reader, writer, params, client_addr, client_net_no, team_metrics):
+    """
+    Continuation of handle_connection() for when the net number is already known.
+    Submissions are processed in a pipelined manner: All complete lines received so far get handled in
+    batches, whose captures are stored together and whose responses are written at once (in order). Game
+    state and team information come from in-process snapshots, so the database only gets accessed for storing
+    captures. That happens in batches through the connection pool, which allows flags from different
+    connections to be stored concurrently without blocking the event loop.
+    Memory per connection is bounded by the read and write buffer limits and the maximum line length.
+    """
+
+    log = functools.partial(params['submission_log'].log, client_net_no, client_addr)
 
     log('INFO', 'Accepted connection from %s (team net number %d)', client_addr, client_net_no)
 
     writer.write(f'{params["competition_name"]} Flag Submission Server\n'.encode('utf-8'))
     writer.write(b'One flag per line please!\n\n')
 
-    line_start_time = None
+    line_splitter = LineSplitter(params['max_line_length'])
+    keep_open = True
 
-    while True:
-        # Record duration of the previous loop iteration
-        if line_start_time is not None:
-            duration_seconds = (time.monotonic_ns() - line_start_time) / 10**9
-            metrics['submission_duration'].observe(duration_seconds)
-
-        # Prevent asyncio buffer of unbounded size (i.e. memory leak) if the client never reads our responses
+    while keep_open:
         try:
-            await asyncio.wait_for(writer.drain(), TIMEOUT_SECONDS)
-        except:    # noqa, pylint: disable=bare-except
-            log('INFO', 'Write timeout expired')
-            break
-
-        try:
-            line = await asyncio.wait_for(reader.readline(), TIMEOUT_SECONDS)
+            # Returns everything that is already buffered (up to the limit) without waiting for more data
+            data = await asyncio.wait_for(reader.read(params['read_buffer_limit']), TIMEOUT_SECONDS)
         except asyncio.TimeoutError:
             log('INFO', 'Read timeout expired')
             break
-
-        line_start_time = time.monotonic_ns()
-
-        if not line.endswith(b'\n'):
-            # EOF
+        except ConnectionDrained:
+            log('INFO', 'Server is shutting down')
             break
-        raw_flag = line[:-1]
 
-        try:
-            flag = raw_flag.decode('ascii')
-        except UnicodeDecodeError:
-            writer.write(raw_flag + b' INV Invalid flag\n')
-            log('INFO', 'Flag %s rejected due to bad encoding', repr(raw_flag))
-            metrics['flags_inv'].labels(client_net_no).inc()
-            continue
+        if not data:
+            # EOF, an incomplete last line gets discarded
+            break
 
-        try:
-            flag_id, protecting_net_no = flag_lib.verify(flag, params['flag_secret'], params['flag_prefix'])
-        except flag_lib.InvalidFlagFormat:
-            writer.write(raw_flag + b' INV Invalid flag\n')
-            log('INFO', 'Flag %s rejected due to invalid format', repr(flag))
-            metrics['flags_inv'].labels(client_net_no).inc()
-            continue
-        except flag_lib.InvalidFlagMAC:
-            writer.write(raw_flag + b' INV Invalid flag\n')
-            log('INFO', 'Flag %s rejected due to invalid MAC', repr(flag))
-            metrics['flags_inv'].labels(client_net_no).inc()
-            continue
-        except flag_lib.FlagExpired as e:
-            writer.write(raw_flag + b' OLD Flag has expired\n')
-            log('INFO', 'Flag %s rejected because it has expired since %s', repr(flag),
-                e.expiration_time.isoformat())
-            metrics['flags_old'].labels(client_net_no).inc()
-            continue
-
-        if protecting_net_no == client_net_no:
-            writer.write(raw_flag + b' OWN You cannot submit your own flag\n')
-            log('INFO', 'Flag %s rejected because it is protected by submitting team', repr(flag))
-            metrics['flags_own'].labels(client_net_no).inc()
-            continue
+        # Batches are small enough that their responses fit into the write buffer limit, so that at most
+        # twice the limit is pending per connection
+        lines = line_splitter.feed(data)
+        if params['traffic_recorder'] is not None:
+            params['traffic_recorder'].record(client_net_no, lines)
 
-        try:
-            now = datetime.datetime.now(datetime.timezone.utc)
-            start, end = database.get_dynamic_info(db_conn)
-            if now < start:
-                writer.write(raw_flag + b' ERR Competition has not even started yet\n')
-                log('INFO', 'Flag %s rejected because competition has not started', repr(flag))
-                metrics['flags_err'].labels(client_net_no).inc()
-                continue
-            if now >= end:
-                writer.write(raw_flag + b' ERR Competition is over\n')
-                log('INFO', 'Flag %s rejected because competition is over', repr(flag))
-                metrics['flags_err'].labels(client_net_no).inc()
-                continue
-
-            if database.team_is_nop(db_conn, protecting_net_no):
-                writer.write(raw_flag + b' INV You cannot submit flags of a NOP team\n')
-                log('INFO', 'Flag %s rejected because it is protected by a NOP team', repr(flag))
-                metrics['flags_inv'].labels(client_net_no).inc()
-                continue
-
-            try:
-                database.add_capture(db_conn, flag_id, client_net_no)
-                writer.write(raw_flag + b' OK\n')
-                log('INFO', 'Flag %s accepted', repr(flag))
-                metrics['flags_ok'].labels(client_net_no).inc()
-            except database.DuplicateCapture:
-                writer.write(raw_flag + b' DUP You already submitted this flag\n')
-                log('INFO', 'Flag %s rejected because it has already been submitted before', repr(flag))
-                metrics['flags_dup'].labels(client_net_no).inc()
-            except database.TeamNotExisting:
-                writer.write(raw_flag + b' ERR Could not find team\n')
-                log('WARNING', 'Flag %s: Could not find team for net number %d in database', repr(flag),
-                    client_net_no)
-                metrics['flags_err'].labels(client_net_no).inc()
-        except (psycopg2.Error, sqlite3.Error) as e:
-            logging.exception('Database error:')
-            raise KillServerException() from e
+        for batch in _split_batches(lines, params['write_buffer_limit']):
+            keep_open = await _answer_batch(batch, writer, params, client_net_no, team_metrics, log)
+            if not keep_open:
+                break
 
     log('INFO', 'Closing connection')
     writer.close()
 
 
+def _split_batches(lines, max_output_size):
+    """
+    Splits a list of lines into batches whose responses are estimated to take at most `max_output_size`
+    bytes, but at least one line per batch.
+    """
+
+    batch = []
+    batch_size = 0
+
+    for line in lines:
+        line_size = len(line) + MAX_RESPONSE_OVERHEAD
+        if batch and batch_size + line_size > max_output_size:
+            yield batch
+            batch = []
+            batch_size = 0
+        batch.append(line)
+        batch_size += line_size
+
+    if batch:
+        yield batch
+
+
+async def _answer_batch(lines, writer, params, client_net_no, team_metrics, log):
+    """
+    Processes a batch of lines from a team connection and writes the responses, waiting until the pending
+    output is below the write buffer limit again. Returns whether the connection should be kept open.
+    """
+
+    metrics = params['metrics']
+
+    # Not reading anything while throttled creates backpressure through the TCP receive window
+    await params['admission_control'].throttle(client_net_no, len(lines))
+
+    batch_start_time = time.monotonic_ns()
+    timer = StageTimer()
+
+    responses = await process_flags(lines, params, client_net_no, team_metrics, log, timer)
+    writer.writelines(responses)
+
+    duration_seconds = (time.monotonic_ns() - batch_start_time) / 10**9
+    for _ in lines:
+        metrics['submission_duration'].observe(duration_seconds)
+
+    # Prevent asyncio buffer of unbounded size (i.e. memory leak) if the client never reads our responses,
+    # no further input gets read from the StreamReader meanwhile
+    if writer.transport.get_write_buffer_size() > params['write_buffer_limit']:
+        team_metrics['write_stalls'].inc()
+    try:
+        await asyncio.wait_for(writer.drain(), params['write_timeout'])
+    except ConnectionDrained:
+        # Responses still get sent when closing the connection
+        return False
+    except asyncio.TimeoutError:
+        log('INFO', 'Write timeout expired, client does not read responses')
+        team_metrics['write_timeouts'].inc()
+        return False
+    except:    # noqa, pylint: disable=bare-except
+        log('INFO', 'Could not write responses')
+        return False
+    timer.lap('response_write')
+    timer.observe(metrics['stage_duration'])
+
+    return True
+
+
 def _match_net_number(regex, addr):
     """
     Determines the net number for an address using the given regex. Implemented as separate function to
@@ -352,8 +925,7 @@ def _match_net_number(regex, addr):
     return int(match.group(1))
 
 
-class KillServerException(Exception):
+class ConnectionDrained(Exception):
     """
-    Indicates that a fatal error occured and the server shall be stopped (and then usually get restarted
-    through systemd).
+    Indicates that a connection is being closed because the server is shutting down.
     """
@@ -0,0 +1,18 @@
+"""
+Utilities for writing unit tests for the Submission server.
+"""
+
+from .captures import DuplicateIndex
+from .state import GameState
+
+
+def make_dup_index(current_tick=6, valid_ticks=5):
+    """
+    Returns an empty DuplicateIndex with a GameState which does not access the database. The defaults match
+    the test fixtures.
+    """
+
+    game_state = GameState(None, 1)
+    game_state.current_tick = current_tick
+    game_state.valid_ticks = valid_ticks
+    return DuplicateIndex(game_state)
@@ -0,0 +1,93 @@
+"""
+Management of worker processes for running multiple instances of the server, which all listen on the same
+port.
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+
+import prometheus_client
+import prometheus_client.multiprocess
+import prometheus_client.values
+
+
+def enable_multiprocess_metrics(metrics_dir):
+    """
+    Switches prometheus_client to its multi-process mode, where every process writes its metric values to
+    files in `metrics_dir`. Returns a registry which aggregates the values from all processes.
+    Must be called before any metrics get created.
+    """
+
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir
+    # The value implementation is chosen when the module gets imported, i.e. before we had a chance to set
+    # the environment variable
+    prometheus_client.values.ValueClass = prometheus_client.values.MultiProcessValue()
+
+    registry = prometheus_client.CollectorRegistry()
+    prometheus_client.multiprocess.MultiProcessCollector(registry)
+
+    return registry
+
+
+def start_workers(count, target, worker_args):
+    """
+    Forks the given number of worker processes, which run `target(*worker_args)` and exit with its return
+    value as exit code. The last item of `worker_args` must be the params dict, to which the number of the
+    respective worker gets added as "worker_no".
+    """
+
+    def worker_main(*args):
+        sys.exit(target(*args))
+
+    # Workers inherit the parsed arguments and metrics, so they must be forked instead of spawned
+    context = multiprocessing.get_context('fork')
+    workers = []
+
+    for i in range(count):
+        args = (*worker_args[:-1], {**worker_args[-1], 'worker_no': i})
+        worker = context.Process(target=worker_main, args=args, name=f'SubmissionWorker-{i}')
+        worker.start()
+        logging.info('Started worker process %d', worker.pid)
+        workers.append(worker)
+
+    return workers
+
+
+def supervise_workers(workers):
+    """
+    Waits until any of the worker processes exits (or we get terminated) and then stops all the other ones.
+    The workers are not restarted individually, the whole service is supposed to be restarted by systemd
+    instead.
+    """
+
+    terminating = False
+
+    def sigterm_handler(_, __):
+        nonlocal terminating
+        terminating = True
+        for worker in workers:
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, sigterm_handler)
+
+    multiprocessing.connection.wait([worker.sentinel for worker in workers])
+    exit_code = os.EX_OK
+
+    if not terminating:
+        for worker in workers:
+            if worker.exitcode is not None:
+                logging.error('Worker process %d exited with code %d, stopping all workers', worker.pid,
+                              worker.exitcode)
+                exit_code = os.EX_SOFTWARE
+        for worker in workers:
+            worker.terminate()
+
+    for worker in workers:
+        worker.join()
+        prometheus_client.multiprocess.mark_process_dead(worker.pid)
+
+    return exit_code
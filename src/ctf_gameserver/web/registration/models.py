@@ -1,5 +1,6 @@
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models.signals import post_delete, post_save
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
@@ -52,6 +53,22 @@ class Team(models.Model):
         return self.user.username
 
 
+def _notify_team_change(**_):
+    """
+    Signal receiver which lets Submission servers know that they have to refresh their cached team
+    information.
+    """
+
+    # Notifications are a PostgreSQL feature, other databases are only used during development
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('NOTIFY ctf_teams')
+
+
+post_save.connect(_notify_team_change, sender=Team)
+post_delete.connect(_notify_team_change, sender=Team)
+
+
 class TeamDownload(models.Model):
     """
     Database representation of a single type of per-team download. One file with the specified name can
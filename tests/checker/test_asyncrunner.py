@@ -0,0 +1,204 @@
+import errno
+import os.path
+import unittest
+from unittest import SkipTest
+from unittest.mock import patch
+import tempfile
+import time
+
+from ctf_gameserver.checker import asyncrunner
+from ctf_gameserver.checker.master import MasterLoop
+from ctf_gameserver.checker.metrics import DummyQueue
+from ctf_gameserver.lib.checkresult import CheckResult
+from ctf_gameserver.lib.database import transaction_cursor
+from ctf_gameserver.lib.test_util import DatabaseTestCase
+
+
+class AsyncRunnerTest(DatabaseTestCase):
+    """
+    Integration tests for the asyncio Runner engine, see IntegrationTest for more scenarios with the default
+    engine.
+    """
+
+    fixtures = ['tests/checker/fixtures/integration.json']
+
+    def setUp(self):
+        if not asyncrunner.is_available():
+            raise SkipTest('asyncio Runner engine not available')
+
+        self.check_duration_patch = patch('ctf_gameserver.checker.database.get_check_duration')
+        check_duration_mock = self.check_duration_patch.start()
+        check_duration_mock.return_value = None
+
+    def tearDown(self):
+        self.check_duration_patch.stop()
+
+    def start_tick(self, checkerscript_name, monotonic_mock):
+        master_loop = self.make_master_loop(checkerscript_name, monotonic_mock)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('UPDATE scoring_gamecontrol SET start=NOW()')
+            cursor.execute('UPDATE scoring_gamecontrol SET current_tick=0')
+            cursor.execute('INSERT INTO scoring_flag (service_id, protecting_team_id, tick)'
+                           '    VALUES (1, 2, 0)')
+        monotonic_mock.return_value = 20
+
+        master_loop.supervisor.queue_timeout = 0.01
+        # Checker Script gets started, will return False because no messages yet
+        self.assertFalse(master_loop.step())
+        master_loop.supervisor.queue_timeout = 10
+
+        return master_loop
+
+    def make_master_loop(self, checkerscript_name, monotonic_mock, worker_tasks=0, zygote=False):
+        checkerscript_path = os.path.join(os.path.dirname(__file__), checkerscript_name)
+
+        monotonic_mock.return_value = 10
+        return MasterLoop(self.connection, 'service1', checkerscript_path, None, 2, 1, 10, '0.0.%s.1',
+                          b'secret', {}, DummyQueue(), 'asyncio', worker_tasks, zygote)
+
+    @patch('ctf_gameserver.checker.master.get_monotonic_time')
+    def test_basic(self, monotonic_mock):
+        master_loop = self.start_tick('integration_basic_checkerscript.py', monotonic_mock)
+
+        # Handle all messages from Checker Script
+        while master_loop.step():
+            pass
+        self.assertEqual(master_loop.get_running_script_count(), 0)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scoring_flag WHERE placement_end IS NOT NULL')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('SELECT status FROM scoring_statuscheck'
+                           '    WHERE service_id=1 AND team_id=2 AND tick=0')
+            self.assertEqual(cursor.fetchone()[0], CheckResult.OK.value)
+            cursor.execute('SELECT flagid FROM scoring_flag'
+                           '    WHERE service_id=1 AND protecting_team_id=2 AND tick=0')
+            self.assertEqual(cursor.fetchone()[0], 'value identifier')
+
+    @patch('ctf_gameserver.checker.master.get_monotonic_time')
+    def test_missing_checkerscript(self, monotonic_mock):
+        master_loop = self.start_tick('does not exist', monotonic_mock)
+
+        while master_loop.step():
+            pass
+        self.assertEqual(master_loop.get_running_script_count(), 0)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scoring_statuscheck')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    @patch('logging.warning')
+    @patch('ctf_gameserver.checker.master.get_monotonic_time')
+    def test_unfinished(self, monotonic_mock, warning_mock):
+        checkerscript_pidfile = tempfile.NamedTemporaryFile()
+        os.environ['CHECKERSCRIPT_PIDFILE'] = checkerscript_pidfile.name
+
+        master_loop = self.start_tick('integration_unfinished_checkerscript.py', monotonic_mock)
+        self.assertTrue(master_loop.step())
+
+        checkerscript_pidfile.seek(0)
+        checkerscript_pid = int(checkerscript_pidfile.read())
+        # Ensure process is running by sending signal 0
+        os.kill(checkerscript_pid, 0)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('UPDATE scoring_gamecontrol SET current_tick=1')
+        master_loop.supervisor.queue_timeout = 0.01
+        monotonic_mock.return_value = 190
+        self.assertFalse(master_loop.step())
+        self.assertEqual(master_loop.get_running_script_count(), 0)
+
+        # Poll whether the process has been killed, it gets reaped by the event loop
+        for _ in range(100):
+            try:
+                os.kill(checkerscript_pid, 0)
+            except ProcessLookupError:
+                break
+            master_loop.step()
+            time.sleep(0.1)
+        with self.assertRaises(ProcessLookupError):
+            os.kill(checkerscript_pid, 0)
+        self.assertEqual(len(master_loop.supervisor.remaining_processes), 0)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT status FROM scoring_statuscheck'
+                           '    WHERE service_id=1 AND team_id=2 AND tick=0')
+            self.assertEqual(cursor.fetchone()[0], 5)
+
+        warning_mock.assert_any_call('Terminating all %d Checker Scripts', 1)
+
+        del os.environ['CHECKERSCRIPT_PIDFILE']
+        checkerscript_pidfile.close()
+
+    def run_multi_ticks(self, master_loop, monotonic_mock):
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('UPDATE scoring_gamecontrol SET start=NOW()')
+
+        for tick in range(3):
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_gamecontrol SET current_tick=%s', (tick,))
+                cursor.execute('INSERT INTO scoring_flag (service_id, protecting_team_id, tick)'
+                               '    VALUES (1, 2, %s), (1, 3, %s)', (tick, tick))
+            monotonic_mock.return_value = 20 + tick*180
+            master_loop.supervisor.queue_timeout = 0.01
+            self.assertFalse(master_loop.step())
+            monotonic_mock.return_value = 100 + tick*180
+            master_loop.supervisor.queue_timeout = 10
+            while master_loop.step() or master_loop.get_running_script_count() > 0:
+                pass
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT team_id, tick, status FROM scoring_statuscheck ORDER BY tick, team_id')
+            self.assertEqual(cursor.fetchall(), [
+                (2, 0, CheckResult.FAULTY.value), (3, 0, CheckResult.OK.value),
+                (2, 1, CheckResult.DOWN.value), (3, 1, CheckResult.FAULTY.value),
+                (2, 2, CheckResult.RECOVERING.value), (3, 2, CheckResult.OK.value)
+            ])
+
+    @patch('ctf_gameserver.checker.asyncrunner.os.posix_spawnp', wraps=os.posix_spawnp)
+    @patch('ctf_gameserver.checker.master.get_monotonic_time')
+    def test_worker(self, monotonic_mock, spawn_mock):
+        master_loop = self.make_master_loop('integration_multi_checkerscript.py', monotonic_mock, 2)
+        self.run_multi_ticks(master_loop, monotonic_mock)
+
+        # Two workers for the first two ticks, which get recycled for the last one
+        self.assertEqual(spawn_mock.call_count, 4)
+        for call in spawn_mock.call_args_list:
+            self.assertEqual(len(call.args[1]), 1)
+            self.assertEqual(call.args[2]['CTF_CHECKERSCRIPT_WORKER'], '1')
+
+        for worker in master_loop.supervisor.idle_workers:
+            worker.kill()
+
+    @patch('ctf_gameserver.checker.asyncrunner.os.posix_spawnp', wraps=os.posix_spawnp)
+    @patch('ctf_gameserver.checker.master.get_monotonic_time')
+    def test_zygote(self, monotonic_mock, spawn_mock):
+        master_loop = self.make_master_loop('integration_multi_checkerscript.py', monotonic_mock,
+                                            zygote=True)
+        self.run_multi_ticks(master_loop, monotonic_mock)
+
+        # One zygote per tick
+        self.assertEqual(spawn_mock.call_count, 3)
+        for call in spawn_mock.call_args_list:
+            self.assertEqual(len(call.args[1]), 1)
+            self.assertEqual(call.args[2]['CTF_CHECKERSCRIPT_ZYGOTE'], '1')
+
+        # Let the last zygote exit
+        master_loop.supervisor.terminate_runners()
+        for _ in range(100):
+            if not master_loop.supervisor.remaining_processes:
+                break
+            master_loop.step()
+        self.assertEqual(len(master_loop.supervisor.remaining_processes), 0)
+
+
+class AvailabilityTest(unittest.TestCase):
+
+    def test_old_kernel(self):
+        if not hasattr(os, 'pidfd_open'):
+            raise SkipTest('os.pidfd_open() not available')
+
+        with patch('os.pidfd_open') as pidfd_open_mock:
+            pidfd_open_mock.side_effect = OSError(errno.ENOSYS, 'Function not implemented')
+            self.assertFalse(asyncrunner.is_available())
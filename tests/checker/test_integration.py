@@ -194,6 +194,8 @@ class IntegrationTest(DatabaseTestCase):
         self.assertFalse(master_loop.step())
         master_loop.supervisor.queue_timeout = 10
         self.assertTrue(master_loop.step())
+        # Stored state gets committed with the next write transaction
+        self.assertTrue(master_loop.step())
 
         with transaction_cursor(self.connection) as cursor:
             cursor.execute('SELECT data FROM scoring_checkerstate WHERE service_id=1 AND team_id=2')
@@ -265,6 +267,8 @@ class IntegrationTest(DatabaseTestCase):
         self.assertFalse(master_loop.step())
         master_loop.supervisor.queue_timeout = 10
         self.assertTrue(master_loop.step())
+        # Stored state gets committed with the next write transaction
+        self.assertTrue(master_loop.step())
 
         with transaction_cursor(self.connection) as cursor:
             cursor.execute('SELECT data FROM scoring_checkerstate WHERE service_id=1 AND team_id=2')
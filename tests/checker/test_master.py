@@ -1,8 +1,10 @@
 import datetime
-from unittest.mock import patch
+import time
+from unittest.mock import Mock, patch
 
 from ctf_gameserver.checker.master import MasterLoop
 from ctf_gameserver.checker.metrics import DummyQueue
+from ctf_gameserver.checker.supervisor import ACTION_FLAG, ACTION_FLAGID, ACTION_RESULT, ACTION_STORE
 from ctf_gameserver.lib.checkresult import CheckResult
 from ctf_gameserver.lib.database import transaction_cursor
 from ctf_gameserver.lib.flag import verify
@@ -123,6 +125,62 @@ class MasterTest(DatabaseTestCase):
                            '    WHERE service_id = 1 AND protecting_team_id = 2 AND tick = 3')
             self.assertIsNone(cursor.fetchone()[0])
 
+    def test_handle_requests(self):
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('UPDATE scoring_gamecontrol SET start=NOW()')
+            # Let the result for tick 3 violate the unique constraint
+            cursor.execute('INSERT INTO scoring_statuscheck (service_id, team_id, tick, status, timestamp)'
+                           '    VALUES (1, 2, 3, 0, NOW())')
+
+        def make_request(runner_id, action, param, tick):
+            return {
+                'action': action,
+                'param': param,
+                'runner_id': runner_id,
+                'send': Mock(),
+                'info': {'service': 'service1', '_team_id': 2, 'team': 92, 'tick': tick},
+                'time': time.monotonic()
+            }
+
+        requests = [
+            make_request(1, ACTION_FLAG, {'tick': 1}, 1),
+            make_request(2, ACTION_FLAGID, 'value identifier', 1),
+            make_request(3, ACTION_STORE, {'key': 'key', 'data': 'data'}, 1),
+            make_request(4, ACTION_RESULT, CheckResult.OK.value, 1),
+            make_request(5, ACTION_STORE, {'data': 'data'}, 2),
+            make_request(6, ACTION_RESULT, CheckResult.OK.value, 3)
+        ]
+        self.master_loop.supervisor = Mock()
+        self.master_loop.handle_requests(requests)
+
+        flag_id, _ = verify(requests[0]['send'].send.call_args.args[0], self.secret)
+        self.assertEqual(flag_id, 1)
+        # Writes only get acknowledged after they have been committed
+        for req in requests[1:]:
+            req['send'].send.assert_not_called()
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scoring_checkerstate')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        self.master_loop.flush_writes()
+        for req in requests[1:4]:
+            req['send'].send.assert_called_once_with(None)
+        # Missing key and failed write
+        for req in requests[4:]:
+            req['send'].send.assert_not_called()
+        self.assertEqual(self.master_loop.supervisor.terminate_runner.call_count, 2)
+        self.master_loop.supervisor.terminate_runner.assert_any_call(5)
+        self.master_loop.supervisor.terminate_runner.assert_any_call(6)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT flagid, placement_end IS NOT NULL FROM scoring_flag'
+                           '    WHERE service_id = 1 AND protecting_team_id = 2 AND tick = 1')
+            self.assertEqual(cursor.fetchone(), ('value identifier', 1))
+            cursor.execute('SELECT data FROM scoring_checkerstate WHERE team_id = 2 AND key = %s', ('key',))
+            self.assertEqual(cursor.fetchone()[0], 'data')
+            cursor.execute('SELECT COUNT(*) FROM scoring_statuscheck')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
     @patch('ctf_gameserver.checker.database.get_check_duration')
     def test_update_launch_params(self, check_duration_mock):
         # Very short duration, but should be ignored in tick 1
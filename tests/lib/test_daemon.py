@@ -0,0 +1,50 @@
+import os
+import socket
+from unittest import TestCase
+from unittest.mock import patch
+
+from ctf_gameserver.lib import daemon
+
+
+class ListenSocketsTest(TestCase):
+
+    def test_no_sockets(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(daemon.listen_sockets(), [])
+
+        # Sockets meant for another process
+        with patch.dict(os.environ, {'LISTEN_PID': str(os.getpid() + 1), 'LISTEN_FDS': '1'}):
+            self.assertEqual(daemon.listen_sockets(), [])
+
+    def test_sockets(self):
+        server_socks = [socket.create_server(('127.0.0.1', 0)) for _ in range(2)]
+
+        # Move the sockets to where systemd would pass them, preserving whatever is there
+        saved_fds = {}
+        for i, sock in enumerate(server_socks):
+            fd = daemon.SD_LISTEN_FDS_START + i
+            try:
+                saved_fds[fd] = os.dup(fd)
+            except OSError:
+                saved_fds[fd] = None
+            os.dup2(sock.fileno(), fd, inheritable=False)
+
+        try:
+            with patch.dict(os.environ, {'LISTEN_PID': str(os.getpid()), 'LISTEN_FDS': '2',
+                                         'LISTEN_FDNAMES': 'submission:http'}):
+                sockets = daemon.listen_sockets()
+                self.assertNotIn('LISTEN_FDS', os.environ)
+
+            self.assertEqual([name for name, _ in sockets], ['submission', 'http'])
+            for (_, sock), server_sock in zip(sockets, server_socks):
+                self.assertEqual(sock.getsockname(), server_sock.getsockname())
+                sock.detach()
+        finally:
+            for fd, saved_fd in saved_fds.items():
+                if saved_fd is None:
+                    os.close(fd)
+                else:
+                    os.dup2(saved_fd, fd)
+                    os.close(saved_fd)
+            for sock in server_socks:
+                sock.close()
@@ -87,3 +87,84 @@ class FlagTestCase(unittest.TestCase):
 
     def _now(self):
         return datetime.datetime.now(datetime.timezone.utc)
+
+
+class FlagVerifierTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.verifier = flag.FlagVerifier(b'secret', 'FAUST_')
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+
+    def test_valid_flag(self):
+        test_flag = flag.generate(self.now + datetime.timedelta(seconds=12), 12, 13, b'secret', 'FAUST_')
+        self.assertEqual(self.verifier.verify(test_flag), (12, 13))
+
+        test_flag = flag.generate(self.now, 2**32 - 1, 2**16 - 1, b'secret', 'FAUST_')
+        self.assertEqual(self.verifier.verify(test_flag, self.now.timestamp() - 1), (2**32 - 1, 2**16 - 1))
+
+    def test_old_flag(self):
+        expiration = datetime.datetime(2020, 6, 1, 10, 0, tzinfo=datetime.timezone.utc)
+        test_flag = flag.generate(expiration, 12, 13, b'secret', 'FAUST_')
+
+        with self.assertRaises(flag.FlagExpired) as context:
+            self.verifier.verify(test_flag)
+        self.assertEqual(context.exception.expiration_time, expiration)
+
+    def test_invalid_format(self):
+        test_flag = flag.generate(self.now, 12, 13, b'secret', 'FAUST_')
+
+        invalid_flags = ['ABC123', 'FAUST_ABC123', test_flag[:-1], test_flag + 'A', 'FLAG_' + test_flag[5:],
+                         test_flag[:-1] + '-', test_flag[:-1] + '=']
+        for invalid_flag in invalid_flags:
+            with self.assertRaises(flag.InvalidFlagFormat):
+                self.verifier.verify(invalid_flag)
+
+    def test_invalid_mac(self):
+        test_flag = flag.generate(self.now, 12, 13, b'secret', 'FAUST_')
+        wrong_flag = test_flag[:-1] + ('A' if test_flag[-1] != 'A' else 'B')
+
+        with self.assertRaises(flag.InvalidFlagMAC):
+            self.verifier.verify(wrong_flag)
+        with self.assertRaises(flag.InvalidFlagMAC):
+            flag.FlagVerifier(b'other', 'FAUST_').verify(test_flag)
+
+    def test_verify_many(self):
+        valid_flag = flag.generate(self.now + datetime.timedelta(seconds=12), 12, 13, b'secret', 'FAUST_')
+        old_flag = flag.generate(self.now - datetime.timedelta(seconds=12), 14, 15, b'secret', 'FAUST_')
+
+        results = self.verifier.verify_many([valid_flag, 'foo', old_flag, valid_flag])
+
+        self.assertEqual(results[0], (12, 13))
+        self.assertIsInstance(results[1], flag.InvalidFlagFormat)
+        self.assertIsInstance(results[2], flag.FlagExpired)
+        self.assertEqual(results[2].flag_id, 14)
+        self.assertEqual(int(results[2].expiration_time.timestamp()), int(self.now.timestamp()) - 12)
+        self.assertEqual(results[3], (12, 13))
+
+        wrong_flag = valid_flag[:-1] + ('A' if valid_flag[-1] != 'A' else 'B')
+        results = self.verifier.verify_many([wrong_flag, valid_flag[:-2] + '=='])
+        self.assertIsInstance(results[0], flag.InvalidFlagMAC)
+        self.assertIsInstance(results[1], flag.InvalidFlagFormat)
+
+    def test_same_as_verify(self):
+        timestamp = datetime.datetime(2020, 6, 1, 10, 0, tzinfo=datetime.timezone.utc)
+        now = timestamp.timestamp() - 5
+
+        for flag_id in (23, 42):
+            for team in (13, 37):
+                for secret in (b'secret1', b'secret2'):
+                    verifier = flag.FlagVerifier(secret, 'FAUST_')
+                    test_flag = flag.generate(timestamp, flag_id, team, secret, 'FAUST_')
+                    self.assertEqual(verifier.verify(test_flag, now), (flag_id, team))
+
+    def test_typical_junk(self):
+        expiration = self.now + datetime.timedelta(hours=1)
+        valid_flags = [flag.generate(expiration, i, i % 100, b'secret', 'FAUST_') for i in range(50)]
+        # Typical junk submitted by teams
+        invalid_flags = ['', 'FAUST_', 'FAUST_Q1RGLRmVnOVTRVJBRV9tRpcBKDN', 'test']
+
+        results = self.verifier.verify_many(valid_flags + invalid_flags)
+
+        self.assertEqual(results[:50], [(i, i % 100) for i in range(50)])
+        for result in results[50:]:
+            self.assertIsInstance(result, flag.FlagVerificationError)
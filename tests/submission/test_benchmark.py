@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from ctf_gameserver.submission import benchmark, eventloop
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def _run(self, event_loop):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            connect_db = benchmark.sqlite_connector(os.path.join(temp_dir, 'benchmark.sqlite3'))
+            return benchmark.run_benchmark(connect_db, 1, '127.0.0.1', 6667, {
+                'teams': 3,
+                'flags_per_team': 5,
+                'connections': 4,
+                'submissions': 50,
+                'pipeline_depth': 2,
+                'mix': benchmark.parse_mix('valid=50,dup=10,expired=10,own=10,invalid=20'),
+                'seed': 0,
+                'event_loop': event_loop
+            })
+
+    def test_run(self):
+        results, elapsed = self._run('asyncio')
+
+        self.assertGreater(elapsed, 0)
+        self.assertEqual(sum(len(latencies) for latencies in results.values()), 4*50)
+        for response_class in ('OK', 'DUP', 'OLD', 'OWN', 'INV'):
+            self.assertGreater(len(results[response_class]), 0)
+        self.assertEqual(len(results['ERR']), 0)
+
+    @unittest.skipUnless(eventloop.is_available('uvloop'), 'uvloop is not installed')
+    def test_compare_uvloop(self):
+        runs = [(name, *self._run(name)) for name in ('asyncio', 'uvloop')]
+
+        def counts(results):
+            return {response_class: len(latencies) for response_class, latencies in results.items()}
+
+        # Same load, so the same responses are expected
+        self.assertEqual(counts(runs[0][1]), counts(runs[1][1]))
+        report = benchmark.format_comparison(runs)
+        self.assertIn('uvloop', report)
+
+    def test_format_comparison(self):
+        runs = [('asyncio', {'OK': [0.002, 0.004]}, 2), ('uvloop', {'OK': [0.001, 0.002]}, 1)]
+        lines = benchmark.format_comparison(runs).split('\n')
+
+        self.assertIn('1.00x', lines[1])
+        self.assertIn('2.00x', lines[2])
+
+    def test_parse_mix(self):
+        self.assertEqual(benchmark.parse_mix('valid=1, invalid=2.5'), {'valid': 1, 'invalid': 2.5})
+
+        with self.assertRaises(ValueError):
+            benchmark.parse_mix('foo=1')
+        with self.assertRaises(ValueError):
+            benchmark.parse_mix('valid')
+        with self.assertRaises(ValueError):
+            benchmark.parse_mix('valid=0')
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+        self.assertIsNone(benchmark.percentile([], 50))
@@ -0,0 +1,151 @@
+import asyncio
+from unittest.mock import Mock, patch
+
+from ctf_gameserver.lib.database import transaction_cursor
+from ctf_gameserver.lib.test_util import DatabaseTestCase
+from ctf_gameserver.submission import database
+from ctf_gameserver.submission.captures import CaptureBatcher
+from ctf_gameserver.submission.pool import ConnectionPool
+from ctf_gameserver.submission.test_util import make_dup_index
+
+
+class AddCapturesTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+
+    def test_add_captures(self):
+        results = database.add_captures(self.connection, [(1, 2, 6), (2, 3, 6), (1, 2, 6)])
+
+        self.assertIsNone(results[0])
+        self.assertIsNone(results[1])
+        self.assertIsInstance(results[2], database.DuplicateCapture)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT flag_id, capturing_team_id, tick FROM scoring_capture ORDER BY flag_id')
+            self.assertEqual(cursor.fetchall(), [(1, 2, 6), (2, 3, 6)])
+
+        results = database.add_captures(self.connection, [(2, 3, 6), (2, 2, 7)])
+        self.assertIsInstance(results[0], database.DuplicateCapture)
+        self.assertIsNone(results[1])
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+            self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_row_order(self):
+        db_conn = Mock()
+        cursor = db_conn.cursor.return_value
+        cursor.fetchall.return_value = [(1, 3)]
+
+        results = database.add_captures(db_conn, [(4, 2, 6), (1, 3, 6), (1, 2, 5), (4, 2, 6)])
+
+        # Rows are sorted by (flag_id, capturing_team_id), independent of the order of submission
+        self.assertEqual(cursor.execute.call_args.args[1], [1, 2, 5, 1, 3, 6, 4, 2, 6])
+        self.assertIsInstance(results[0], database.DuplicateCapture)
+        self.assertIsNone(results[1])
+        self.assertIsInstance(results[2], database.DuplicateCapture)
+        self.assertIsInstance(results[3], database.DuplicateCapture)
+
+    def test_prohibit_changes(self):
+        database.add_captures(self.connection, [(1, 2, 6)], prohibit_changes=True)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class DuplicateIndexTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+
+    def test_expiry(self):
+        dup_index = make_dup_index()
+
+        dup_index.add(1, 2, 5)
+        dup_index.add(2, 2, 6)
+        self.assertTrue(dup_index.contains(1, 2))
+        self.assertTrue(dup_index.contains(2, 2))
+        self.assertFalse(dup_index.contains(1, 3))
+
+        dup_index.game_state.current_tick = 10
+        dup_index.add(3, 2, 10)
+        self.assertFalse(dup_index.contains(1, 2))
+        self.assertTrue(dup_index.contains(2, 2))
+        self.assertTrue(dup_index.contains(3, 2))
+        self.assertEqual(len(dup_index), 2)
+
+    def test_load(self):
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('INSERT INTO scoring_capture (flag_id, capturing_team_id, timestamp, tick)'
+                           '    VALUES (1, 3, NOW(), 1), (2, 3, NOW(), 2), (4, 3, NOW(), 6)')
+
+        async def coroutine():
+            dup_index = make_dup_index()
+            await dup_index.load(ConnectionPool([self.connection]))
+            return dup_index
+
+        dup_index = asyncio.run(coroutine())
+        self.assertFalse(dup_index.contains(1, 3))
+        self.assertTrue(dup_index.contains(2, 3))
+        self.assertTrue(dup_index.contains(4, 3))
+
+
+class CaptureBatcherTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+
+    def test_batching(self):
+        async def coroutine():
+            batcher = CaptureBatcher(ConnectionPool([self.connection]), 0.05, 100, make_dup_index())
+
+            with patch('ctf_gameserver.submission.database.add_captures',
+                       wraps=database.add_captures) as add_captures_mock:
+                results = await asyncio.gather(batcher.add(1, 2, 6), batcher.add(2, 2, 6),
+                                               batcher.add(1, 2, 6), return_exceptions=True)
+                self.assertEqual(add_captures_mock.call_count, 1)
+
+                self.assertIsNone(results[0])
+                self.assertIsNone(results[1])
+                self.assertIsInstance(results[2], database.DuplicateCapture)
+
+                # Answered from the DuplicateIndex
+                with self.assertRaises(database.DuplicateCapture):
+                    await batcher.add(2, 2, 6)
+                self.assertEqual(add_captures_mock.call_count, 1)
+
+            # Captures from other processes are not in the index
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('INSERT INTO scoring_capture (flag_id, capturing_team_id, timestamp, tick)'
+                               '    VALUES (4, 2, NOW(), 6)')
+            with self.assertRaises(database.DuplicateCapture):
+                await batcher.add(4, 2, 6)
+            self.assertTrue(batcher.dup_index.contains(4, 2))
+
+        asyncio.run(coroutine())
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+            self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_max_size(self):
+        async def coroutine():
+            # Window is way longer than the test timeout, so only the size limit can trigger storage
+            batcher = CaptureBatcher(ConnectionPool([self.connection]), 3600, 2, make_dup_index())
+
+            await asyncio.wait_for(asyncio.gather(batcher.add(1, 2, 6), batcher.add(2, 2, 6)), 10)
+
+        asyncio.run(coroutine())
+
+    def test_database_error(self):
+        async def coroutine():
+            batcher = CaptureBatcher(ConnectionPool([self.connection]), 0, 100, make_dup_index())
+
+            with patch('ctf_gameserver.submission.database.add_captures') as add_captures_mock:
+                add_captures_mock.side_effect = KeyError('test')
+                results = await asyncio.gather(batcher.add(1, 2, 6), batcher.add(2, 2, 6),
+                                               return_exceptions=True)
+
+            self.assertIsInstance(results[0], KeyError)
+            self.assertIsInstance(results[1], KeyError)
+
+        asyncio.run(coroutine())
@@ -0,0 +1,43 @@
+import asyncio
+import socket
+import unittest
+
+from ctf_gameserver.submission import eventloop
+
+
+class EventLoopTest(unittest.TestCase):
+
+    def test_run(self):
+        async def coroutine():
+            return type(asyncio.get_running_loop()).__module__
+
+        self.assertTrue(eventloop.run(coroutine(), 'asyncio').startswith('asyncio'))
+
+        if eventloop.is_available('uvloop'):
+            self.assertTrue(eventloop.run(coroutine(), 'uvloop').startswith('uvloop'))
+        else:
+            # Falls back to the default loop
+            with self.assertLogs(level='WARNING'):
+                self.assertTrue(eventloop.run(coroutine(), 'uvloop').startswith('asyncio'))
+
+        with self.assertRaises(ValueError):
+            eventloop.get_loop_factory('foo')
+
+    def test_tune_connection(self):
+        async def coroutine():
+            server = await asyncio.start_server(lambda reader, writer: None, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+
+            eventloop.tune_connection(writer, False, 1024)
+            sock = writer.get_extra_info('socket')
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+            self.assertEqual(writer.transport.get_write_buffer_limits()[1], 1024)
+
+            eventloop.tune_connection(writer, True, None)
+            self.assertNotEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+
+            writer.close()
+            server.close()
+
+        asyncio.run(coroutine())
@@ -0,0 +1,71 @@
+from collections import defaultdict
+import datetime
+import unittest
+from unittest.mock import Mock, patch
+
+from ctf_gameserver.lib import flag as flag_lib
+from ctf_gameserver.submission.flags import VerifiedFlagCache
+
+
+class VerifiedFlagCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.verifier = flag_lib.FlagVerifier(b'secret', 'FAUST_')
+        self.expiration = datetime.datetime(2020, 6, 1, 10, 0, tzinfo=datetime.timezone.utc)
+
+    def _flag(self, flag_id, team_net_no=13):
+        return flag_lib.generate(self.expiration, flag_id, team_net_no, b'secret', 'FAUST_').encode('ascii')
+
+    def test_hits(self):
+        metrics = defaultdict(Mock)
+        cache = VerifiedFlagCache(self.verifier, 10, metrics)
+        now = self.expiration.timestamp() - 5
+
+        with patch.object(self.verifier, 'check_mac', wraps=self.verifier.check_mac) as check_mac_mock:
+            self.assertEqual(cache.verify(self._flag(1), now), (1, 13))
+            self.assertEqual(cache.verify(self._flag(1), now), (1, 13))
+            self.assertEqual(check_mac_mock.call_count, 1)
+
+        self.assertEqual(metrics['flag_cache_misses'].inc.call_count, 1)
+        self.assertEqual(metrics['flag_cache_hits'].inc.call_count, 1)
+
+        # Expiration gets checked for cached flags as well
+        with self.assertRaises(flag_lib.FlagExpired):
+            cache.verify(self._flag(1), self.expiration.timestamp() + 5)
+
+    def test_invalid(self):
+        cache = VerifiedFlagCache(self.verifier, 10, defaultdict(Mock))
+
+        with self.assertRaises(UnicodeDecodeError):
+            cache.verify(b'\xff')
+        with self.assertRaises(flag_lib.InvalidFlagFormat):
+            cache.verify(b'FAUST_foo')
+        with self.assertRaises(flag_lib.InvalidFlagMAC):
+            cache.verify(self._flag(1)[:-2] + b'AA')
+
+        self.assertEqual(len(cache), 0)
+
+    def test_eviction(self):
+        cache = VerifiedFlagCache(self.verifier, 2, defaultdict(Mock))
+        now = self.expiration.timestamp() - 5
+
+        cache.verify(self._flag(1), now)
+        cache.verify(self._flag(2), now)
+        # Make flag 2 the least recently used one
+        cache.verify(self._flag(1), now)
+        cache.verify(self._flag(3), now)
+
+        with patch.object(self.verifier, 'check_mac', wraps=self.verifier.check_mac) as check_mac_mock:
+            cache.verify(self._flag(1), now)
+            cache.verify(self._flag(3), now)
+            self.assertEqual(check_mac_mock.call_count, 0)
+            cache.verify(self._flag(2), now)
+            self.assertEqual(check_mac_mock.call_count, 1)
+
+        self.assertEqual(len(cache), 2)
+
+    def test_disabled(self):
+        cache = VerifiedFlagCache(self.verifier, 0, defaultdict(Mock))
+
+        self.assertEqual(cache.verify(self._flag(1), self.expiration.timestamp() - 5), (1, 13))
+        self.assertEqual(len(cache), 0)
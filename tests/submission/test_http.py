@@ -0,0 +1,152 @@
+import asyncio
+from collections import defaultdict
+import datetime
+import json
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from ctf_gameserver.lib.database import transaction_cursor
+from ctf_gameserver.lib.flag import generate as generate_flag
+from ctf_gameserver.lib.test_util import DatabaseTestCase
+from ctf_gameserver.submission import database
+from ctf_gameserver.submission.pool import ConnectionPool
+from ctf_gameserver.submission.submission import default_params, serve
+
+
+class HTTPTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+    flag_prefix = 'FAUST_'
+    flag_secret = b'topsecret'
+    metrics = defaultdict(Mock)
+
+    async def connect(self):
+        task = asyncio.create_task(serve('127.0.0.1', 6666, ConnectionPool([self.connection]), {
+            **default_params(),
+            'flag_secret': self.flag_secret,
+            'competition_name': 'Test CTF',
+            'flag_prefix': self.flag_prefix,
+            'capture_batch_size': 100,
+            'http_listen': ('127.0.0.1', 6668),
+            'http_max_flags': 5,
+            'flag_cache_size': 100,
+            'log_summary_interval': 0,
+            'state_refresh_interval': 1,
+            'teams_refresh_interval': 1,
+            'flags_refresh_interval': 1,
+            'metrics': self.metrics
+        }))
+
+        for _ in range(50):
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', 6668)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        return (task, reader, writer)
+
+    async def request(self, reader, writer, body, method='POST', path='/flags'):
+        writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'
+                     .encode('ascii') + body)
+
+        status_line = await reader.readline()
+        status = int(status_line.split(b' ')[1])
+        headers = {}
+        while (line := await reader.readline()) != b'\r\n':
+            name, value = line.decode('ascii').split(':', 1)
+            headers[name.lower()] = value.strip()
+        response_body = await reader.readexactly(int(headers['content-length']))
+
+        return (status, json.loads(response_body))
+
+    def setUp(self):
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('UPDATE scoring_gamecontrol SET start = datetime("now"), '
+                           '                               end = datetime("now", "+1 hour")')
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_submit(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 103
+
+            task, reader, writer = await self.connect()
+
+            expiration_time = datetime.datetime.now() + datetime.timedelta(seconds=60)
+            flag1 = generate_flag(expiration_time, 1, 102, self.flag_secret, self.flag_prefix)
+            flag2 = generate_flag(expiration_time, 2, 102, self.flag_secret, self.flag_prefix)
+            own_flag = generate_flag(expiration_time, 5, 103, self.flag_secret, self.flag_prefix)
+
+            with patch('ctf_gameserver.submission.database.add_captures',
+                       wraps=database.add_captures) as add_captures_mock:
+                body = json.dumps([flag1, own_flag, 'foo', flag2, flag1]).encode('ascii')
+                status, results = await self.request(reader, writer, body)
+                # All captures get stored with a single database operation
+                self.assertEqual(add_captures_mock.call_count, 1)
+
+            self.assertEqual(status, 200)
+            self.assertEqual(results, [
+                {'flag': flag1, 'code': 'OK', 'message': ''},
+                {'flag': own_flag, 'code': 'OWN', 'message': 'You cannot submit your own flag'},
+                {'flag': 'foo', 'code': 'INV', 'message': 'Invalid flag'},
+                {'flag': flag2, 'code': 'OK', 'message': ''},
+                {'flag': flag1, 'code': 'DUP', 'message': 'You already submitted this flag'}
+            ])
+
+            # Connection is kept alive
+            status, results = await self.request(reader, writer, json.dumps([flag2]).encode('ascii'))
+            self.assertEqual(status, 200)
+            self.assertEqual(results[0]['code'], 'DUP')
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+                capture_count = cursor.fetchone()[0]
+            self.assertEqual(capture_count, 2)
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_bad_requests(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 103
+
+            task, reader, writer = await self.connect()
+
+            status, _ = await self.request(reader, writer, b'["foo"]', path='/')
+            self.assertEqual(status, 404)
+            status, _ = await self.request(reader, writer, b'', method='GET')
+            self.assertEqual(status, 405)
+            status, _ = await self.request(reader, writer, b'{"foo": 1}')
+            self.assertEqual(status, 400)
+            status, _ = await self.request(reader, writer, b'["foo", 42]')
+            self.assertEqual(status, 400)
+            status, _ = await self.request(reader, writer, b'["a", "b", "c", "d", "e", "f"]')
+            self.assertEqual(status, 413)
+
+            status, results = await self.request(reader, writer, b'["foo"]')
+            self.assertEqual(status, 200)
+            self.assertEqual(results[0]['code'], 'INV')
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_unknown_address(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.side_effect = ValueError
+
+            task, reader, writer = await self.connect()
+
+            status, result = await self.request(reader, writer, b'["foo"]')
+            self.assertEqual(status, 403)
+            self.assertIn('error', result)
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
@@ -0,0 +1,171 @@
+import asyncio
+from collections import defaultdict
+import datetime
+import os
+import sqlite3
+import tempfile
+from unittest.mock import Mock, patch
+
+from django.db import connection
+
+from ctf_gameserver.lib.database import transaction_cursor
+from ctf_gameserver.lib.test_util import DatabaseTestCase
+from ctf_gameserver.submission import database
+from ctf_gameserver.submission.captures import CaptureBatcher
+from ctf_gameserver.submission.journal import CaptureJournal
+from ctf_gameserver.submission.pool import ConnectionPool
+from ctf_gameserver.submission.test_util import make_dup_index
+
+
+class CaptureJournalTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+
+    def setUp(self):
+        self.journal_dir = tempfile.TemporaryDirectory()    # pylint: disable=consider-using-with
+        self.journal_path = os.path.join(self.journal_dir.name, 'captures-0.journal')
+        self.timestamp = datetime.datetime(2020, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+    def tearDown(self):
+        self.journal_dir.cleanup()
+
+    def make_journal(self):
+        journal = CaptureJournal(self.journal_path, 3600, defaultdict(Mock))
+        return journal, journal.open()
+
+    def test_load(self):
+        journal, entries = self.make_journal()
+        self.assertEqual(entries, [])
+        self.assertTrue(journal.db_available)
+
+        asyncio.run(journal.append([(1, 2, 3, self.timestamp), (2, 2, 3, self.timestamp)]))
+        journal.close()
+
+        # Simulate a crash in the middle of writing
+        with open(self.journal_path, 'a', encoding='ascii') as journal_file:
+            journal_file.write('3 2 3 2020-01')
+
+        journal, entries = self.make_journal()
+        journal.close()
+        self.assertEqual(entries, [(1, 2, 3, self.timestamp), (2, 2, 3, self.timestamp)])
+        self.assertFalse(journal.db_available)
+
+    def test_replay(self):
+        journal, _ = self.make_journal()
+
+        async def coroutine():
+            await journal.append([(1, 2, 3, self.timestamp), (2, 2, 3, self.timestamp)])
+            await journal.replay(ConnectionPool([self.connection]))
+
+        asyncio.run(coroutine())
+        journal.close()
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT flag_id, capturing_team_id, tick, timestamp FROM scoring_capture '
+                           'ORDER BY flag_id')
+            rows = cursor.fetchall()
+        self.assertEqual([row[:3] for row in rows], [(1, 2, 3), (2, 2, 3)])
+        self.assertTrue(all(str(row[3]).startswith('2020-01-01') for row in rows))
+
+        # Replaying again must not fail or create additional captures
+        database.replay_captures(self.connection, [(1, 2, 3, self.timestamp)])
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_replay_reconnect(self):
+        journal, _ = self.make_journal()
+
+        def connect():
+            return _ClosableConnection(connection.get_new_connection(connection.get_connection_params()))
+
+        db_conn = connect()
+        db_pool = ConnectionPool([db_conn], connect)
+
+        async def coroutine():
+            await journal.append([(1, 2, 3, self.timestamp)])
+            # Simulate the connection getting lost during a database failover
+            db_conn.close()
+            await journal.replay(db_pool)
+
+        asyncio.run(coroutine())
+        db_pool.close()
+        journal.close()
+        self.assertTrue(journal.db_available)
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT flag_id, capturing_team_id, tick FROM scoring_capture')
+            self.assertEqual(cursor.fetchall(), [(1, 2, 3)])
+
+    def test_batcher_fallback(self):
+        journal, _ = self.make_journal()
+        db_pool = ConnectionPool([self.connection])
+
+        async def coroutine():
+            batcher = CaptureBatcher(db_pool, 0, 100, make_dup_index(), journal, 5)
+
+            with patch('ctf_gameserver.submission.database.add_captures') as add_captures_mock:
+                add_captures_mock.side_effect = sqlite3.OperationalError('test')
+                results = await asyncio.gather(batcher.add(1, 2, 6), batcher.add(2, 2, 6),
+                                               batcher.add(1, 2, 6), return_exceptions=True)
+                self.assertIsNone(results[0])
+                self.assertIsNone(results[1])
+                self.assertIsInstance(results[2], database.DuplicateCapture)
+                self.assertFalse(journal.db_available)
+
+                # Database does not get tried again until the journal has been replayed
+                await batcher.add(3, 2, 6)
+                self.assertEqual(add_captures_mock.call_count, 1)
+
+                with self.assertRaises(database.DuplicateCapture):
+                    await batcher.add(2, 2, 6)
+
+            await journal.replay(db_pool)
+            self.assertTrue(journal.db_available)
+            await batcher.add(4, 2, 6)
+
+        asyncio.run(coroutine())
+        journal.close()
+
+        with transaction_cursor(self.connection) as cursor:
+            cursor.execute('SELECT flag_id, capturing_team_id, tick FROM scoring_capture ORDER BY flag_id')
+            self.assertEqual(cursor.fetchall(), [(1, 2, 6), (2, 2, 6), (3, 2, 6), (4, 2, 6)])
+
+    def test_batcher_timeout(self):
+        journal, _ = self.make_journal()
+
+        async def coroutine():
+            batcher = CaptureBatcher(ConnectionPool([self.connection]), 0, 100, make_dup_index(), journal,
+                                     0.01)
+
+            async def slow_run(*_):
+                await asyncio.sleep(10)
+
+            with patch.object(batcher.db_pool, 'run', slow_run):
+                await asyncio.wait_for(batcher.add(1, 2, 6), 5)
+            self.assertFalse(journal.db_available)
+
+        asyncio.run(coroutine())
+        journal.close()
+
+        journal, entries = self.make_journal()
+        journal.close()
+        self.assertEqual([entry[:3] for entry in entries], [(1, 2, 6)])
+
+
+class _ClosableConnection:
+    """
+    Wrapper for a SQLite connection with the `closed` attribute of Psycopg2 connections.
+    """
+
+    def __init__(self, orig_conn):
+        self.orig_conn = orig_conn
+        self.closed = 0
+
+    def close(self):
+        self.orig_conn.close()
+        self.closed = 1
+
+    def __getattr__(self, name):
+        return getattr(self.orig_conn, name)
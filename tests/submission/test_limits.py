@@ -0,0 +1,111 @@
+import asyncio
+from collections import defaultdict
+import unittest
+from unittest.mock import Mock, patch
+
+from ctf_gameserver.submission.limits import AdmissionControl, LineSplitter, TokenBucket
+from ctf_gameserver.submission.metrics import TeamMetrics
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    @patch('ctf_gameserver.submission.limits.time.monotonic')
+    def test_take(self, monotonic_mock):
+        monotonic_mock.return_value = 100
+        bucket = TokenBucket(10)
+
+        self.assertEqual(bucket.take(6), 0)
+        self.assertEqual(bucket.take(4), 0)
+        self.assertAlmostEqual(bucket.take(5), 0.5)
+
+        # Debt of 5 tokens has to be settled first
+        monotonic_mock.return_value = 101
+        self.assertEqual(bucket.take(5), 0)
+        self.assertAlmostEqual(bucket.take(10), 1)
+
+        # Burst is limited to the capacity
+        monotonic_mock.return_value = 200
+        self.assertAlmostEqual(bucket.take(20), 1)
+
+
+class AdmissionControlTest(unittest.TestCase):
+
+    def test_throttle(self):
+        metrics = defaultdict(Mock)
+        admission_control = AdmissionControl(100, 0, TeamMetrics(metrics))
+
+        async def coroutine():
+            loop = asyncio.get_running_loop()
+
+            start_time = loop.time()
+            await admission_control.throttle(102, 100)
+            self.assertLess(loop.time() - start_time, 0.05)
+
+            # Limits are separate per team
+            await admission_control.throttle(103, 100)
+            self.assertLess(loop.time() - start_time, 0.05)
+
+            await admission_control.throttle(102, 20)
+            self.assertGreaterEqual(loop.time() - start_time, 0.15)
+
+        asyncio.run(coroutine())
+
+        metrics['rate_limited_seconds'].labels.assert_called_once_with(102)
+
+    def test_no_limits(self):
+        metrics = defaultdict(Mock)
+        admission_control = AdmissionControl(0, 0, TeamMetrics(metrics))
+
+        async def coroutine():
+            await asyncio.wait_for(admission_control.throttle(102, 10**6), 1)
+            async with admission_control.connection_slot(102):
+                async with admission_control.connection_slot(102):
+                    pass
+
+        asyncio.run(coroutine())
+
+        self.assertEqual(len(metrics), 0)
+
+    def test_connection_slot(self):
+        metrics = defaultdict(Mock)
+        admission_control = AdmissionControl(0, 2, TeamMetrics(metrics))
+        events = []
+
+        async def connection(name, net_no, duration):
+            async with admission_control.connection_slot(net_no):
+                events.append(name)
+                await asyncio.sleep(duration)
+
+        async def coroutine():
+            await asyncio.gather(connection('a', 102, 0.1), connection('b', 102, 0.1),
+                                 connection('c', 102, 0), connection('d', 103, 0))
+
+        asyncio.run(coroutine())
+
+        self.assertEqual(events, ['a', 'b', 'd', 'c'])
+        metrics['connection_limited_seconds'].labels.assert_called_once_with(102)
+
+
+class LineSplitterTest(unittest.TestCase):
+
+    def test_feed(self):
+        splitter = LineSplitter(5)
+
+        self.assertEqual(splitter.feed(b'abc\nde'), [b'abc'])
+        self.assertEqual(splitter.feed(b'f'), [])
+        self.assertEqual(splitter.feed(b'\n\nghi\n'), [b'def', b'', b'ghi'])
+
+    def test_crlf(self):
+        splitter = LineSplitter(5)
+
+        self.assertEqual(splitter.feed(b'abc\r\nde\r'), [b'abc'])
+        self.assertEqual(splitter.feed(b'\n\r\r\nabcde\r\n'), [b'de', b'\r', b'abcde'])
+
+    def test_overlong(self):
+        splitter = LineSplitter(5)
+
+        self.assertEqual(splitter.feed(b'abcdefghij\nabc'), [b'abcdef'])
+        self.assertEqual(splitter.feed(b'defgh'), [])
+        self.assertEqual(splitter.feed(b'ijkl'), [])
+        # Only the first bytes of the line are buffered
+        self.assertEqual(splitter.feed(b'm\nab\n'), [b'abcdef', b'ab'])
@@ -0,0 +1,92 @@
+from collections import defaultdict
+import logging
+import queue
+import unittest
+from unittest.mock import Mock, patch
+
+from ctf_gameserver.submission.logs import SubmissionLog, parse_sample_rates, _BoundedQueueHandler
+
+
+class SubmissionLogTest(unittest.TestCase):
+
+    def test_sampling(self):
+        submission_log = SubmissionLog({'DUP': 0, 'INV': 0.5}, 60)
+
+        with self.assertLogs(level='INFO') as logs:
+            submission_log.log(102, '10.66.2.1', 'INFO', 'Flag %s accepted', 'foo', code='OK')
+            submission_log.log(102, '10.66.2.1', 'INFO', 'Flag %s duplicate', 'foo', code='DUP')
+            submission_log.log(102, '10.66.2.1', 'INFO', 'Flag %s duplicate', 'bar', code='DUP')
+            with patch('ctf_gameserver.submission.logs.random.random') as random_mock:
+                random_mock.return_value = 0.3
+                submission_log.log(103, '10.66.3.1', 'INFO', 'Flag %s invalid', 'foo', code='INV')
+                random_mock.return_value = 0.7
+                submission_log.log(103, '10.66.3.1', 'INFO', 'Flag %s invalid', 'bar', code='INV')
+            submission_log.log(103, '10.66.3.1', 'INFO', 'Closing connection')
+
+        self.assertEqual(logs.output, [
+            'INFO:root:102 [10.66.2.1]: Flag foo accepted',
+            'INFO:root:103 [10.66.3.1]: Flag foo invalid',
+            'INFO:root:103 [10.66.3.1]: Closing connection'
+        ])
+
+        with self.assertLogs(level='INFO') as logs:
+            submission_log.log_summaries()
+
+        self.assertEqual(logs.output, [
+            'INFO:root:102: 3 flags in the last 60 seconds (DUP: 2, OK: 1)',
+            'INFO:root:103: 2 flags in the last 60 seconds (INV: 2)'
+        ])
+
+        # Counters get reset after every summary
+        with self.assertNoLogs(level='INFO'):
+            submission_log.log_summaries()
+
+    def test_parse_sample_rates(self):
+        self.assertEqual(parse_sample_rates(''), {})
+        self.assertEqual(parse_sample_rates('dup=0.01, INV=1'), {'DUP': 0.01, 'INV': 1})
+
+        with self.assertRaises(ValueError):
+            parse_sample_rates('ERR=0.5')
+        with self.assertRaises(ValueError):
+            parse_sample_rates('DUP=2')
+        with self.assertRaises(ValueError):
+            parse_sample_rates('DUP')
+
+
+class BoundedQueueHandlerTest(unittest.TestCase):
+
+    def test_full_queue(self):
+        log_queue = queue.Queue(1)
+        metrics = defaultdict(Mock)
+        target_handler = Mock(level=logging.NOTSET)
+        handler = _BoundedQueueHandler(log_queue, [target_handler], metrics)
+
+        logger = logging.getLogger('test_full_queue')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+
+        logger.info('Message %d', 1)
+        logger.info('Message %d', 2)
+        self.assertEqual(metrics['log_records_dropped'].inc.call_count, 1)
+
+        record = log_queue.get_nowait()
+        self.assertEqual(record.getMessage(), 'Message 1')
+
+        logger.warning('Message %d', 3)
+        self.assertEqual(log_queue.get_nowait().getMessage(), 'Message 3')
+        target_handler.handle.assert_not_called()
+
+        # Warnings get written synchronously instead of being dropped
+        logger.info('Message %d', 4)
+        logger.warning('Message %d', 5)
+        self.assertEqual(metrics['log_records_dropped'].inc.call_count, 1)
+        self.assertEqual(target_handler.handle.call_args.args[0].getMessage(), 'Message 5')
+
+        # Errors never get queued, so they cannot be lost when exiting
+        log_queue.get_nowait()
+        logger.error('Message %d', 6)
+        self.assertTrue(log_queue.empty())
+        self.assertEqual(target_handler.handle.call_args.args[0].getMessage(), 'Message 6')
+
+        logger.removeHandler(handler)
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import Mock
+
+import psycopg2
+
+from ctf_gameserver.submission.pool import ConnectionPool
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(2, timeout=5)
+        used_conns = []
+
+        def func(db_conn, arg):
+            used_conns.append(db_conn)
+            # Only passes if both calls are running at the same time
+            barrier.wait()
+            return arg * 2
+
+        async def coroutine():
+            pool = ConnectionPool(['conn1', 'conn2'])
+            results = await asyncio.gather(pool.run(func, 1), pool.run(func, 2))
+            pool.close()
+            return results
+
+        self.assertEqual(asyncio.run(coroutine()), [2, 4])
+        self.assertCountEqual(used_conns, ['conn1', 'conn2'])
+
+    def test_exhausted(self):
+        active_conns = set()
+        max_active = 0
+        lock = threading.Lock()
+
+        def func(db_conn):
+            nonlocal max_active
+            with lock:
+                self.assertNotIn(db_conn, active_conns)
+                active_conns.add(db_conn)
+                max_active = max(max_active, len(active_conns))
+            threading.Event().wait(0.01)
+            with lock:
+                active_conns.remove(db_conn)
+
+        async def coroutine():
+            pool = ConnectionPool(['conn1', 'conn2'])
+            await asyncio.gather(*[pool.run(func) for _ in range(10)])
+            pool.close()
+
+        asyncio.run(coroutine())
+        self.assertEqual(max_active, 2)
+
+    def test_exception(self):
+        def func(_):
+            raise KeyError('test')
+
+        async def coroutine():
+            pool = ConnectionPool(['conn'])
+            with self.assertRaises(KeyError):
+                await pool.run(func)
+            # Connection must have been released
+            self.assertEqual(await pool.run(lambda db_conn: db_conn), 'conn')
+            pool.close()
+
+        asyncio.run(coroutine())
+
+    def test_reconnect(self):
+        class Connection:
+            def __init__(self, name):
+                self.name = name
+                self.closed = 0
+
+            def close(self):
+                self.closed = 1
+
+        def func(db_conn):
+            return db_conn.name
+
+        async def coroutine():
+            conn = Connection('old')
+            pool = ConnectionPool([conn], lambda: Connection('new'))
+            self.assertEqual(await pool.run(func), 'old')
+            conn.close()
+            self.assertEqual(await pool.run(func), 'new')
+            # New connection must have been put into the pool
+            self.assertEqual(await pool.run(func), 'new')
+            pool.close()
+
+        asyncio.run(coroutine())
+
+    def test_reconnect_failure(self):
+        def connect():
+            raise psycopg2.OperationalError('test')
+
+        def fail(_):
+            raise psycopg2.OperationalError('test')
+
+        async def coroutine():
+            conn = Mock(closed=0)
+            conn.close.side_effect = lambda: setattr(conn, 'closed', 2)
+            pool = ConnectionPool([conn], connect)
+            with self.assertRaises(psycopg2.OperationalError):
+                await pool.run(fail)
+            conn.close.assert_called_once()
+            # Database still unavailable
+            with self.assertRaises(psycopg2.OperationalError):
+                await pool.run(fail)
+            pool.close()
+
+        asyncio.run(coroutine())
+
+    def test_close(self):
+        async def coroutine():
+            conn = Mock(closed=0)
+            new_conn = Mock(closed=0)
+            pool = ConnectionPool([conn], lambda: new_conn)
+            conn.closed = 1
+            await pool.run(lambda db_conn: None)
+            pool.close()
+
+            # Only the current connections get closed
+            conn.close.assert_not_called()
+            new_conn.close.assert_called_once()
+
+            conn = Mock(closed=0)
+            pool = ConnectionPool([conn])
+            await pool.run(lambda db_conn: None)
+            pool.close()
+            # Pool does not own the connection without `connect`
+            conn.close.assert_not_called()
+
+        asyncio.run(coroutine())
@@ -0,0 +1,96 @@
+import asyncio
+from collections import defaultdict
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from ctf_gameserver.submission.recording import TrafficRecorder, merge_records, read_records
+from ctf_gameserver.submission.replay import run_replay
+
+
+class TrafficRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.record_dir = tempfile.TemporaryDirectory()    # pylint: disable=consider-using-with
+
+    def tearDown(self):
+        self.record_dir.cleanup()
+
+    def record(self, file_name, records):
+        path = os.path.join(self.record_dir.name, file_name)
+        recorder = TrafficRecorder(path, defaultdict(Mock))
+        recorder.open()
+
+        async def coroutine():
+            for timestamp, net_no, lines in records:
+                with patch('ctf_gameserver.submission.recording.time.time') as time_mock:
+                    time_mock.return_value = timestamp
+                    recorder.record(net_no, lines)
+                await recorder.flush()
+
+        asyncio.run(coroutine())
+        recorder.close()
+
+        return path
+
+    def test_read(self):
+        path = self.record('traffic.rec', [(100.5, 102, [b'FLAG_A', b'']), (101, 103, [b'FLAG B'])])
+
+        self.assertEqual(list(read_records(path)), [(100.5, 102, b'FLAG_A'), (100.5, 102, b''),
+                                                    (101, 103, b'FLAG B')])
+
+        # Incomplete last record from a crash during writing
+        with open(path, 'ab') as record_file:
+            record_file.write(b'\0\0\0')
+        self.assertEqual(len(list(read_records(path))), 3)
+
+    def test_merge(self):
+        paths = [
+            self.record('traffic-1.rec', [(1, 102, [b'A']), (3, 102, [b'C'])]),
+            self.record('traffic-2.rec', [(2, 103, [b'B']), (4, 103, [b'D'])])
+        ]
+
+        self.assertEqual([line for _, _, line in merge_records(paths)], [b'A', b'B', b'C', b'D'])
+
+    def test_invalid_file(self):
+        path = os.path.join(self.record_dir.name, 'invalid.rec')
+        with open(path, 'wb') as record_file:
+            record_file.write(b'FOO\n')
+
+        with self.assertRaises(ValueError):
+            list(read_records(path))
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_replay(self):
+        received = []
+
+        async def handle(reader, writer):
+            writer.write(b'Test CTF Flag Submission Server\n\n')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received.append((asyncio.get_running_loop().time(), line))
+                writer.write(line.rstrip(b'\n') + b' INV Invalid flag\n')
+            writer.close()
+
+        async def coroutine():
+            # Let the OS pick a free port
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            records = [(1000, 102, b'FLAG_A'), (1000, 103, b'FLAG B'), (1010, 102, b'FLAG_C')]
+            async with server:
+                start_time = asyncio.get_running_loop().time()
+                return (start_time, await run_replay('127.0.0.1', port, records, 100, '127.0.0.1'))
+
+        start_time, (results, elapsed, _) = asyncio.run(coroutine())
+
+        self.assertEqual(len(results['INV']), 3)
+        self.assertEqual(sorted(line for _, line in received), [b'FLAG B\n', b'FLAG_A\n', b'FLAG_C\n'])
+        # 10 seconds accelerated by a factor of 100, so the last line must not arrive earlier
+        last_time = [receive_time for receive_time, line in received if line == b'FLAG_C\n'][0]
+        self.assertGreaterEqual(last_time - start_time, 0.1)
+        self.assertLess(elapsed, 5)
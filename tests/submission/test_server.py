@@ -1,13 +1,21 @@
 import asyncio
 from collections import defaultdict
 import datetime
+import os
+import signal
+import socket
+import tempfile
+import time
 from unittest.mock import Mock
 from unittest.mock import patch
 
 from ctf_gameserver.lib.database import transaction_cursor
 from ctf_gameserver.lib.flag import generate as generate_flag
 from ctf_gameserver.lib.test_util import DatabaseTestCase
-from ctf_gameserver.submission.submission import serve
+from ctf_gameserver.submission import database
+from ctf_gameserver.submission.pool import ConnectionPool
+from ctf_gameserver.submission.recording import read_records
+from ctf_gameserver.submission.submission import default_params, serve
 
 
 class ServerTest(DatabaseTestCase):
@@ -17,16 +25,24 @@ class ServerTest(DatabaseTestCase):
     flag_secret = b'topsecret'
     metrics = defaultdict(Mock)
 
-    async def connect(self):
+    async def connect(self, reuse_port=False, listen_sockets=(), traffic_record_dir=None):
         # For this to work on GitHub Actions (in Docker), we need to use the v4 address instead of
         # "localhost"
-        task = asyncio.create_task(serve('127.0.0.1', 6666, self.connection, {
+        task = asyncio.create_task(serve('127.0.0.1', 6666, ConnectionPool([self.connection]), {
+            **default_params(),
             'flag_secret': self.flag_secret,
-            'team_regex': None,
             'competition_name': 'Test CTF',
             'flag_prefix': self.flag_prefix,
+            'capture_batch_size': 100,
+            'traffic_record_dir': traffic_record_dir,
+            'flag_cache_size': 100,
+            'log_summary_interval': 0,
+            'state_refresh_interval': 1,
+            'teams_refresh_interval': 1,
+            'flags_refresh_interval': 1,
+            'listen_sockets': list(listen_sockets),
             'metrics': self.metrics
-        }))
+        }, reuse_port))
 
         for _ in range(50):
             try:
@@ -51,6 +67,9 @@ class ServerTest(DatabaseTestCase):
                 capture_count = cursor.fetchone()[0]
             self.assertEqual(capture_count, 0)
 
+            # Metrics are shared between the test cases
+            self.metrics['stage_duration'].reset_mock()
+
             task, reader, writer = await self.connect()
             await reader.readuntil(b'\n\n')
 
@@ -72,8 +91,126 @@ class ServerTest(DatabaseTestCase):
             self.assertEqual(capturing_team, 3)
             self.assertEqual(capture_tick, 6)
 
+            self.metrics['flags_by_service'].labels.assert_called_with('service1', 'OK')
+            # Stage durations get recorded once the response has been written
+            for _ in range(50):
+                if self.metrics['stage_duration'].labels.called:
+                    break
+                await asyncio.sleep(0.01)
+            observed_stages = {call.args[0] for call in self.metrics['stage_duration'].labels.call_args_list}
+            self.assertEqual(observed_stages, {'decode', 'mac_verify', 'game_state_check', 'nop_check',
+                                               'capture_insert', 'response_write'})
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_listen_sockets(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 103
+
+            # Like a socket passed by systemd
+            sock = socket.create_server(('127.0.0.1', 6666))
+            task, reader, writer = await self.connect(listen_sockets=[('unknown', sock)])
+            self.assertIn(b'Flag Submission Server', await reader.readuntil(b'\n\n'))
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_graceful_shutdown(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 103
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_gamecontrol SET start = datetime("now"), '
+                               '                               end = datetime("now", "+1 hour")')
+
+            task, reader1, writer1 = await self.connect()
+            await reader1.readuntil(b'\n\n')
+            reader2, writer2 = await asyncio.open_connection('127.0.0.1', 6666)
+            await reader2.readuntil(b'\n\n')
+
+            expiration_time = datetime.datetime.now() + datetime.timedelta(seconds=60)
+            flag = generate_flag(expiration_time, 4, 102, self.flag_secret, self.flag_prefix).encode('ascii')
+
+            def slow_add_captures(*args):
+                time.sleep(0.2)
+                return add_captures(*args)
+
+            # Terminate while the capture is being stored
+            add_captures = database.add_captures
+            with patch('ctf_gameserver.submission.database.add_captures', slow_add_captures):
+                writer1.write(flag + b'\n')
+                await asyncio.sleep(0.1)
+                os.kill(os.getpid(), signal.SIGTERM)
+                self.assertEqual(await reader1.readline(), flag + b' OK\n')
+
+            self.assertEqual(await reader1.read(), b'')
+            # Idle connections get closed as well
+            self.assertEqual(await reader2.read(), b'')
+            # Server exits by itself
+            await asyncio.wait_for(task, 5)
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+                self.assertEqual(cursor.fetchone()[0], 1)
+
+            writer1.close()
+            writer2.close()
+
+        asyncio.run(coroutine())
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_traffic_recording(self, net_number_mock):
+        async def coroutine(record_dir):
+            net_number_mock.return_value = 103
+
+            task, reader, writer = await self.connect(traffic_record_dir=record_dir)
+            await reader.readuntil(b'\n\n')
+
+            writer.write(b'FLAG_A\nFLAG B\n')
+            await reader.readline()
+            await reader.readline()
+
             writer.close()
             task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with tempfile.TemporaryDirectory() as record_dir:
+            asyncio.run(coroutine(record_dir))
+
+            file_names = os.listdir(record_dir)
+            self.assertEqual(len(file_names), 1)
+            records = list(read_records(os.path.join(record_dir, file_names[0])))
+
+        self.assertEqual([(net_no, line) for _, net_no, line in records],
+                         [(103, b'FLAG_A'), (103, b'FLAG B')])
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_reuse_port(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 103
+
+            # Like multiple worker processes, both servers must be able to listen on the same port
+            task1, reader1, writer1 = await self.connect(reuse_port=True)
+            task2, reader2, writer2 = await self.connect(reuse_port=True)
+            await asyncio.sleep(0.1)
+            self.assertFalse(task1.done())
+            self.assertFalse(task2.done())
+
+            await reader1.readuntil(b'\n\n')
+            await reader2.readuntil(b'\n\n')
+
+            writer1.close()
+            writer2.close()
+            task1.cancel()
+            task2.cancel()
 
         asyncio.run(coroutine())
 
@@ -206,6 +343,55 @@ class ServerTest(DatabaseTestCase):
 
         asyncio.run(coroutine())
 
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_pipelined(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 103
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_gamecontrol SET start = datetime("now"), '
+                               '                               end = datetime("now", "+1 hour")')
+
+            task, reader, writer = await self.connect()
+            await reader.readuntil(b'\n\n')
+
+            expiration_time = datetime.datetime.now() + datetime.timedelta(seconds=60)
+            flag1 = generate_flag(expiration_time, 1, 102, self.flag_secret,
+                                  self.flag_prefix).encode('ascii')
+            flag2 = generate_flag(expiration_time, 2, 102, self.flag_secret,
+                                  self.flag_prefix).encode('ascii')
+            own_flag = generate_flag(expiration_time, 5, 103, self.flag_secret,
+                                     self.flag_prefix).encode('ascii')
+
+            with patch('ctf_gameserver.submission.database.add_captures',
+                       wraps=database.add_captures) as add_captures_mock:
+                # Last line is incomplete and only gets finished with a later write
+                writer.write(b'\n'.join([flag1, own_flag, b'foo', flag2, flag1, flag2[:5]]))
+                responses = [await reader.readline() for _ in range(5)]
+                self.assertEqual(add_captures_mock.call_count, 1)
+
+                writer.write(flag2[5:] + b'\n')
+                responses.append(await reader.readline())
+
+            self.assertEqual(responses, [
+                flag1 + b' OK\n',
+                own_flag + b' OWN You cannot submit your own flag\n',
+                b'foo INV Invalid flag\n',
+                flag2 + b' OK\n',
+                flag1 + b' DUP You already submitted this flag\n',
+                flag2 + b' DUP You already submitted this flag\n'
+            ])
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+                capture_count = cursor.fetchone()[0]
+            self.assertEqual(capture_count, 2)
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
+
     @patch('ctf_gameserver.submission.submission._match_net_number')
     def test_multiple_clients(self, net_number_mock):
         async def coroutine():
@@ -287,6 +473,60 @@ class ServerTest(DatabaseTestCase):
 
         asyncio.run(coroutine())
 
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_unknown_team(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 105
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_gamecontrol SET start = datetime("now"), '
+                               '                               end = datetime("now", "+1 hour")')
+
+            task, reader, writer = await self.connect()
+            await reader.readuntil(b'\n\n')
+
+            expiration_time = datetime.datetime.now() + datetime.timedelta(seconds=60)
+            flag = generate_flag(expiration_time, 4, 102, self.flag_secret, self.flag_prefix).encode('ascii')
+            writer.write(flag + b'\n')
+
+            response = await reader.readline()
+            self.assertEqual(response, flag + b' ERR Could not find team\n')
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('SELECT COUNT(*) FROM scoring_capture')
+                capture_count = cursor.fetchone()[0]
+            self.assertEqual(capture_count, 0)
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+    @patch('ctf_gameserver.submission.submission._match_net_number')
+    def test_crlf(self, net_number_mock):
+        async def coroutine():
+            net_number_mock.return_value = 103
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_gamecontrol SET start = datetime("now"), '
+                               '                               end = datetime("now", "+1 hour")')
+
+            task, reader, writer = await self.connect()
+            await reader.readuntil(b'\n\n')
+
+            # Line endings as sent by telnet or `nc -C`
+            expiration_time = datetime.datetime.now() + datetime.timedelta(seconds=60)
+            flag = generate_flag(expiration_time, 4, 102, self.flag_secret, self.flag_prefix).encode('ascii')
+            writer.write(flag + b'\r\n')
+
+            response = await reader.readline()
+            self.assertEqual(response, flag + b' OK\n')
+
+            writer.close()
+            task.cancel()
+
+        asyncio.run(coroutine())
+
     @patch('ctf_gameserver.submission.submission._match_net_number')
     def test_invalid(self, net_number_mock):
         async def coroutine():
@@ -319,6 +559,15 @@ class ServerTest(DatabaseTestCase):
             response = await reader.readline()
             self.assertEqual(response, flag + b' INV Invalid flag\n')
 
+            # Line exceeding the maximum length, which gets truncated in the response
+            writer.write(b'A' * 1000)
+            await writer.drain()
+            writer.write(b'A' * 1000 + b'\n' + flag + b'\n')
+            response = await reader.readline()
+            self.assertEqual(response, b'A' * 1025 + b' INV Flag is too long\n')
+            response = await reader.readline()
+            self.assertEqual(response, flag + b' INV Invalid flag\n')
+
             with transaction_cursor(self.connection) as cursor:
                 cursor.execute('SELECT COUNT(*) FROM scoring_capture')
                 capture_count = cursor.fetchone()[0]
@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import socket
+import unittest
+from unittest.mock import MagicMock
+
+from ctf_gameserver.lib.database import transaction_cursor
+from ctf_gameserver.lib.test_util import DatabaseTestCase
+from ctf_gameserver.submission.pool import ConnectionPool
+from ctf_gameserver.submission.state import FlagServices, GameState, NotificationListener, TeamDirectory
+
+
+class GameStateTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+
+    def test_refresh(self):
+        async def coroutine():
+            game_state = GameState(ConnectionPool([self.connection]), 3600)
+            await game_state.refresh()
+
+            self.assertEqual(game_state.current_tick, 6)
+            self.assertEqual(game_state.is_running(), (False, False))
+
+            task = asyncio.create_task(game_state.run())
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_gamecontrol SET current_tick = 7,'
+                               '    start = datetime("now", "-1 hour"), end = datetime("now", "+1 hour")')
+            # Refresh interval is long, so only a notification leads to changes
+            await asyncio.sleep(0.1)
+            self.assertEqual(game_state.current_tick, 6)
+
+            game_state.notify()
+            await asyncio.sleep(0.1)
+            self.assertEqual(game_state.current_tick, 7)
+            self.assertEqual(game_state.is_running(), (True, False))
+
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+    def test_polling(self):
+        async def coroutine():
+            game_state = GameState(ConnectionPool([self.connection]), 0.05)
+            await game_state.refresh()
+            task = asyncio.create_task(game_state.run())
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_gamecontrol SET current_tick = 8')
+            await asyncio.sleep(0.2)
+            self.assertEqual(game_state.current_tick, 8)
+
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+    def test_is_running(self):
+        game_state = GameState(None, 1)
+        now = datetime.datetime(2020, 6, 1, 10, 0, tzinfo=datetime.timezone.utc)
+
+        self.assertEqual(game_state.is_running(now), (False, False))
+
+        game_state.start = now - datetime.timedelta(hours=1)
+        game_state.end = now
+        self.assertEqual(game_state.is_running(now), (True, True))
+        self.assertEqual(game_state.is_running(now - datetime.timedelta(minutes=1)), (True, False))
+        self.assertEqual(game_state.is_running(now - datetime.timedelta(hours=2)), (False, False))
+
+
+class TeamDirectoryTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+
+    def test_lookup(self):
+        async def coroutine():
+            team_directory = TeamDirectory(ConnectionPool([self.connection]), 3600)
+            await team_directory.refresh()
+
+            self.assertEqual(team_directory.get_team_id(102), 2)
+            self.assertFalse(team_directory.is_nop(102))
+            self.assertEqual(team_directory.get_team_id(104), 4)
+            self.assertTrue(team_directory.is_nop(104))
+            self.assertIsNone(team_directory.get_team_id(105))
+            self.assertFalse(team_directory.is_nop(105))
+
+            task = asyncio.create_task(team_directory.run())
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE registration_team SET nop_team = true WHERE net_number = 102')
+            team_directory.notify()
+            await asyncio.sleep(0.1)
+            self.assertTrue(team_directory.is_nop(102))
+
+            task.cancel()
+
+        asyncio.run(coroutine())
+
+
+class FlagServicesTest(DatabaseTestCase):
+
+    fixtures = ['tests/submission/fixtures/server.json']
+
+    def test_lookup(self):
+        async def coroutine():
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('UPDATE scoring_flag SET tick = 0 WHERE id = 1')
+
+            db_pool = ConnectionPool([self.connection])
+            game_state = GameState(db_pool, 3600)
+            await game_state.refresh()
+            flag_services = FlagServices(db_pool, 3600, game_state)
+            await flag_services.refresh()
+
+            # Flags from tick 1 have expired with current tick 6 and 5 valid ticks, but are still included
+            self.assertEqual(flag_services.get_service(1), FlagServices.UNKNOWN)
+            self.assertEqual(flag_services.get_service(2), 'service1')
+            self.assertEqual(flag_services.get_service(4), 'service1')
+            self.assertEqual(flag_services.get_service(6), FlagServices.UNKNOWN)
+
+        asyncio.run(coroutine())
+
+    def test_tick_change(self):
+        async def coroutine():
+            db_pool = ConnectionPool([self.connection])
+            game_state = GameState(db_pool, 3600)
+            await game_state.refresh()
+            flag_services = FlagServices(db_pool, 3600, game_state)
+            await flag_services.refresh()
+            tasks = [asyncio.create_task(game_state.run()), asyncio.create_task(flag_services.run())]
+
+            with transaction_cursor(self.connection) as cursor:
+                cursor.execute('INSERT INTO scoring_flag (id, service_id, protecting_team_id, tick)'
+                               '    VALUES (6, 1, 3, 7)')
+                cursor.execute('UPDATE scoring_gamecontrol SET current_tick = 7')
+            self.assertEqual(flag_services.get_service(6), FlagServices.UNKNOWN)
+
+            # Refresh interval is long, so flags only get loaded once the tick change has been seen
+            game_state.notify()
+            await asyncio.sleep(0.1)
+            self.assertEqual(flag_services.get_service(6), 'service1')
+            self.assertEqual(flag_services.get_service(2), 'service1')
+            # Flags from tick 1 have expired for good now
+            self.assertEqual(flag_services.get_service(1), FlagServices.UNKNOWN)
+
+            for task in tasks:
+                task.cancel()
+
+        asyncio.run(coroutine())
+
+
+class NotificationListenerTest(unittest.TestCase):
+
+    def test_reconnect(self):
+        async def coroutine():
+            old_sockets = socket.socketpair()
+            new_sockets = socket.socketpair()
+            old_conn = MagicMock()
+            old_conn.fileno.return_value = old_sockets[0].fileno()
+            old_conn.poll.side_effect = OSError('Connection broken')
+            new_conn = MagicMock()
+            new_conn.fileno.return_value = new_sockets[0].fileno()
+            callback = MagicMock()
+
+            listener = NotificationListener(old_conn, lambda: new_conn)
+            listener.subscribe('ctf_teams', callback)
+            listener.start()
+
+            old_sockets[1].send(b'x')
+            await asyncio.sleep(0.1)
+
+            old_conn.close.assert_called_once()
+            self.assertIs(listener.db_conn, new_conn)
+            new_cursor = new_conn.cursor.return_value.__enter__.return_value
+            new_cursor.execute.assert_called_once_with('LISTEN ctf_teams')
+            # Subscribers get refreshed because notifications may have been missed
+            callback.assert_called_once_with()
+
+            listener.close()
+            new_conn.close.assert_called_once()
+            for sock in old_sockets + new_sockets:
+                sock.close()
+
+        asyncio.run(coroutine())
@@ -0,0 +1,119 @@
+from collections import defaultdict
+import unittest
+from unittest.mock import Mock
+
+import prometheus_client
+
+from ctf_gameserver.submission.metrics import ServiceMetrics, TeamMetrics, make_metrics
+
+
+class TeamMetricsTest(unittest.TestCase):
+
+    def test_full(self):
+        registry = prometheus_client.CollectorRegistry()
+        team_metrics = TeamMetrics(make_metrics(registry))
+
+        team_metrics.bind(102).count_flag('OK')
+        team_metrics.bind(102).count_flag('OK')
+        team_metrics.bind(103).count_flag('DUP')
+
+        def get_value(name, labels):
+            return registry.get_sample_value('ctf_submission_'+name, labels)
+
+        self.assertEqual(get_value('flags_ok_total', {'team_net_no': '102'}), 2)
+        self.assertEqual(get_value('flags_dup_total', {'team_net_no': '103'}), 1)
+        self.assertEqual(get_value('flags_total', {'code': 'OK'}), 2)
+        self.assertEqual(get_value('flags_total', {'code': 'DUP'}), 1)
+
+    def test_children_reused(self):
+        metrics = defaultdict(Mock)
+        team_metrics = TeamMetrics(metrics)
+
+        for _ in range(3):
+            bound_metrics = team_metrics.bind(102)
+            bound_metrics['connections'].inc()
+            bound_metrics.count_flag('INV')
+
+        metrics['connections'].labels.assert_called_once_with(102)
+        metrics['flags_inv'].labels.assert_called_once_with(102)
+        metrics['flags'].labels.assert_called_once_with('INV')
+
+    def test_buckets(self):
+        team_metrics = TeamMetrics(defaultdict(Mock), 'buckets', 100)
+
+        self.assertEqual(team_metrics.label(5), '0-99')
+        self.assertEqual(team_metrics.label(102), '100-199')
+        self.assertEqual(team_metrics.label(199), '100-199')
+        self.assertEqual(team_metrics.label(-1), -1)
+        self.assertIs(team_metrics.bind(102)['flags_ok'], team_metrics.bind(150)['flags_ok'])
+
+    def test_top(self):
+        team_metrics = TeamMetrics(defaultdict(Mock), 'top', 2)
+
+        # Free slots get taken by the first teams
+        self.assertEqual(team_metrics.label(1), 1)
+        self.assertEqual(team_metrics.label(2), 2)
+        self.assertEqual(team_metrics.label(3), 'other')
+
+        bound_metrics = team_metrics.bind(1)
+        for _ in range(3):
+            bound_metrics.count_flag('OK')
+        bound_metrics = team_metrics.bind(3)
+        for _ in range(2):
+            bound_metrics.count_flag('OK')
+        team_metrics.bind(2).count_flag('OK')
+
+        # Ranking gets updated on the next refresh
+        self.assertEqual(team_metrics.label(3), 'other')
+        team_metrics.top_refresh_interval = 0
+        self.assertEqual(team_metrics.label(1), 1)
+        self.assertEqual(team_metrics.label(3), 3)
+        self.assertEqual(team_metrics.label(2), 'other')
+
+    def test_top_drop_out(self):
+        registry = prometheus_client.CollectorRegistry()
+        team_metrics = TeamMetrics(make_metrics(registry), 'top', 1)
+
+        def get_value(name, net_no):
+            return registry.get_sample_value('ctf_submission_'+name, {'team_net_no': str(net_no)})
+
+        bound_metrics = team_metrics.bind(1)
+        bound_metrics['open_connections'].inc()
+        bound_metrics.count_flag('OK')
+        for _ in range(2):
+            team_metrics.bind(2).count_flag('OK')
+        self.assertEqual(get_value('flags_ok_total', 1), 1)
+        self.assertEqual(get_value('flags_ok_total', 'other'), 2)
+
+        team_metrics.top_refresh_interval = 0
+        self.assertEqual(team_metrics.label(2), 2)
+
+        # Series of team 1 are gone and its open connection continues as "other"
+        self.assertIsNone(get_value('flags_ok_total', 1))
+        self.assertIsNone(get_value('open_connections', 1))
+        self.assertEqual(get_value('open_connections', 'other'), 1)
+
+        bound_metrics.count_flag('OK')
+        bound_metrics['open_connections'].dec()
+        self.assertEqual(get_value('flags_ok_total', 'other'), 3)
+        self.assertEqual(get_value('open_connections', 'other'), 0)
+        self.assertEqual(registry.get_sample_value('ctf_submission_flags_total', {'code': 'OK'}), 4)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            TeamMetrics(defaultdict(Mock), 'foo')
+
+
+class ServiceMetricsTest(unittest.TestCase):
+
+    def test_children_reused(self):
+        metrics = defaultdict(Mock)
+        service_metrics = ServiceMetrics(metrics)
+
+        for _ in range(3):
+            service_metrics.count_flag('service1', 'OK')
+        service_metrics.count_flag('service1', 'DUP')
+
+        self.assertEqual(metrics['flags_by_service'].labels.call_count, 2)
+        metrics['flags_by_service'].labels.assert_any_call('service1', 'OK')
+        self.assertEqual(metrics['flags_by_service'].labels.return_value.inc.call_count, 4)